@@ -1,38 +1,101 @@
 import os
 import logging
-from flask import Flask
+import click
+from flask import Flask, request
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
-from .api.inventory.cart import cart_bp as cart
-from app.api.inventory.category import category_bp as category 
-from app.api.inventory.stock import stock_bp as stock_bp
-from app.api.inventory.products import products_bp 
-from app.api.inventory.customer import customer_bp
-from app.api.inventory.sales import sales_bp
-from app.api.inventory.return_products import return_products_bp
 from app.utils.db_utils import db
+from app.utils import metrics
+from app.utils.admission import RateLimiter, TimedQueuePool, shed_load
+from app.utils.compression import compress_response
+from app.utils.lazy import LazyBlueprints, LazyGroup, load
 from config import Config
 
-def create_app():
+# Blueprints as (module:attribute, url_prefix), imported when registered
+BLUEPRINTS = (
+    ("app.api.inventory.cart:cart_bp", '/api/'),
+    ("app.api.inventory.category:category_bp", '/api/category'),
+    ("app.api.inventory.stock:stock_bp", '/api/stock/'),
+    ("app.api.inventory.products:products_bp", '/api/'),
+    ("app.api.inventory.return_products:return_products_bp", '/api/return_products/'),
+    ("app.api.inventory.customer:customer_bp", '/api/'),
+    ("app.api.inventory.sales:sales_bp", '/api/'),
+    ("app.api.inventory.promotions:promotions_bp", '/api/'),
+    ("app.api.admin.trash:trash_bp", '/api/admin/'),
+    ("app.api.auth.tokens:auth_bp", '/api/'),
+)
+
+# Blueprints behind bearer tokens when AUTH_REQUIRED is set
+PROTECTED_BLUEPRINTS = frozenset((
+    "cart", "category", "stock", "products", "return_products",
+    "customer", "sales", "promotions", "trash",
+))
+
+# CLI groups as (name, module:attribute, help), imported when invoked
+CLI_GROUPS = (
+    ("lifecycle", "app.core.lifecycle:lifecycle_cli", "Partition and archive history tables."),
+    ("analytics", "app.core.analytics:analytics_cli", "Columnar sales snapshots."),
+    ("reservations", "app.core.reservations:reservations_cli", "Cart stock reservations."),
+    ("auth", "app.core.auth:auth_cli", "Roles, permissions and token revocation."),
+    ("customer-stats", "app.core.customer_stats:customer_stats_cli", "Customer purchase history summaries."),
+    ("categories", "app.core.categories:categories_cli", "Category tree and subtree counts."),
+    ("ledger", "app.core.ledger:ledger_cli", "Stock movement ledger rollups."),
+)
+
+
+def register_blueprints(app):
+    for path, url_prefix in BLUEPRINTS:
+        app.register_blueprint(load(path), url_prefix=url_prefix)
+
+
+def create_app(lazy=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if lazy is None:
+        lazy = app.config['LAZY_APP']
 
     # Initialize logging
     logging.basicConfig(level=logging.DEBUG if app.config['DEBUG'] else logging.INFO)
 
-    # Initialize extensions
+    # Initialize extensions; the pool reports checkout waits for load shedding
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': TimedQueuePool, **app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    }
     db.init_app(app)
     jwt = JWTManager(app)
-    Migrate(app, db)
-
-    # Register blueprints
-    app.register_blueprint(cart, url_prefix='/api/')
-    app.register_blueprint(category, url_prefix='/api/category')
-    app.register_blueprint(stock_bp, url_prefix='/api/stock/')
-    app.register_blueprint(products_bp, url_prefix='/api/')
-    app.register_blueprint(return_products_bp, url_prefix='/api/return_products/')
-    app.register_blueprint(customer_bp, url_prefix='/api/')
-    app.register_blueprint(sales_bp, url_prefix='/api/')
+    # Flask-Migrate pulls in alembic; the lazy app only sets it up under the
+    # flask CLI, where it provides the `db` command
+    if not lazy or click.get_current_context(silent=True):
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Register blueprints, or defer them (and their schemas and models) to the first request
+    if lazy:
+        app.wsgi_app = LazyBlueprints(app, register_blueprints)
+    else:
+        register_blueprints(app)
+
+    # Admission control, see app.utils.admission
+    if app.config['LOAD_SHED_WAIT_MS']:
+        app.before_request(shed_load)
+
+    # Token checks, see app.core.auth
+    if app.config['AUTH_REQUIRED']:
+        @app.before_request
+        def check_auth():
+            if request.blueprint in PROTECTED_BLUEPRINTS:
+                from app.core.auth import authorize_request
+                return authorize_request()
+
+    # Rate limits run after the token checks so they can key on the JWT identity
+    if app.config['RATELIMIT_ENABLED']:
+        app.before_request(RateLimiter(app).check)
+
+    if app.config['COMPRESS_ENABLED']:
+        app.after_request(compress_response)
+
+    # CLI commands
+    for name, path, help in CLI_GROUPS:
+        app.cli.add_command(LazyGroup(name, path, help=help))
     
     # Initialize database
 
@@ -45,4 +108,9 @@ def create_app():
         except Exception as e:
             return f'Database Error: {str(e)}', 500
 
-    return app
\ No newline at end of file
+    # Internal counters (request coalescing etc.)
+    @app.route('/metrics')
+    def metrics_view():
+        return metrics.snapshot(), 200
+
+    return app
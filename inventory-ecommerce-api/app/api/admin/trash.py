@@ -0,0 +1,80 @@
+from flask import Blueprint
+from flask_restful import Api, Resource
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from decimal import Decimal
+
+from app.core.models import (
+    Cart, CartItem, Category, Customer, Product, Promotion, ReturnProduct,
+    Stock, StockMovement, Transaction, TransactionItem, Warehouse,
+)
+from app.utils.db_utils import db
+from app.utils.pagination import page_args
+from app.utils.soft_delete import INCLUDE_TRASHED, with_trashed
+from app.utils.unit_of_work import unit_of_work
+
+trash_bp = Blueprint("trash", __name__)
+api = Api(trash_bp)
+
+# Soft deleted models by table name
+TRASH_MODELS = {
+    model.__tablename__: model
+    for model in (Cart, CartItem, Category, Customer, Product, Promotion,
+                  ReturnProduct, Stock, StockMovement, Transaction, TransactionItem,
+                  Warehouse)
+}
+
+
+def dump_row(row):
+    data = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.name)
+        if hasattr(value, "isoformat"):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            # Money is dumped as a JSON number, as by the Money schema field
+            value = float(value)
+        data[column.name] = value
+    return data
+
+
+class TrashListAPI(Resource):
+    def get(self, table):
+        """List trashed rows of one table"""
+        model = TRASH_MODELS.get(table)
+        if model is None:
+            return {"error": f"Unknown table {table}"}, 404
+        try:
+            page, count = page_args()
+
+            query = with_trashed(model.query).filter(model.is_trash == True)
+            paginated = query.order_by(model.id.desc()).paginate(page=page, per_page=count, error_out=False)
+
+            return {
+                "count": count,
+                "total": paginated.total,
+                "pages": paginated.pages,
+                "page": paginated.page,
+                "results": [dump_row(row) for row in paginated.items],
+            }, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching trashed {table}: {e}")
+            return {"error": "Internal server error"}, 500
+
+
+class TrashRestoreAPI(Resource):
+    @unit_of_work(conflict="Restoring would duplicate a live row")
+    def post(self, table, id):
+        """Restore a trashed row"""
+        model = TRASH_MODELS.get(table)
+        if model is None:
+            return {"error": f"Unknown table {table}"}, 404
+        row = db.session.get(model, id, execution_options={INCLUDE_TRASHED: True})
+        if not row or not row.is_trash:
+            return {"message": "Trashed row not found"}, 404
+        row.is_trash = False
+        return {"message": "Restored successfully"}, 200
+
+
+api.add_resource(TrashListAPI, "/trash/<string:table>/")
+api.add_resource(TrashRestoreAPI, "/trash/<string:table>/<int:id>/restore/")
@@ -0,0 +1,52 @@
+from flask import Blueprint
+from flask_restful import Api, Resource
+from sqlalchemy.exc import SQLAlchemyError
+from concurrent.futures import TimeoutError
+import logging
+
+from app.core.auth import AuthError, authenticate, issue_token, revoke
+from app.core.models import User
+from app.core.passwords import PasswordPoolBusy, verify_password
+from app.schemas.auth_schema import LoginSchema
+from app.utils.db_utils import db
+from app.utils.unit_of_work import unit_of_work
+from app.utils.validation import json_body
+
+auth_bp = Blueprint("auth", __name__)
+api = Api(auth_bp)
+
+
+class LoginAPI(Resource):
+    # Commits the hash verify_password may have upgraded
+    @unit_of_work
+    @json_body(LoginSchema)
+    def post(self, body):
+        """Exchange email and password for an access token"""
+        try:
+            user = User.query.filter_by(email=body["email"]).first()
+            if not user or not user.is_active or not verify_password(user, body["password"]):
+                return {"error": "Invalid credentials"}, 401
+        except (PasswordPoolBusy, TimeoutError):
+            return {"error": "Too many logins in progress, retry shortly"}, 503, {"Retry-After": "1"}
+        return {"access_token": issue_token(user), "role": user.role}, 200
+
+
+class LogoutAPI(Resource):
+    def post(self):
+        """Revoke the bearer token"""
+        try:
+            verified = authenticate()
+        except AuthError as e:
+            return {"error": e.message}, e.status
+
+        try:
+            revoke(verified)
+            return {"message": "Token revoked"}, 200
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error revoking token: {e}")
+            return {"error": "Internal server error"}, 500
+
+
+api.add_resource(LoginAPI, "/auth/login/")
+api.add_resource(LogoutAPI, "/auth/logout/")
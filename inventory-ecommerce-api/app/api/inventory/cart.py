@@ -1,13 +1,22 @@
-from flask import Blueprint, jsonify, request, abort
+from flask import Blueprint
 from flask_restful import Api, Resource
 from flask_jwt_extended import jwt_required
-from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
-from marshmallow.exceptions import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 import logging
+from collections import defaultdict
 
+from app.core.checkout import transaction_total
+from app.core.customer_stats import record_purchase
 from app.core.models import Cart, CartItem, Product, Transaction, TransactionItem
+from app.core.pricing import price_basket
+from app.core.reservations import ReservationError, hold, own_hold, release
+from app.core.variants import VariantError, refresh, resolve, take
+from app.core.warehouses import AllocationError, allocate, shipments, take_allocations
 from app.schemas.cart_schema import CartSchema, CartItemSchema
+from app.schemas.checkout_schema import FulfillmentSchema
 from app.utils.db_utils import db
+from app.utils.unit_of_work import abort_json, unit_of_work
+from app.utils.validation import json_body
 
 cart_bp = Blueprint("cart", __name__)
 api = Api(cart_bp)
@@ -17,12 +26,6 @@ cart_item_schema = CartItemSchema()
 cart_item_list_schema = CartItemSchema(many=True)
 
 
-def abort_json(status_code, message):
-    response = jsonify(error=message)
-    response.status_code = status_code
-    abort(response)
-
-
 class CartView(Resource):
     
     def get(self, customer_id):
@@ -36,126 +39,149 @@ class CartView(Resource):
             abort_json(500, "Internal server error")
 
     
-    def post(self, customer_id):
+    @unit_of_work
+    @json_body(CartItemSchema)
+    def post(self, customer_id, body):
+        product_id = body["product_id"]
+        quantity = body.get("quantity", 1)
+
+        product = db.session.get(Product, product_id)
+        if not product:
+            return {"error": "Product not found"}, 404
         try:
-            data = request.get_json()
-            try:
-                validated = cart_item_schema.load(data)
-            except ValidationError as ve:
-                return {"error": ve.messages}, 400
-
-            product_id = validated["product_id"]
-            quantity = validated.get("quantity", 1)
-
-            cart = Cart.query.filter_by(customer_id=customer_id).first()
-            if not cart:
-                cart = Cart(customer_id=customer_id)
-                db.session.add(cart)
-                db.session.commit()
-
-            cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
-            if cart_item:
-                cart_item.quantity += quantity
-            else:
-                cart_item = CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity)
-                db.session.add(cart_item)
-
-            db.session.commit()
-            return {"message": "Product added to cart"}, 201
-
-        except (SQLAlchemyError, Exception) as e:
-            db.session.rollback()
-            logging.error(f"Error adding product to cart: {e}")
-            abort_json(500, "Internal server error")
-
-   
-    def delete(self, customer_id):
+            variant = resolve(product, body.get("variant_id"))
+        except VariantError as e:
+            return {"error": e.message, "product_id": e.product_id}, e.status
+        variant_id = variant.id if variant else None
+
+        cart = Cart.query.filter_by(customer_id=customer_id).first()
+        if not cart:
+            cart = Cart(customer_id=customer_id)
+            db.session.add(cart)
+            db.session.flush()
+
+        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id, variant_id=variant_id).first()
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            cart_item = CartItem(cart_id=cart.id, product_id=product_id, variant_id=variant_id, quantity=quantity)
+            db.session.add(cart_item)
+            db.session.flush()
+
+        # Hold the stock for this cart until the reservation expires
         try:
-            data = request.get_json()
-            product_id = data.get("product_id")
+            reservation = hold(cart_item)
+        except ReservationError as e:
+            return {"error": e.message, "product_id": e.product_id}, 409
 
-            cart = Cart.query.filter_by(customer_id=customer_id).first()
-            if not customer_id:
-                return {"message": "Cart not found"}, 404
+        return {
+            "message": "Product added to cart",
+            "reserved_until": reservation.expires_at.isoformat()
+        }, 201
 
-            cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
-            if cart_item:
-                db.session.delete()
-                db.session.commit()
-                return {"message": "Product removed from cart"}, 200
+    @unit_of_work
+    @json_body(CartItemSchema, partial=True)
+    def delete(self, customer_id, body):
+        product_id = body.get("product_id")
+        variant_id = body.get("variant_id")
 
-            return {"message": "Product not found in cart"}, 404
-        except (SQLAlchemyError, Exception) as e:
-            db.session.rollback()
-            logging.error(f"Error removing product from cart: {e}")
-            abort_json(500, "Internal server error")
+        cart = Cart.query.filter_by(customer_id=customer_id).first()
+        if not cart:
+            return {"message": "Cart not found"}, 404
+
+        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id, variant_id=variant_id).first()
+        if cart_item:
+            release([cart_item.id])
+            db.session.delete(cart_item)
+            return {"message": "Product removed from cart"}, 200
 
+        return {"message": "Product not found in cart"}, 404
 
 
 class CheckoutView(Resource):
-    def post(self, customer_id):
+    @unit_of_work
+    @json_body(FulfillmentSchema, required=False)
+    def post(self, customer_id, body):
+        cart = Cart.query.filter_by(customer_id=customer_id, is_trash=False).first()
+        if not cart or not cart.items:
+            return {"message": "Cart is empty or not found"}, 404
+
+        for item in cart.items:
+            product = Product.query.get(item.product_id)
+            # Our own hold counts towards what we may take
+            if not product or not product.stock or product.stock.available + own_hold(item) < item.quantity:
+                return {"error": f"Insufficient stock for {product.name if product else 'Unknown'}"}, 400
+            if item.variant and item.variant.available + own_hold(item) < item.quantity:
+                return {"error": f"Insufficient stock for {product.name} {item.variant.sku}"}, 400
+
+        # Pick fulfilling warehouses for the whole basket
         try:
-            
-            cart = Cart.query.filter_by(customer_id=customer_id, is_trash=False).first()
-            if not cart or not cart.items:
-                return {"message": "Cart is empty or not found"}, 404
-
-            total_amount = 0
-
-            
-            for item in cart.items:
-                product = Product.query.get(item.product_id)
-                if not product or not product.stock or product.stock.quantity < item.quantity:
-                    return {"error": f"Insufficient stock for {product.name if product else 'Unknown'}"}, 400
-
-          
-            transaction = Transaction(
-                cart_id=cart.id,
-                customer_id=customer_id,
-                total_amount=0,  
-                status='pending'  
+            allocations = allocate(
+                [(item.product_id, item.quantity) for item in cart.items],
+                strategy=body.get("strategy"),
+                split=body.get("split", True),
+                ship_to=body.get("ship_to")
             )
-            db.session.add(transaction)
-            db.session.flush()  
-
-            for item in cart.items:
-                product = Product.query.get(item.product_id)
-                
-                
-                transaction_item = TransactionItem(
-                    transaction_id=transaction.id,
-                    product_id=product.id,
-                    quantity=item.quantity,
-                    price_per_unit=product.price
-                )
-                db.session.add(transaction_item)
-
-                # Update Stock
-                product.stock.quantity -= item.quantity
-
-                # Calculate total
-                total_amount += product.price * item.quantity
-
-            # Step 5: Update Transaction Total
-            transaction.total_amount = total_amount
-
-            
-            cart.is_trash = True  
-
-            db.session.commit()
-
-            return {
-                "message": "Checkout successful",
-                "transaction_id": transaction.id,
-                "total_amount": total_amount
-            }, 201
-
-        except (SQLAlchemyError, Exception) as e:
-            db.session.rollback()
-            logging.error(f"Checkout error: {e}")
-            return {"error": "Internal server error"}, 500
-
-
+        except AllocationError as e:
+            return {"error": e.message}, 400
+
+        transaction = Transaction(
+            cart_id=cart.id,
+            customer_id=customer_id,
+            total_amount=0,
+            status='pending'
+        )
+        db.session.add(transaction)
+        db.session.flush()
+
+        # Price the whole basket against the active promotions at once
+        products = [Product.query.get(item.product_id) for item in cart.items]
+        priced = price_basket([
+            (product.id, product.category_id, item.quantity,
+             item.variant.unit_price if item.variant else product.price)
+            for item, product in zip(cart.items, products)
+        ])
+
+        for item, product, line in zip(cart.items, products, priced):
+            transaction_item = TransactionItem(
+                transaction_id=transaction.id,
+                product_id=product.id,
+                variant_id=item.variant_id,
+                quantity=item.quantity,
+                price_per_unit=line.unit_price,
+                discount=line.discount,
+                promotion_id=line.promotion_id
+            )
+            db.session.add(transaction_item)
+
+        # With the holds released, the sold units are taken from what is available
+        cart.is_trash = True
+        release([item.id for item in cart.items])
+        if not take_allocations(allocations):
+            return {"error": "Insufficient stock"}, 409
+
+        # Step 5: Update Transaction Total
+        db.session.flush()
+        total_amount = transaction_total(transaction.id)
+        transaction.total_amount = total_amount
+        record_purchase(transaction)
+
+        # The sold SKUs give up their units as well
+        sold = defaultdict(int)
+        for item in cart.items:
+            if item.variant_id:
+                sold[item.variant_id] += item.quantity
+        if sold:
+            if not take(sold):
+                return {"error": "Insufficient stock for a variant"}, 409
+            refresh(item.product_id for item in cart.items if item.variant_id)
+
+        return {
+            "message": "Checkout successful",
+            "transaction_id": transaction.id,
+            "total_amount": float(total_amount),
+            "shipments": shipments(allocations)
+        }, 201
 
 
 # Register the resources
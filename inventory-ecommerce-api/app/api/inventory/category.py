@@ -1,11 +1,13 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request
 from flask_restful import Api, Resource
 from flask_jwt_extended import jwt_required
-from marshmallow import ValidationError
-from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
+from app.core.categories import CategoryError, in_subtree, move
 from app.core.models import Category
 from app.schemas.category_schema import CategorySchema
 from app.utils.db_utils import db
+from app.utils.pagination import page_args
+from app.utils.unit_of_work import unit_of_work
+from app.utils.validation import json_body
 import logging
 
 category_bp = Blueprint("category", __name__)
@@ -15,27 +17,48 @@ category_schema = CategorySchema()
 category_list_schema = CategorySchema(many=True)
 
 
-def abort_json(status_code, message):
-    response = jsonify(error=message)
-    response.status_code = status_code
-    abort(response)
+def get_parent(parent_id):
+    """The live parent category for an id, or raise CategoryError"""
+    if parent_id is None:
+        return None
+    parent = db.session.get(Category, parent_id)
+    if parent is None:
+        raise CategoryError("Parent category not found", 404)
+    return parent
 
 
 class CategoryListAPI(Resource):
     
     def get(self):
-        """Get list of categories with optional search and pagination"""
+        """Get list of categories with optional search, tree filters and pagination.
+
+        `parent_id` lists the children of a category (`parent_id=0` the roots),
+        `under` the whole subtree below one in tree order. Subtree counts are
+        read as stored, never recounted.
+        """
+        page, count = page_args()
         try:
-            page = int(request.args.get("page", 1))
-            count = int(request.args.get("count", 10))
             name = request.args.get("name", "")
+            parent_id = request.args.get("parent_id", default=None, type=int)
+            under = request.args.get("under", default=None, type=int)
 
             query = Category.query.filter_by(is_trash=False)
+            order = Category.id.desc()
 
             if name:
                 query = query.filter(Category.name.ilike(f"%{name}%"))
 
-            paginated = db.paginate(query.order_by(Category.id.desc()), page=page, per_page=count, error_out=False)
+            if parent_id is not None:
+                query = query.filter(Category.parent_id == (parent_id or None))
+
+            if under:
+                root = db.session.get(Category, under)
+                if root is None:
+                    return {"error": "Category not found"}, 404
+                query = query.filter(in_subtree(Category.path, root.path), Category.id != root.id)
+                order = Category.path
+
+            paginated = query.order_by(order).paginate(page=page, per_page=count, error_out=False)
 
             return {
                 "count": count,
@@ -50,22 +73,17 @@ class CategoryListAPI(Resource):
             return {"error": "Internal server error"}, 500
 
 
-    def post(self):
+    @unit_of_work(conflict="Category with this name already exists")
+    @json_body(CategorySchema)
+    def post(self, body):
         try:
-            data = request.get_json()
-            category_data = category_schema.load(data)
-            category = Category(**category_data)
-            db.session.add(category)
-            db.session.commit()
-            return {"message": "Category created successfully"}, 201
-        except ValidationError as ve:
-            return {"error": ve.messages}, 400
-        except IntegrityError:
-            db.session.rollback()
-            return {"error": "Category with this name already exists"}, 409
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            return {"error": str(e)}, 500
+            get_parent(body.get("parent_id"))
+        except CategoryError as e:
+            return {"error": e.message}, e.status
+        category = Category(**body)
+        db.session.add(category)
+        db.session.flush()
+        return {"message": "Category created successfully", "id": category.id}, 201
 
 
 class CategoryDetailAPI(Resource):
@@ -76,39 +94,29 @@ class CategoryDetailAPI(Resource):
             return {"message": "Category not found"}, 404
         return category_schema.dump(category), 200
 
-   
-    def put(self, id):
+    @unit_of_work(conflict="Category with this name already exists")
+    @json_body(CategorySchema, partial=True)
+    def put(self, id, body):
         category = Category.query.get(id)
         if not category or category.is_trash:
             return {"message": "Category not found"}, 404
         try:
-            data = request.get_json()
-            updated_data = category_schema.load(data, partial=True)
-            for key, value in updated_data.items():
-                setattr(category, key, value)
-            db.session.commit()
-            return {"message": "Category updated successfully"}, 200
-        except ValidationError as ve:
-            return {"error": ve.messages}, 400
-        except IntegrityError:
-            db.session.rollback()
-            return {"error": "Category with this name already exists"}, 409
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            return {"error": str(e)}, 500
-
-    
+            # Re-parenting moves the subtree's paths and counts with it
+            if "parent_id" in body:
+                move(category, get_parent(body.pop("parent_id")))
+        except CategoryError as e:
+            return {"error": e.message}, e.status
+        for key, value in body.items():
+            setattr(category, key, value)
+        return {"message": "Category updated successfully"}, 200
+
+    @unit_of_work
     def delete(self, id):
         category = Category.query.get(id)
         if not category or category.is_trash:
             return {"message": "Category not found"}, 404
-        try:
-            category.is_trash = True  # Soft delete
-            db.session.commit()
-            return {"message": "Category deleted successfully"}, 200
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            return {"error": str(e)}, 500
+        category.is_trash = True  # Soft delete
+        return {"message": "Category deleted successfully"}, 200
 
 
 # Register routes
@@ -1,40 +1,86 @@
-from flask import Blueprint, abort, jsonify
+from flask import Blueprint
 from flask_jwt_extended import jwt_required
 from flask_restful import Api, Resource, request
-from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
-from app.core.models import Customer
+from sqlalchemy.orm import contains_eager
+from app.core import customer_stats
+from app.core.models import Customer, CustomerStats
 from app.schemas.customer_schema import CustomerSchema
 from app.utils.db_utils import db
+from app.utils.money import to_money
+from app.utils.pagination import page_args
+from app.utils.unit_of_work import unit_of_work
+from app.utils.validation import json_body
+from datetime import datetime
 import logging
-from math import ceil
 
 customer_bp = Blueprint("customer", __name__)
 api = Api(customer_bp)
 
-def abort_json(status_code, message):
-    response = jsonify(error=message)
-    response.status_code = status_code
-    abort(response)
-
 customer_schema = CustomerSchema()
 customer_list_schema = CustomerSchema(many=True)
 
+# Listing sorts, each served by an index on (column, customer id)
+SORTS = {
+    "id": Customer.id,
+    "order_count": CustomerStats.order_count,
+    "total_spend": CustomerStats.total_spend,
+    "last_purchase_at": CustomerStats.last_purchase_at,
+}
+
+# Range filters on the stats: query argument -> (column, comparison, parser)
+STAT_FILTERS = {
+    "min_orders": (CustomerStats.order_count, "__ge__", int),
+    "max_orders": (CustomerStats.order_count, "__le__", int),
+    "min_spend": (CustomerStats.total_spend, "__ge__", to_money),
+    "max_spend": (CustomerStats.total_spend, "__le__", to_money),
+    "purchased_after": (CustomerStats.last_purchase_at, "__ge__", datetime.fromisoformat),
+    "purchased_before": (CustomerStats.last_purchase_at, "__le__", datetime.fromisoformat),
+}
+
+def dump_with_stats(customers):
+    """Customers with their stats and top categories, fetched for the whole page at once"""
+    top = customer_stats.top_categories([customer.id for customer in customers])
+    results = customer_list_schema.dump(customers)
+    for result in results:
+        result["top_categories"] = top[result["id"]]
+    return results
+
 class CustomerListAPI(Resource):
     def get(self):
-        """Get list of customers with pagination"""
+        """Get list of customers with pagination, sortable and filterable by purchase stats"""
         try:
-            page = int(request.args.get("page", 1))
-            count = int(request.args.get("count", 10))
+            page, count = page_args()
             name = request.args.get("name", "")
+            sort = request.args.get("sort", "id")
+            order = request.args.get("order", "desc")
+            if sort not in SORTS or order not in ("asc", "desc"):
+                return {"error": f"sort must be one of {', '.join(SORTS)} and order asc or desc"}, 400
 
-            query = Customer.query
+            filters = []
+            for arg, (column, comparison, parse) in STAT_FILTERS.items():
+                value = request.args.get(arg)
+                if value is None:
+                    continue
+                try:
+                    filters.append(getattr(column, comparison)(parse(value)))
+                except (ValueError, ArithmeticError):
+                    return {"error": f"Invalid value for {arg}"}, 400
+
+            query = Customer.query.options(contains_eager(Customer.stats))
+            # Every customer has a stats row (see app.core.customer_stats), so an
+            # inner join lets stats sorts walk their index
+            if sort != "id" or filters:
+                query = query.join(Customer.stats).filter(*filters)
+            else:
+                query = query.outerjoin(Customer.stats)
 
             if name:
                 query = query.filter(Customer.name.ilike(f"%{name}%"))
 
-            paginated = db.paginate(
-                query.order_by(Customer.id.desc()),
+            columns = (Customer.id,) if sort == "id" else (SORTS[sort], CustomerStats.customer_id)
+            ordering = [c.desc() if order == "desc" else c.asc() for c in columns]
+            paginated = query.order_by(*ordering).paginate(
                 page=page,
                 per_page=count,
                 error_out=False
@@ -45,65 +91,46 @@ class CustomerListAPI(Resource):
                 "total": paginated.total,
                 "pages": paginated.pages,
                 "page": paginated.page,
-                "results": customer_list_schema.dump(paginated.items),
+                "results": dump_with_stats(paginated.items),
             }, 200
 
         except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
             logging.error(f"Error fetching customers: {e}")
             return {"error": "Internal server error while fetching customers"}, 500
 
-    def post(self):
-        try:
-            data = request.get_json()
-            customer_data = customer_schema.load(data)
-            customer = Customer(**customer_data)
-            db.session.add(customer)
-            db.session.commit()
-            # return customer_schema.dump(customer), 201
-            return {"message": "Customer created successfully"}, 201
-        except ValidationError as ve:
-            return {"error": ve.messages}, 400
-        except IntegrityError as ie:
-            db.session.rollback()
-            return {"error": "Email already exists"}, 409
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            return {"error": str(e)}, 500
-            
+    @unit_of_work(conflict="Email already exists")
+    @json_body(CustomerSchema)
+    def post(self, body):
+        customer = Customer(**body)
+        customer.stats = CustomerStats()
+        db.session.add(customer)
+        # return customer_schema.dump(customer), 201
+        return {"message": "Customer created successfully"}, 201
+
 
 class CustomerDetailAPI(Resource):
     def get(self, id):
         customer = Customer.query.get(id)
         if not customer:
             return {"message": "Customer not found"}, 404
-        return customer_schema.dump(customer), 200
+        return dump_with_stats([customer])[0], 200
 
-    def put(self, id):
+    @unit_of_work(conflict="Email already exists")
+    @json_body(CustomerSchema, partial=True)
+    def put(self, id, body):
         customer = Customer.query.get(id)
         if not customer:
             return {"message": "Customer not found"}, 404
-        try:
-            data = request.get_json()
-            updated_data = customer_schema.load(data, partial=True)
-            for key, value in updated_data.items():
-                setattr(customer, key, value)
-            db.session.commit()
-            return {"message": "Customer updated successfully"}, 200
-        except ValidationError as ve:
-            return {"error": ve.messages}, 400
-        except IntegrityError as ie:
-            db.session.rollback()
-            return {"error": "Email already exists"}, 409
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            return {"error": str(e)}, 500
+        for key, value in body.items():
+            setattr(customer, key, value)
+        return {"message": "Customer updated successfully"}, 200
 
+    @unit_of_work
     def delete(self, id):
         customer = Customer.query.get(id)
         if not customer:
             return {"message": "Customer not found"}, 404
         db.session.delete(customer)
-        db.session.commit()
         return {"message": "Customer deleted successfully"}, 200
     
     
@@ -1,105 +1,125 @@
-from flask import Blueprint, abort, jsonify
+from flask import Blueprint, current_app
 from flask_jwt_extended import jwt_required
 from flask_restful import Api, request, Resource
 from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
-from marshmallow.exceptions import ValidationError
 
-from app.core.models import Product, Stock
-from app.schemas.product_schema import ProductSchema
+from app.core.catalog import FIELDS, catalog, page_count
+from app.core.categories import in_subtree
+from app.core.models import Category, Product, ProductVariant, Stock
+from app.core.prices import prices_at, set_prices, timelines
+from app.core.variants import refresh, set_quantity
+from app.core.warehouses import adjust_location
+from app.schemas.price_schema import PriceChangeSchema, PriceHistorySchema, PriceQuerySchema
+from app.schemas.product_schema import ProductQuerySchema, ProductSchema
+from app.schemas.variant_schema import VariantSchema
+from app.utils.batch import parse_ids
 from app.utils.db_utils import db
-from math import ceil
+from app.utils.pagination import page_args
+from app.utils.sparse import requested_fields
+from app.utils.unit_of_work import abort_json, unit_of_work
+from app.utils.validation import json_body, query_params
+from datetime import datetime
+import json
 import logging
 
 products_bp = Blueprint("products", __name__)
 api = Api(products_bp)
 
-product_schema = ProductSchema()
-product_list_schema = ProductSchema(many=True)
+variant_schema = VariantSchema()
+variant_list_schema = VariantSchema(many=True)
+price_history_schema = PriceHistorySchema()
+
+
+def json_response(data):
+    """A response for JSON serialized already"""
+    return current_app.response_class(data, mimetype="application/json")
 
-def abort_json(status_code, message):
-    response = jsonify(error=message)
-    response.status_code = status_code
-    abort(response)
 
 class ProductListResource(Resource):
     # decorators = (jwt_required(),)
 
-    def get(self):
+    @query_params(ProductQuerySchema)
+    def get(self, params):
+        if request.args.get("ids"):
+            return self.get_many(request.args["ids"])
+        page, count = page_args()
         try:
-            page = int(request.args.get("page", 1))
-            count = int(request.args.get("count", 10))
-            name = request.args.get("name", "")
-            category_id = request.args.get("category_id", "")
-
-            query = Product.query.filter_by(is_trash=False)
-            if name:
-                query = query.filter(Product.name.ilike(f"%{name}%"))
-            if category_id:
-                query = query.filter_by(category=category_id)
-
-            total = query.count()
-            pages = ceil(total / count)
-
-            paginated = db.paginate(
-                query.order_by(Product.id.desc()),
-                page=page,
-                per_page=count,
-                error_out=False
-            )
-
-            # Include stock info in results
-            results = []
-            for product in paginated.items:
-                prod_data = product_schema.dump(product)
-                prod_data['quantity'] = product.stock.quantity if product.stock else 0
-                results.append(prod_data)
-
-            return {
-                "count": count,
-                "total": paginated.total,
-                "pages": paginated.pages,
-                "page": paginated.page,
-                "results": results,
-            }, 200
+            fields = requested_fields(FIELDS)
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
+        try:
+            category_ids = {params.category_id} if params.category_id else None
+            if params.under:
+                # Everything below a category: a range on the category path index
+                root = db.session.get(Category, params.under)
+                if root is None:
+                    return {"error": "Category not found"}, 404
+                subtree = set(db.session.execute(
+                    db.select(Category.id).where(in_subtree(Category.path, root.path))
+                ).scalars())
+                category_ids = subtree if category_ids is None else category_ids & subtree
+            snapshot = catalog.current()
         except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
             logging.error(f"Error fetching products: {e}")
             return {"error": "Internal server error while fetching products"}, 500
 
-    def post(self):
-        """Create a new product with stock"""
+        entries, total = snapshot.page(page, count, params.name, category_ids)
+        if fields == FIELDS:
+            # Entries are serialized already, only the envelope is new
+            return json_response(b'{"count":%d,"total":%d,"pages":%d,"page":%d,"results":[%b]}' % (
+                count, total, page_count(total, count), page, b",".join(entry.json for entry in entries)
+            ))
+        return {
+            "count": count,
+            "total": total,
+            "pages": page_count(total, count),
+            "page": page,
+            "results": [entry.pick(fields) for entry in entries],
+        }, 200
+
+    def get_many(self, raw_ids):
+        """Fetch many products with their stock quantity from the catalog snapshot"""
         try:
-            data = request.get_json()
-            if not data:
-                return {"error": "Invalid input data"}, 400
-
-            product_data = product_schema.load(data)
-            if product_data is None:
-                return {"error": "Invalid product data"}, 400
-
-            quantity = product_data.pop('quantity', 0) if isinstance(product_data, dict) else 0
-
-            # Create new product instance
-            product = Product(**product_data)
-            db.session.add(product)
-            db.session.flush()
-
-            # Handle stock as part of product
-            stock = Stock(
-                product_id=product.id,
-                quantity=quantity,
-                category_id=product.category_id
-            )
-            db.session.add(stock)
-            db.session.commit()
-
-            return {
-                "message": "Product created successfully",}, 201
+            ids = parse_ids(raw_ids, current_app.config["MAX_BATCH_IDS"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
+        try:
+            snapshot = catalog.current()
         except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error creating product: {e}")
-            abort_json(500, str(e))
+            logging.error(f"Error fetching products: {e}")
+            return {"error": "Internal server error while fetching products"}, 500
+
+        found = {id_: snapshot.get(id_) for id_ in ids}
+        results = b",".join(b'"%d":%b' % (id_, entry.json if entry else b"null") for id_, entry in found.items())
+        not_found = [id_ for id_, entry in found.items() if entry is None]
+        return json_response(b'{"results":{%b},"not_found":%b}' % (results, json.dumps(not_found).encode()))
+
+    @unit_of_work
+    @json_body(ProductSchema)
+    def post(self, body):
+        """Create a new product with stock"""
+        product_data = body
+        quantity = product_data.pop('quantity', 0)
+
+        # Create new product instance
+        product = Product(**product_data)
+        db.session.add(product)
+        db.session.flush()
+
+        # Handle stock as part of product
+        stock = Stock(
+            product_id=product.id,
+            quantity=0,
+            category_id=product.category_id
+        )
+        db.session.add(stock)
+        adjust_location(stock, quantity)
+        refresh([product.id])
+
+        return {
+            "message": "Product created successfully",}, 201
 
 class ProductResource(Resource):
     # decorators = (jwt_required(),)
@@ -107,69 +127,179 @@ class ProductResource(Resource):
     def get(self, product_id):
         """Get single product by ID, including stock"""
         try:
-            product = Product.query.filter_by(id=product_id, is_trash=False).first()
-            if not product:
-                return {"message": "Product not found"}, 404
-
-            prod_data = product_schema.dump(product)
-            prod_data['quantity'] = product.stock.quantity if product.stock else 0
-            return prod_data, 200
+            entry = catalog.current().get(product_id)
         except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
             logging.error(f"Error fetching product: {e}")
             abort_json(500, str(e))
+        if entry is None:
+            return {"message": "Product not found"}, 404
+        return json_response(entry.json)
 
-    def put(self, product_id):
+    @unit_of_work
+    @json_body(ProductSchema, partial=True)
+    def put(self, product_id, body):
         """Update a product and its stock"""
+        product = Product.query.filter_by(id=product_id, is_trash=False).first()
+        if not product:
+            return {"message": "Invalid Product ID"}, 404
+
+        product_data = body
+
+        # Update product attributes
+        quantity = product_data.pop('quantity', None)
+        for key, value in product_data.items():
+            setattr(product, key, value)
+        # Stock counts towards the product's category
+        if product.stock and product.category_id is not None:
+            product.stock.category_id = product.category_id
+
+        # Update stock if quantity is provided
+        if quantity is not None:
+            stock = product.stock
+            if not stock:
+                stock = Stock(
+                    product_id=product.id,
+                    quantity=0,
+                    category_id=product.category_id
+                )
+                db.session.add(stock)
+            adjust_location(stock, quantity - stock.quantity)
+
+        # The price range follows a product price change
+        if 'price' in product_data:
+            refresh([product.id])
+        return {"message": "Product Updated Successfully"}, 200
+
+    @unit_of_work
+    def delete(self, product_id):
+        product = Product.query.filter_by(id=product_id).first()
+        if not product:
+            return {"message": "Invalid Product ID"}, 404
+
+        product.is_trash = True
+        return {"message": "Product Deleted Successfully"}, 200
+
+class ProductVariantListResource(Resource):
+    def get(self, product_id):
+        """List the variants of a product"""
+        product = Product.query.filter_by(id=product_id, is_trash=False).first()
+        if not product:
+            return {"message": "Product not found"}, 404
+        variants = ProductVariant.query.filter_by(product_id=product_id).order_by(ProductVariant.id).all()
+        return {"results": variant_list_schema.dump(variants)}, 200
+
+    @unit_of_work(conflict="A variant with this SKU already exists")
+    @json_body(VariantSchema)
+    def post(self, product_id, body):
+        """Add a variant (SKU) to a product, with its opening stock"""
+        product = Product.query.filter_by(id=product_id, is_trash=False).first()
+        if not product:
+            return {"message": "Product not found"}, 404
+
+        variant_data = body
+        quantity = variant_data.pop('quantity', 0)
+        warehouse_id = variant_data.pop('warehouse_id', None)
+        variant = ProductVariant(product=product, quantity=0, **variant_data)
+        db.session.add(variant)
+        db.session.flush()
+        set_quantity(variant, quantity, warehouse_id)
+        refresh([product.id])
+        return variant_schema.dump(variant), 201
+
+class ProductVariantResource(Resource):
+    def get(self, variant_id):
+        variant = db.session.get(ProductVariant, variant_id)
+        if not variant:
+            return {"message": "Variant not found"}, 404
+        return variant_schema.dump(variant), 200
+
+    @unit_of_work(conflict="A variant with this SKU already exists")
+    @json_body(VariantSchema, partial=True)
+    def put(self, variant_id, body):
+        """Update a variant; `quantity` sets its counted stock"""
+        variant = db.session.get(ProductVariant, variant_id)
+        if not variant:
+            return {"message": "Variant not found"}, 404
+
+        variant_data = body
+        quantity = variant_data.pop('quantity', None)
+        warehouse_id = variant_data.pop('warehouse_id', None)
+        for key, value in variant_data.items():
+            setattr(variant, key, value)
+        if quantity is not None:
+            set_quantity(variant, quantity, warehouse_id)
+        refresh([variant.product_id])
+        return variant_schema.dump(variant), 200
+
+    @unit_of_work
+    def delete(self, variant_id):
+        """Trash a variant, writing off the stock still counted on it"""
+        variant = db.session.get(ProductVariant, variant_id)
+        if not variant:
+            return {"message": "Variant not found"}, 404
+        if variant.reserved:
+            return {"error": "Variant is held in carts"}, 409
+
+        set_quantity(variant, 0)
+        variant.is_trash = True
+        refresh([variant.product_id])
+        return {"message": "Variant Deleted Successfully"}, 200
+
+class ProductPriceListResource(Resource):
+    @query_params(PriceQuerySchema)
+    def get(self, params):
+        """Prices of many products at a time `at`, now by default"""
         try:
-            data = request.get_json()
-            product = Product.query.filter_by(id=product_id, is_trash=False).first()
-            if not product:
-                return {"message": "Invalid Product ID"}, 404
-
-            try:
-                product_data = product_schema.load(data, partial=True)
-            except ValidationError as ve:
-                return {"error": ve.messages}, 400
-
-            # Update product attributes
-            for key, value in product_data.items():
-                setattr(product, key, value)
-
-            # Update stock if quantity is provided
-            if 'quantity' in data:
-                if product.stock:
-                    product.stock.quantity = data['quantity']
-                else:
-                    stock = Stock(
-                        product_id=product.id,
-                        quantity=data['quantity'],
-                        category_id=product.category_id
-                    )
-                    db.session.add(stock)
-
-            db.session.commit()
-            return {"message": "Product Updated Successfully"}, 200
+            ids = parse_ids(request.args.get("ids", ""), current_app.config["MAX_BATCH_IDS"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        at = params.at or datetime.utcnow()
 
-        except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error updating product: {e}")
+        try:
+            found = prices_at(ids, at)
+            return {
+                "at": at.isoformat(),
+                "results": {str(id_): price_history_schema.dump(found[id_]) if id_ in found else None for id_ in ids},
+            }, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching prices: {e}")
             abort_json(500, str(e))
 
-    def delete(self, product_id):
+    @unit_of_work
+    @json_body(PriceChangeSchema, many=True, max_items="MAX_PRICE_BATCH")
+    def put(self, body):
+        """Reprice many products at once from a list of {product_id, price}"""
+        changes = {line["product_id"]: line["price"] for line in body}
+
+        repriced, missing = set_prices(changes)
+        if missing:
+            return {"error": "Products not found", "not_found": missing}, 404
+        # The price range of products with variants follows
+        refresh(repriced)
+        return {"message": f"{len(repriced)} prices updated", "updated": repriced}, 200
+
+class ProductPriceHistoryResource(Resource):
+    @query_params(PriceQuerySchema)
+    def get(self, params):
+        """Price timelines of many products, optionally within start..end"""
         try:
-            product = Product.query.filter_by(id=product_id).first()
-            if not product:
-                return {"message": "Invalid Product ID"}, 404
+            ids = parse_ids(request.args.get("ids", ""), current_app.config["MAX_BATCH_IDS"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-            product.is_trash = True
-            db.session.commit()
-            return {"message": "Product Deleted Successfully"}, 200
-
-        except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error deleting product: {e}")
+        try:
+            history = timelines(ids, params.start, params.end)
+            return {
+                "results": {str(id_): [price_history_schema.dump(row) for row in rows] for id_, rows in history.items()},
+            }, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching price history: {e}")
             abort_json(500, str(e))
 
 # Register resources with routes
 api.add_resource(ProductListResource, "/products/")
 api.add_resource(ProductResource, "/products/<int:product_id>/")
+api.add_resource(ProductPriceListResource, "/products/prices/")
+api.add_resource(ProductPriceHistoryResource, "/products/prices/history/")
+api.add_resource(ProductVariantListResource, "/products/<int:product_id>/variants/")
+api.add_resource(ProductVariantResource, "/variants/<int:variant_id>/")
@@ -0,0 +1,66 @@
+from flask import Blueprint, request
+from flask_restful import Api, Resource
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+
+from app.core.models import Promotion
+from app.core.pricing import missing_fields
+from app.schemas.promotion_schema import PromotionSchema
+from app.utils.db_utils import db
+from app.utils.unit_of_work import unit_of_work
+from app.utils.validation import json_body
+
+promotions_bp = Blueprint("promotions", __name__)
+api = Api(promotions_bp)
+
+promotion_schema = PromotionSchema()
+promotion_list_schema = PromotionSchema(many=True)
+
+
+class PromotionListAPI(Resource):
+    def get(self):
+        """List promotions, optionally only active ones"""
+        try:
+            query = Promotion.query
+            if request.args.get("active") == "true":
+                query = query.filter_by(is_active=True)
+            return {"results": promotion_list_schema.dump(query.order_by(Promotion.id.desc()).all())}, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching promotions: {e}")
+            return {"error": "Internal server error"}, 500
+
+    @unit_of_work(conflict="Invalid product or category")
+    @json_body(PromotionSchema)
+    def post(self, body):
+        promotion = Promotion(**body)
+        db.session.add(promotion)
+        db.session.flush()
+        return {"message": "Promotion created successfully", "id": promotion.id}, 201
+
+
+class PromotionDetailAPI(Resource):
+    @unit_of_work(conflict="Invalid product or category")
+    @json_body(PromotionSchema, partial=True)
+    def put(self, id, body):
+        promotion = Promotion.query.get(id)
+        if not promotion:
+            return {"message": "Promotion not found"}, 404
+        for key, value in body.items():
+            setattr(promotion, key, value)
+        # The kind's fields must hold on the updated promotion, not just the patch
+        missing = missing_fields(promotion)
+        if missing:
+            return {"error": {name: ["Required for this kind."] for name in missing}}, 400
+        return {"message": "Promotion updated successfully"}, 200
+
+    @unit_of_work
+    def delete(self, id):
+        promotion = Promotion.query.get(id)
+        if not promotion:
+            return {"message": "Promotion not found"}, 404
+        promotion.is_trash = True  # Soft delete
+        return {"message": "Promotion deleted successfully"}, 200
+
+
+api.add_resource(PromotionListAPI, "/promotions/")
+api.add_resource(PromotionDetailAPI, "/promotions/<int:id>/")
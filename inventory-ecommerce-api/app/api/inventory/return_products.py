@@ -1,207 +1,102 @@
-from flask import Blueprint, abort, jsonify
-from flask_jwt_extended import jwt_required
-from flask_restful import Api, request, Resource
-from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
-from marshmallow.exceptions import ValidationError
-
-from app.core.models import Product, Stock, StockMovement
-from app.schemas.product_schema import ProductSchema
+from flask import Blueprint
+from flask_restful import Api, Resource
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.models import ReturnProduct, TransactionItem
+from app.core.returns import ReturnError, process_returns
+from app.schemas.return_schema import ReturnQuerySchema, ReturnSchema
 from app.utils.db_utils import db
-from math import ceil
+from app.utils.pagination import page_args
+from app.utils.unit_of_work import abort_json, unit_of_work
+from app.utils.validation import json_body, query_params
 import logging
 
 return_products_bp = Blueprint("return_products", __name__)
 api = Api(return_products_bp)
 
-product_schema = ProductSchema()
-
-def abort_json(status_code, message):
-    response = jsonify(error=message)
-    response.status_code = status_code
-    abort(response)
-
-class return_ProductListResource(Resource):
-    def post(self):
-        data = request.get_json()
-        product_id = data.get("product_id")
-        quantity = data.get("quantity")
-
-        # Validation
-        if not product_id or not quantity:
-            return {"error": "Product ID and quantity are required"}, 400
-
-        # Check if product and stock exist
-        product = Product.query.get(product_id)
-        if not product:
-            return {"error": "Product not found"}, 404
-
-        stock = Stock.query.filter_by(product_id=product_id).first()
-        if not stock:
-            return {"error": "Stock not found for the product"}, 404
-
-        # Update stock
-        stock.quantity += quantity
-        
-        return_movement = StockMovement(
-            product_id=product_id,
-            quantity_change=quantity,
-            type='return'
-        )
-        db.session.add(return_movement)
-        
-        db.session.commit()
-
-        return {"message": "Product returned successfully"}, 200
-    
-    def get_list (self, *args, **kwargs):
-        """Get list of products with pagination"""
+return_schema = ReturnSchema()
+return_list_schema = ReturnSchema(many=True)
+
+class ReturnListResource(Resource):
+    @query_params(ReturnQuerySchema)
+    def get(self, params):
+        """Get list of returns with pagination, newest first"""
         try:
-            page = int(request.args.get("page", 1))
-            count = int(request.args.get("count", 10))
-            product_id = request.get("product_id")
-            quantity = request.get("quantity")
-            category_id = request.args.get("category_id", "")
-            
-            
-            query = Product.query
+            page, count = page_args()
+            transaction_id = params.transaction_id
+            transaction_item_id = params.transaction_item_id
+            product_id = params.product_id
+            start_date = params.start_date
+            end_date = params.end_date
 
-            if product_id:
-                query = query.filter(Product.name.like(f"%{product_id}%"))
+            # Every filter combination is served by one of the live return_products indexes
+            query = ReturnProduct.query.filter(ReturnProduct.is_trash == False)
 
-            if category_id:
-                query = query.filter_by(category=category_id)
+            if transaction_id:
+                query = query.filter(ReturnProduct.transaction_item_id.in_(
+                    db.select(TransactionItem.id).where(TransactionItem.transaction_id == transaction_id)
+                ))
 
-            if quantity:
-                query = query.filter_by(quantity=quantity)
+            if transaction_item_id:
+                query = query.filter(ReturnProduct.transaction_item_id == transaction_item_id)
 
-            total = query.count()
-            pages = ceil(total / count)
+            if product_id:
+                query = query.filter(ReturnProduct.product_id == product_id)
 
-            paginated_query = query.order_by(Product.created_at.desc()).paginate(
-                page, count, error_out=False
-            )
+            if start_date:
+                query = query.filter(ReturnProduct.timestamp >= start_date)
 
-            records = []
-            for product in paginated_query.items:
-                product_dict = product_schema.dump(product)
-                product_dict["is_trash"] = bool(product.is_trash)
-                records.append(product_dict)
+            if end_date:
+                query = query.filter(ReturnProduct.timestamp <= end_date)
+
+            paginated = query.order_by(ReturnProduct.timestamp.desc(), ReturnProduct.id.desc()).paginate(
+                page=page,
+                per_page=count,
+                error_out=False
+            )
 
             return {
-                "total": total,
-                "pages": pages,
-                "current_page": page,
-                "records": records,
+                "count": count,
+                "total": paginated.total,
+                "pages": paginated.pages,
+                "page": paginated.page,
+                "results": return_list_schema.dump(paginated.items),
             }, 200
 
-        except (IntegrityError, DataError, OperationalError) as e:
-            db.session.rollback()
-            logging.error(f"Database error: {str(e)}")
-            return {"error": "Database error"}, 500
         except SQLAlchemyError as e:
-            logging.error(f"SQLAlchemy error: {str(e)}")
-            return {"error": "SQLAlchemy error"}, 500
-        except ValidationError as e:
-            logging.error(f"Validation error: {str(e)}")
-            return {"error": str(e)}, 400
-        except Exception as e:
-            logging.error(f"Unexpected error: {str(e)}")
-            return {"error": "Unexpected error"}, 500
-        
-        
-    def get(self, id):
-        """Get a product by ID"""
-        try:
-            product = Product.query.get(id)
-            if not product:
-                return {"error": "Product not found"}, 404
-            
-
-            product_dict = product_schema.dump(product)
-            return product_dict, 200
-
-        except (IntegrityError, DataError, OperationalError) as e:
-            db.session.rollback()
-            logging.error(f"Database error: {str(e)}")
-            return {"error": "Database error"}, 500
-        except SQLAlchemyError as e:
-            logging.error(f"SQLAlchemy error: {str(e)}")
-            return {"error": "SQLAlchemy error"}, 500
-        except ValidationError as e:
-            logging.error(f"Validation error: {str(e)}")
-            return {"error": str(e)}, 400
-        except Exception as e:
-            logging.error(f"Unexpected error: {str(e)}")
-            return {"error": "Unexpected error"}, 500
-        
-        
-    def put(self, id):
-        """Update a product by ID"""
-        try:
-            data = request.get_json()
-            if not data:
-                return {"error": "Invalid input data"}, 400
+            logging.error(f"Error fetching returns: {e}")
+            abort_json(500, str(e))
 
-            try:
-                # Validate and deserialize input
-                product_data = product_schema.load(data)
-            except ValidationError as ve:
-                return {"error": ve.messages}, 400
-
-            # Update product instance
-            product = Product.query.get(id)
-            if not product:
-                return {"error": "Product not found"}, 404
-
-            for key, value in product_data.items():
-                setattr(product, key, value)
-
-            # Commit changes to the database
-            db.session.commit()
-
-            return {"message": "Product updated successfully"}, 200
-
-
-        except (IntegrityError, DataError, OperationalError) as e:
-            db.session.rollback()
-            logging.error(f"Database error: {str(e)}")
-            return {"error": "Database error"}, 500
-        except SQLAlchemyError as e:
-            logging.error(f"SQLAlchemy error: {str(e)}")
-            return {"error": "SQLAlchemy error"}, 500
-        except ValidationError as e:
-            logging.error(f"Validation error: {str(e)}")
-            return {"error": str(e)}, 400
-        except Exception as e:
-            logging.error(f"Unexpected error: {str(e)}")
-            return {"error": "Unexpected error"}, 500  
-        
-    def delete(self, id):
-        """Delete a product by ID"""
+    @unit_of_work
+    @json_body(ReturnSchema)
+    def post(self, body):
+        """Return units of a sold transaction item to stock"""
+        try:
+            ids = process_returns([body])
+        except ReturnError as e:
+            return {"error": str(e), "lines": e.errors}, 409
+        return return_schema.dump(db.session.get(ReturnProduct, ids[0])), 201
+
+class ReturnBulkResource(Resource):
+    @unit_of_work
+    @json_body(ReturnSchema, many=True, max_items="MAX_RETURN_BATCH")
+    def post(self, body):
+        """Record a batch of returns; nothing is written unless every line is valid"""
         try:
-            product = Product.query.get(id)
-            if not product:
-                return {"error": "Product not found"}, 404
+            ids = process_returns(body)
+        except ReturnError as e:
+            return {"error": str(e), "lines": e.errors}, 409
+        return {"message": f"{len(ids)} returns recorded", "ids": ids}, 201
 
-            db.session.delete()
-            db.session.commit()
+class ReturnResource(Resource):
+    def get(self, id):
+        """Get a return by ID"""
+        return_product = ReturnProduct.query.filter_by(id=id, is_trash=False).first()
+        if not return_product:
+            return {"error": "Return not found"}, 404
+        return return_schema.dump(return_product), 200
 
-            return {"message": "Product deleted successfully"}, 200
 
-        except (IntegrityError, DataError, OperationalError) as e:
-            db.session.rollback()
-            logging.error(f"Database error: {str(e)}")
-            return {"error": "Database error"}, 500
-        except SQLAlchemyError as e:
-            logging.error(f"SQLAlchemy error: {str(e)}")
-            return {"error": "SQLAlchemy error"}, 500
-        except ValidationError as e:
-            logging.error(f"Validation error: {str(e)}")
-            return {"error": str(e)}, 400
-        except Exception as e:
-            logging.error(f"Unexpected error: {str(e)}")
-            return {"error": "Unexpected error"}, 500       
-    
-    
-    
-api.add_resource(return_ProductListResource, "/product_return/")    
+api.add_resource(ReturnListResource, "/returns/", "/product_return/")
+api.add_resource(ReturnBulkResource, "/returns/bulk/")
+api.add_resource(ReturnResource, "/returns/<int:id>/")
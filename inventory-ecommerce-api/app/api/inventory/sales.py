@@ -1,15 +1,24 @@
-from flask import Blueprint, abort, jsonify, request
+from flask import Blueprint, request
 from flask_jwt_extended import jwt_required
 from flask_restful import Api, Resource
 from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
-from marshmallow.exceptions import ValidationError
 from app.core.models import Product, Transaction, TransactionItem, Stock, Customer, StockMovement
 from app.schemas.product_schema import ProductSchema
-from app.schemas.transaction_schema import TransactionSchema
+from app.schemas.checkout_schema import CheckoutSchema
+from app.schemas.transaction_schema import SalesQuerySchema, TransactionSchema
+from app.core import analytics, customer_stats, lifecycle, variants
+from app.core.checkout import transaction_total
+from app.core.pricing import price_basket
+from app.core.warehouses import AllocationError, allocate, shipments, take_allocations
 from app.utils.db_utils import db
-from math import ceil
+from app.utils.pagination import page_args
+from app.utils.sparse import columns_only, dump_fields, requested_fields, schema_for
+from app.utils.unit_of_work import abort_json, unit_of_work
+from app.utils.validation import json_body, query_params
 import logging
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal
 
 sales_bp = Blueprint("sales", __name__)
 api = Api(sales_bp)
@@ -18,63 +27,55 @@ product_schema = ProductSchema()
 transaction_schema = TransactionSchema()
 transaction_list_schema = TransactionSchema(many=True)
 
-def abort_json(status_code, message):
-    response = jsonify(error=message)
-    response.status_code = status_code
-    abort(response)
+TRANSACTION_FIELDS = dump_fields(TransactionSchema)
+
+def json_rows(rows):
+    """Make rows read from Parquet JSON serializable"""
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                row[key] = value.isoformat()
+            elif isinstance(value, Decimal):
+                row[key] = float(value)
+    return rows
 
 class SalesResource(Resource):
-    def get(self):
+    @query_params(SalesQuerySchema)
+    def get(self, params):
         """Get list of sales transactions with pagination"""
         try:
-            page = request.args.get('page', default=1, type=int)
-            count = request.args.get('count', default=10, type=int)
-            name = request.args.get('name', default=None, type=str)
-            category_id = request.args.get('category_id', default=None, type=str)
-            status = request.args.get('status', default=None, type=str)
-            start_date_str = request.args.get('start_date', default=None, type=str)
-            end_date_str = request.args.get('end_date', default=None, type=str)
-
-            # Query for transactions
-            query = Transaction.query
-
-            if name:
-                query = query.filter(Transaction.name.like(f"%{name}%"))
+            page, count = page_args()
+            status = params.status
+            try:
+                fields = requested_fields(TRANSACTION_FIELDS)
+            except ValueError as e:
+                return {"error": str(e)}, 400
 
-            if category_id:
-                query = query.filter(Transaction.category == category_id)
+            # Query for transactions, selecting only the requested columns
+            query = Transaction.query.options(columns_only(Transaction, fields))
 
             if status:
                 query = query.filter(Transaction.status == status)
 
-            if start_date_str:
-                start_date = datetime.fromisoformat(start_date_str)
-                query = query.filter(Transaction.timestamp >= start_date)
+            if params.start_date:
+                query = query.filter(Transaction.timestamp >= params.start_date)
             
-            if end_date_str:
-                end_date = datetime.fromisoformat(end_date_str)
-                query = query.filter(Transaction.timestamp <= end_date)
-
-            total = query.count()
-            pages = ceil(total / count)
+            if params.end_date:
+                query = query.filter(Transaction.timestamp <= params.end_date)
 
             # Paginate the results
-            paginated_query = db.paginate(
-                query.order_by(Transaction.timestamp.desc()),
+            paginated_query = query.order_by(Transaction.timestamp.desc()).paginate(
                 page=page,
                 per_page=count,
                 error_out=False
             )
 
-            records = []
-            for transaction in paginated_query.items:
-                transaction_dict = transaction_schema.dump(transaction)
-                records.append(transaction_dict)
+            records = schema_for(TransactionSchema, fields).dump(paginated_query.items)
 
             return {
                 "count": count,
-                "total": total,
-                "pages": pages,
+                "total": paginated_query.total,
+                "pages": paginated_query.pages,
                 "page": paginated_query.page,
                 "results": records,
             }, 200
@@ -83,38 +84,22 @@ class SalesResource(Resource):
             logging.error(f"Error fetching sales: {e}")
             abort_json(500, str(e))
 
-    def post(self):
+    @unit_of_work
+    @json_body(TransactionSchema)
+    def post(self, body):
         """Create a new sale transaction"""
-        try:
-            data = request.get_json()
-            if not data:
-                return {"error": "Invalid input data"}, 400
+        # Check if customer exists, if not, create a new one
+        customer_id = body.get('customer_id')
+        if not customer_id:
+            return {"error": "customer_id is required"}, 400
 
-            try:
-                # Validate and deserialize input
-                transaction_data = transaction_schema.load(data)
-            except ValidationError as ve:
-                return {"error": ve.messages}, 400
-
-            if not isinstance(transaction_data, dict):
-                return {"error": "Invalid transaction data"}, 400
-
-            # Check if customer exists, if not, create a new one
-            customer_id = transaction_data.get('customer_id')
-            if not customer_id:
-                return {"error": "customer_id is required"}, 400
-
-            # Create new transaction instance
-            transaction = Transaction(**transaction_data)
-            db.session.add(transaction)
-            db.session.commit()
-            
-            return {"message": "Sale created successfully", "id": transaction.id}, 201
-        
-        except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error creating sale: {e}")
-            abort_json(500, str(e))
+        # Create new transaction instance
+        transaction = Transaction(**body)
+        db.session.add(transaction)
+        db.session.flush()
+        customer_stats.record_purchase(transaction)
+
+        return {"message": "Sale created successfully", "id": transaction.id}, 201
 
 class SalesDetailResource(Resource):
     def get(self, transaction_id):
@@ -131,155 +116,224 @@ class SalesDetailResource(Resource):
             logging.error(f"Error fetching transaction: {e}")
             abort_json(500, str(e))
 
-    def put(self, transaction_id):
+    @unit_of_work
+    @json_body(TransactionSchema, partial=True)
+    def put(self, transaction_id, body):
         """Update a sale transaction"""
-        try:
-            body = request.get_json()
-            transaction = Transaction.query.filter_by(id=transaction_id).first()
+        transaction = Transaction.query.filter_by(id=transaction_id).first()
 
-            if not transaction:
-                return {"message": "Invalid Transaction ID"}, 404
+        if not transaction:
+            return {"message": "Invalid Transaction ID"}, 404
 
-            try:
-                # Validate input
-                transaction_data = transaction_schema.load(body, partial=True)
-            except ValidationError as ve:
-                return {"error": ve.messages}, 400
-
-            # Update transaction attributes
-            for key, value in transaction_data.items():
-                setattr(transaction, key, value)
-                
-            db.session.commit()
-            return {"message": "Transaction Updated Successfully"}, 200
-        
-        except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error updating transaction: {e}")
-            abort_json(500, str(e))
+        # Update transaction attributes
+        customer_ids = {transaction.customer_id}
+        for key, value in body.items():
+            setattr(transaction, key, value)
+        customer_ids.add(transaction.customer_id)
 
+        db.session.flush()
+        customer_stats.recompute(list(customer_ids))
+        return {"message": "Transaction Updated Successfully"}, 200
+
+    @unit_of_work
     def delete(self, transaction_id):
         """Delete a sale transaction"""
-        try:
-            transaction = Transaction.query.filter_by(id=transaction_id).first()
+        transaction = Transaction.query.filter_by(id=transaction_id).first()
 
-            if not transaction:
-                return {"message": "Invalid Transaction ID"}, 404
+        if not transaction:
+            return {"message": "Invalid Transaction ID"}, 404
+
+        customer_id = transaction.customer_id
+        # Soft delete, so the change is stamped for the analytics snapshots
+        transaction.is_trash = True
+        db.session.flush()
+        customer_stats.recompute([customer_id])
+        return {"message": "Transaction Deleted Successfully"}, 200
 
-            db.session.delete(transaction)
-            db.session.commit()
-            return {"message": "Transaction Deleted Successfully"}, 200
-        
-        except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error deleting transaction: {e}")
-            abort_json(500, str(e))
-            
 
 class SalesCheckoutView(Resource):
-    def post(self):
+    @unit_of_work
+    @json_body(CheckoutSchema)
+    def post(self, body):
         """Handle the checkout of a sale transaction"""
+        items = body["items"]
+        cart_id = body["cart_id"]
+
+        # Validate if stock is available for each item
+        line_variants = []
+        for item_data in items:
+            product_id = item_data["product_id"]
+            quantity = item_data["quantity"]
+
+            # Check if product exists and if enough stock is available
+            product = Product.query.filter_by(id=product_id).first()
+            if not product:
+                return {"error": f"Product {product_id} not found"}, 404
+
+            stock = Stock.query.filter_by(product_id=product_id).first()
+            # Units held by carts aren't available to walk-in sales
+            if stock and stock.available < quantity:
+                return {"error": f"Not enough stock for {product.name}"}, 400
+
+            try:
+                variant = variants.resolve(product, item_data.get("variant_id"))
+            except variants.VariantError as e:
+                return {"error": e.message, "product_id": e.product_id}, e.status
+            if variant and variant.available < quantity:
+                return {"error": f"Not enough stock for {product.name} {variant.sku}"}, 400
+            line_variants.append(variant)
+
+        # If all items are valid, proceed with the sale
+        customer = Customer.query.filter_by(email=body["customer"]["email"]).first()
+        if not customer:
+            return {"error": "Customer not found"}, 404
+
+        # Pick fulfilling warehouses for the stocked part of the basket
+        products = [Product.query.get(item_data["product_id"]) for item_data in items]
+        fulfillment = body.get("fulfillment") or {}
+        try:
+            allocations = allocate(
+                [(product.id, item_data["quantity"])
+                 for item_data, product in zip(items, products) if product.stock],
+                strategy=fulfillment.get("strategy"),
+                split=fulfillment.get("split", True),
+                ship_to=fulfillment.get("ship_to")
+            )
+        except AllocationError as e:
+            return {"error": e.message}, 400
+
+        transaction = Transaction(
+            cart_id=cart_id,
+            customer_id=customer.id,
+            status="Completed",
+            total_amount=0
+        )
+        db.session.add(transaction)
+        db.session.flush()
+
+        # Price the whole basket against the active promotions at once
+        priced = price_basket([
+            (product.id, product.category_id, item_data["quantity"],
+             variant.unit_price if variant else product.price)
+            for item_data, product, variant in zip(items, products, line_variants)
+        ])
+
+        # Add items to the transaction
+        for product, variant, line in zip(products, line_variants, priced):
+            transaction_item = TransactionItem(
+                transaction_id=transaction.id,
+                product_id=product.id,
+                variant_id=variant.id if variant else None,
+                quantity=line.quantity,
+                price_per_unit=line.unit_price,
+                discount=line.discount,
+                promotion_id=line.promotion_id
+            )
+            db.session.add(transaction_item)
+
+        # Update stock quantity, one movement per shipping location
+        if not take_allocations(allocations):
+            return {"error": "Not enough stock"}, 409
+        sold = defaultdict(int)
+        for item_data, variant in zip(items, line_variants):
+            if variant:
+                sold[variant.id] += item_data["quantity"]
+        if sold:
+            if not variants.take(sold):
+                return {"error": "Not enough stock for a variant"}, 409
+            variants.refresh(variant.product_id for variant in line_variants if variant)
+        for allocation in allocations:
+            sale_movement = StockMovement(
+                product_id=allocation.product_id,
+                quantity_change=-allocation.quantity,
+                type='sale',
+                warehouse_id=allocation.warehouse_id
+            )
+            db.session.add(sale_movement)
+
+        # Total is summed over the inserted items by the database
+        db.session.flush()
+        transaction.total_amount = transaction_total(transaction.id)
+        customer_stats.record_purchase(transaction)
+
+        # Return success response
+        return {
+            "message": "Checkout successful",
+            "transaction_id": transaction.id,
+            "total_amount": float(transaction.total_amount),
+            "shipments": shipments(allocations),
+        }, 200
+
+
+class SalesArchiveResource(Resource):
+    def get(self, table=None, month=None):
+        """List archived months, or read rows of one archived month"""
+        if table is None:
+            return {"tables": {name: lifecycle.archived_months(name) for name in lifecycle.ARCHIVED_TABLES}}, 200
+
+        if table not in lifecycle.ARCHIVED_TABLES:
+            return {"error": f"Unknown table {table}"}, 404
+        try:
+            month_start = lifecycle.parse_month(month)
+        except ValueError:
+            return {"error": "month must be YYYY-MM"}, 400
+
+        page, count = page_args(default_count=100)
+        try:
+            rows = lifecycle.read_archive(table, month_start, offset=(page - 1) * count, limit=count)
+        except RuntimeError as e:
+            logging.error(f"Error reading archive: {e}")
+            return {"error": str(e)}, 500
+        if rows is None:
+            return {"message": "Month not archived"}, 404
+
+        return {
+            "table": table,
+            "month": month,
+            "count": count,
+            "page": page,
+            "results": json_rows(rows),
+        }, 200
+
+
+class SalesAnalyticsResource(Resource):
+    @query_params(SalesQuerySchema)
+    def get(self, params):
+        """Aggregate sales from the local columnar snapshots"""
+        group_by = [key for key in request.args.get('group_by', default='', type=str).split(',') if key]
+        unknown = [key for key in group_by if key not in analytics.GROUP_KEYS]
+        if unknown:
+            return {"error": f"Unknown group_by keys: {', '.join(unknown)}"}, 400
+
         try:
-            data = request.get_json()
-            if not data:
-                return {"error": "Invalid input data"}, 400
-
-            # Assuming data contains transaction details, like items and quantities
-            items = data.get("items")
-            if not items:
-                return {"error": "No items in the transaction"}, 400
-
-            # Check for cart_id in the request data
-            cart_id = data.get("cart_id")
-            # Accept both int and string representations of cart_id, and treat 0 or empty string as invalid
-            if cart_id is None or str(cart_id).strip() == "" or str(cart_id) == "0":
-                return {"error": "cart_id is required"}, 400
-
-            # Validate if stock is available for each item
-            for item_data in items:
-                product_id = item_data.get("product_id")
-                quantity = item_data.get("quantity")
-
-                if product_id is None or quantity is None:
-                    return {"error": "Each item must have product_id and quantity"}, 400
-
-                # Check if product exists and if enough stock is available
-                product = Product.query.filter_by(id=product_id).first()
-                if not product:
-                    return {"error": f"Product {product_id} not found"}, 404
-
-                stock = Stock.query.filter_by(product_id=product_id).first()
-                if stock and stock.quantity < quantity:
-                    return {"error": f"Not enough stock for {product.name}"}, 400
-
-            # If all items are valid, proceed with the sale
-            customer_data = data.get('customer')
-            if not customer_data or not customer_data.get('email'):
-                return {"error": "Customer information with email is required"}, 400
-
-            customer = Customer.query.filter_by(email=customer_data['email']).first()
-            if not customer:
-                return {"error": "Customer not found"}, 404
-
-            total_amount = 0
-            for item_data in items:
-                product_id = item_data.get("product_id")
-                quantity = item_data.get("quantity")
-                product = Product.query.get(product_id)
-                if not product:
-                    return {"error": f"Product {product_id} not found for checkout"}, 404
-                total_amount += product.price * quantity
-
-            transaction = Transaction(
-                cart_id=cart_id,
-                customer_id=customer.id,
-                status="Completed",
-                total_amount=total_amount
+            results = analytics.sales_summary(
+                group_by,
+                start=params.start_date,
+                end=params.end_date,
+                status=params.status,
             )
-            db.session.add(transaction)
-            db.session.commit()
-
-            # Add items to the transaction
-            for item_data in items:
-                product_id = item_data.get("product_id")
-                quantity = item_data.get("quantity")
-
-                product = Product.query.get(product_id)
-                if not product:
-                    return {"error": f"Product {product_id} not found for checkout"}, 404
-
-                transaction_item = TransactionItem(
-                    transaction_id=transaction.id,
-                    product_id=product.id,
-                    quantity=quantity,
-                    price_per_unit=product.price
-                )
-                db.session.add(transaction_item)
-
-                # Update stock quantity
-                stock = Stock.query.filter_by(product_id=product_id).first()
-                if stock:
-                    stock.quantity -= quantity
-                    
-                    sale_movement = StockMovement(
-                        product_id=product.id,
-                        quantity_change=-quantity,
-                        type='sale'
-                    )
-                    db.session.add(sale_movement)
-
-            # Commit all changes to the database
-            db.session.commit()
-
-            # Return success response
-            return {"message": "Checkout successful", "transaction_id": transaction.id}, 200
+        except RuntimeError as e:
+            logging.error(f"Error running sales analytics: {e}")
+            return {"error": str(e)}, 500
 
-        except (IntegrityError, DataError, OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Error during checkout: {e}")
-            abort_json(500, str(e))
+        return {
+            "group_by": group_by,
+            "snapshot": analytics.load_manifest(),
+            "results": json_rows(results),
+        }, 200
+
+    def post(self):
+        """Refresh the snapshots from the database"""
+        try:
+            copied = analytics.refresh()
+        except (RuntimeError, SQLAlchemyError) as e:
+            logging.error(f"Error refreshing sales analytics: {e}")
+            return {"error": str(e)}, 500
+        return {"message": "Snapshot refreshed", "copied": copied}, 200
 
 
 api.add_resource(SalesCheckoutView, "/sales/checkout/")            
 api.add_resource(SalesResource, "/sales/")
 api.add_resource(SalesDetailResource, "/sales/<int:transaction_id>/")
+api.add_resource(SalesArchiveResource, "/sales/archive/", "/sales/archive/<string:table>/<string:month>/")
+api.add_resource(SalesAnalyticsResource, "/sales/analytics/")
@@ -1,13 +1,23 @@
-from flask import Blueprint, abort, jsonify
+from flask import Blueprint, abort, current_app, jsonify
 from flask_jwt_extended import jwt_required
 from flask_restful import Api, Resource, reqparse, request
-from sqlalchemy.exc import IntegrityError, DataError, OperationalError, SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, DataError, SQLAlchemyError
 from marshmallow import ValidationError
 from sqlalchemy import text
 
-from app.core.models import Stock, Transaction, StockMovement
-from app.schemas.stock_schema import StockSchema
+from app.core.ledger import daily, movements, net_changes
+from app.core.models import Stock, Transaction, StockMovement, Warehouse
+from app.core.warehouses import adjust_location
+from app.schemas.stock_schema import (
+    MovementDailyQuerySchema, MovementQuerySchema, StockBatchSchema, StockSchema, StockLocationSchema,
+    StockMovementSchema, WarehouseSchema,
+)
+from app.utils.batch import parse_ids
 from app.utils.db_utils import db
+from app.utils.pagination import decode_cursor, encode_cursor, page_args
+from app.utils.singleflight import SingleFlight, request_key
+from app.utils.unit_of_work import error_response, unit_of_work
+from app.utils.validation import json_body, query_params
 from datetime import datetime, timedelta
 import logging
 
@@ -15,18 +25,17 @@ stock_bp = Blueprint("stock", __name__)
 api = Api(stock_bp)
 
 stock_schema = StockSchema()
-
-def make_error_response(status_code, message):
-    return ({"error": message}), status_code
-
+warehouse_schema = WarehouseSchema()
+location_list_schema = StockLocationSchema(many=True)
+movement_list_schema = StockMovementSchema(many=True)
+stock_flight = SingleFlight("stock")
 
 class StockListAPI(Resource):       
     
     def get(self):
         """Get list of stocks with optional search and pagination"""
         try:
-            page = int(request.args.get("page", 1))
-            count = int(request.args.get("count", 10))
+            page, count = page_args()
             product_id = request.args.get("product_id", "")
             quantity = request.args.get("quantity", "")
             
@@ -38,7 +47,7 @@ class StockListAPI(Resource):
             if quantity:
                 query = query.filter(Stock.quantity.ilike(f"%{quantity}%"))
 
-            paginated = db.paginate(query.order_by(Stock.id.desc()), page=page, per_page=count, error_out=False)
+            paginated = query.order_by(Stock.id.desc()).paginate(page=page, per_page=count, error_out=False)
 
             return {
                 "count": count,
@@ -50,135 +59,161 @@ class StockListAPI(Resource):
 
         except SQLAlchemyError as e:
             logging.error(f"Error fetching stocks: {e}")
-            return make_error_response(500, "Internal server error")
+            return error_response(500, "Internal server error")
         except (IntegrityError, DataError) as e:
             db.session.rollback()
             logging.error(f"Database error: {e}")
-            return make_error_response(400, "Invalid stock data")
+            return error_response(400, "Invalid stock data")
         except ValidationError as e:
-            return make_error_response(400, str(e.messages))
+            return error_response(400, str(e.messages))
         
-    def post(self):
-        try:
-            data = request.get_json()
-            if not data:
-                return make_error_response(400, "Invalid input data")
-            
-            stock_data = stock_schema.load(data)
-            
-            stock = Stock(**stock_data)
-            db.session.add(stock)
-            db.session.commit()
+    @unit_of_work(conflict="Stock already exists for the product", invalid="Invalid stock data")
+    @json_body(StockSchema)
+    def post(self, body):
+        quantity = body.pop('quantity')
+        warehouse_id = body.pop('warehouse_id', None)
 
-            stock_movement = StockMovement(
-                product_id=stock.product_id,
-                quantity_change=stock.quantity,
-                type='initial'
-            )
-            db.session.add(stock_movement)
-            db.session.commit()
-            
-            return stock_schema.dump(stock), 201
-            
-        except ValidationError as e:
-            return make_error_response(400, str(e.messages))
-        except (IntegrityError, DataError) as e:
-            db.session.rollback()
-            logging.error(f"Database error creating stock: {e}")
-            return make_error_response(400, "Invalid stock data")
-        except (OperationalError, SQLAlchemyError) as e:
-            db.session.rollback()
-            logging.error(f"Database operation failed: {e}")
-            return make_error_response(500, "Internal server error")
+        stock = Stock(quantity=0, **body)
+        db.session.add(stock)
+        location = adjust_location(stock, quantity, warehouse_id)
+        db.session.add(StockMovement(
+            product_id=stock.product_id,
+            quantity_change=quantity,
+            type='initial',
+            warehouse_id=location.warehouse_id
+        ))
+        db.session.flush()
+        return stock_schema.dump(stock), 201
     
 class StockView(Resource):
     
     def get(self, pk=None):
         try:
             if pk:
-                stock = Stock.query.filter_by(product_id=pk).first()
-                if not stock:
-                    return make_error_response(404, "Stock not found")
-                return stock_schema.dump(stock), 200
+                def fetch():
+                    stock = Stock.query.filter_by(product_id=pk).first()
+                    if not stock:
+                        return error_response(404, "Stock not found")
+                    return stock_schema.dump(stock), 200
+
+                body, status = stock_flight.do(request_key(), fetch)
+                return dict(body), status
             else:
             
-                return make_error_response(400, "Product ID is required")
+                return error_response(400, "Product ID is required")
                 
         except SQLAlchemyError as e:
             logging.error(f"Error fetching stock: {e}")
-            return make_error_response(500, "Internal server error")
+            return error_response(500, "Internal server error")
     
-    def put(self, pk):
-        try:
-            if not pk:
-                return make_error_response(400, "Product ID is required")
+    @unit_of_work(conflict="Stock can't go below zero", invalid="Invalid stock data")
+    @json_body(StockSchema, partial=True)
+    def put(self, pk, body):
+        if not pk:
+            return error_response(400, "Product ID is required")
 
-            stock = Stock.query.filter_by(product_id=pk).first()
-            if not stock:
-                return make_error_response(404, "Stock not found")
+        stock = Stock.query.filter_by(product_id=pk).first()
+        if not stock:
+            return error_response(404, "Stock not found")
+        if not body:
+            return error_response(400, "No update data provided")
 
-            data = request.get_json()
-            if not data:
-                return make_error_response(400, "No update data provided")
+        new_quantity = body.pop('quantity', None)
+        warehouse_id = body.pop('warehouse_id', None)
 
-            
-            update_data = stock_schema.load(data, partial=True)
-            
-            old_quantity = stock.quantity
-            
-            for key, value in update_data.items():
-                setattr(stock, key, value)
-            
-            new_quantity = stock.quantity
-            quantity_change = new_quantity - old_quantity
-
-            if quantity_change != 0:
-                stock_movement = StockMovement(
-                    product_id=stock.product_id,
-                    quantity_change=quantity_change,
-                    type='restock' if quantity_change > 0 else 'adjustment'
-                )
-                db.session.add(stock_movement)
-
-            db.session.commit()
-            return ("Stock updated successfully"), 200
-            
-        except ValidationError as e:
-            return make_error_response(400, str(e.messages))
-        except (IntegrityError, DataError) as e:
-            db.session.rollback()
-            logging.error(f"Database error updating stock: {e}")
-            return make_error_response(400, "Invalid stock data")
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logging.error(f"Database operation failed: {e}")
-            return make_error_response(500, "Internal server error")
-        
+        for key, value in body.items():
+            setattr(stock, key, value)
+
+        # With a warehouse the quantity is that location's, otherwise the
+        # product total and the difference lands in the default warehouse
+        quantity_change = 0
+        if new_quantity is not None:
+            if warehouse_id is not None:
+                location = next((loc for loc in stock.locations if loc.warehouse_id == warehouse_id), None)
+                quantity_change = new_quantity - (location.quantity if location else 0)
+            else:
+                quantity_change = new_quantity - stock.quantity
+
+        if quantity_change != 0:
+            location = adjust_location(stock, quantity_change, warehouse_id)
+            stock_movement = StockMovement(
+                product_id=stock.product_id,
+                quantity_change=quantity_change,
+                type='restock' if quantity_change > 0 else 'adjustment',
+                warehouse_id=location.warehouse_id
+            )
+            db.session.add(stock_movement)
+
+        return ("Stock updated successfully"), 200
+
+    @unit_of_work(conflict="Stock is still referenced")
     def delete(self, pk):
+        if not pk:
+            return error_response(400, "Product ID is required")
+
+        stock = Stock.query.filter_by(product_id=pk).first()
+        if not stock:
+            return error_response(404, "Stock not found")
+
+        for location in stock.locations:
+            db.session.delete(location)
+        db.session.delete(stock)
+        return ("Stock deleted successfully"), 200
+
+class StockBatchView(Resource):
+    @json_body(StockBatchSchema)
+    def post(self, body):
+        """Fetch stock for many products in one query"""
         try:
-            if not pk:
-                return make_error_response(400, "Product ID is required")
+            ids = parse_ids(body["product_ids"], current_app.config["MAX_BATCH_IDS"])
+        except ValueError as e:
+            return error_response(400, str(e))
+
+        try:
+            stocks = Stock.query.filter(Stock.product_id.in_(ids)).all()
+            found = {stock.product_id: stock_schema.dump(stock) for stock in stocks}
+
+            return {
+                "results": {str(id_): found.get(id_) for id_ in ids},
+                "not_found": [id_ for id_ in ids if id_ not in found],
+            }, 200
 
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching stock batch: {e}")
+            return error_response(500, "Internal server error")
+
+class StockLocationView(Resource):
+    def get(self, pk):
+        """Per-warehouse quantities of one product"""
+        try:
             stock = Stock.query.filter_by(product_id=pk).first()
             if not stock:
-                return make_error_response(404, "Stock not found")
+                return error_response(404, "Stock not found")
+            return {
+                "product_id": stock.product_id,
+                "quantity": stock.quantity,
+                "locations": location_list_schema.dump(stock.locations),
+            }, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching stock locations: {e}")
+            return error_response(500, "Internal server error")
 
-            db.session.delete(stock)
-            db.session.commit()
-            return ("Stock deleted successfully"), 200
-            
+class WarehouseListAPI(Resource):
+    def get(self):
+        try:
+            warehouses = Warehouse.query.order_by(Warehouse.priority, Warehouse.id).all()
+            return {"results": warehouse_schema.dump(warehouses, many=True)}, 200
         except SQLAlchemyError as e:
-            db.session.rollback()
-            logging.error(f"Error deleting stock: {e}")
-            return make_error_response(500, "Internal server error")
-        except IntegrityError as e:
-            db.session.rollback()
-            logging.error(f"Integrity error: {e}")
-            return make_error_response(400, "Invalid stock data")
-        except DataError as e:  
-            db.session.rollback()
-            logging.error(f"Data error: {e}")
-            return make_error_response(400, "Invalid stock data")    
+            logging.error(f"Error fetching warehouses: {e}")
+            return error_response(500, "Internal server error")
+
+    @unit_of_work(conflict="Warehouse with this code already exists")
+    @json_body(WarehouseSchema)
+    def post(self, body):
+        warehouse = Warehouse(**body)
+        db.session.add(warehouse)
+        db.session.flush()
+        return warehouse_schema.dump(warehouse), 201
 
 class LowStockView(Resource):
     def get(self):
@@ -191,12 +226,78 @@ class LowStockView(Resource):
             }, 200
         except SQLAlchemyError as e:
             logging.error(f"Error fetching low stock items: {e}")
-            return make_error_response(500, "Internal server error")
+            return error_response(500, "Internal server error")
+
+class StockMovementListView(Resource):
+    @query_params(MovementQuerySchema)
+    def get(self, params):
+        """Ledger of stock movements newest first, by product and type over [start, end)"""
+        try:
+            after = decode_cursor(params.after) if params.after else None
+        except ValueError as e:
+            return error_response(400, str(e))
+        count = max(1, min(params.count, current_app.config["MAX_PAGE_SIZE"]))
+
+        try:
+            rows, last = movements(
+                product_id=params.product_id,
+                movement_type=params.type,
+                start=params.start,
+                end=params.end,
+                after=after,
+                limit=count,
+            )
+            return {
+                "count": count,
+                "results": movement_list_schema.dump(rows),
+                "next": encode_cursor(*last) if last else None,
+            }, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching stock movements: {e}")
+            return error_response(500, "Internal server error")
+
+class StockMovementNetView(Resource):
+    @query_params(MovementQuerySchema)
+    def get(self, params):
+        """Net stock change per product over [start, end)"""
+        try:
+            ids = parse_ids(request.args.get("ids", ""), current_app.config["MAX_BATCH_IDS"])
+        except ValueError as e:
+            return error_response(400, str(e))
+
+        try:
+            changes = net_changes(ids, params.start, params.end, params.type)
+            return {"results": {str(id_): change for id_, change in changes.items()}}, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching net stock changes: {e}")
+            return error_response(500, "Internal server error")
+
+class StockMovementDailyView(Resource):
+    @query_params(MovementDailyQuerySchema)
+    def get(self, params):
+        """Movements and units per day and type between start and end dates, inclusive"""
+        try:
+            return {"results": daily(params.start, params.end, params.type)}, 200
+        except SQLAlchemyError as e:
+            logging.error(f"Error fetching daily stock movements: {e}")
+            return error_response(500, "Internal server error")
 
 # List & Create (GET all, POST new)
 api.add_resource(StockListAPI, "/stocks/")
 # Single item GET, PUT, DELETE
 api.add_resource(StockView, "/stocks/<string:pk>/")
 
+# Multi-get by product id list
+api.add_resource(StockBatchView, "/stocks/batch/")
+
+# Per-warehouse quantities
+api.add_resource(StockLocationView, "/stocks/<string:pk>/locations/")
+api.add_resource(WarehouseListAPI, "/warehouses/")
+
+# Stock movement ledger
+api.add_resource(StockMovementListView, "/movements/")
+api.add_resource(StockMovementNetView, "/movements/net/")
+api.add_resource(StockMovementDailyView, "/movements/daily/")
+
 # Low stock items
 api.add_resource(LowStockView, "/stocks/low/")
\ No newline at end of file
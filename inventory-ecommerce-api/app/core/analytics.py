@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.core import lifecycle
+from app.core.models import Category, Product, Transaction, TransactionItem
+from app.utils.db_utils import db
+from app.utils.soft_delete import with_trashed
+
+analytics_cli = AppGroup("analytics", help="Columnar sales snapshots.")
+
+# Fact tables are copied incrementally: new rows past an id watermark, and
+# snapshot files holding rows whose updated_at moved since the last refresh
+# are rewritten. Small dimension tables are rewritten on every refresh.
+FACT_TABLES = {
+    "transactions": Transaction,
+    "transaction_items": TransactionItem,
+}
+DIMENSION_TABLES = {
+    "products": Product,
+    "categories": Category,
+}
+
+# Writes commit a little after they stamp updated_at; each refresh rereads this far back
+OVERLAP = timedelta(seconds=5)
+
+GROUP_KEYS = ("category", "product", "day", "week", "month")
+TIME_BUCKETS = {"day": "day", "week": "week", "month": "month"}
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for sales analytics")
+    return pyarrow
+
+
+def snapshot_dir(table=None):
+    root = current_app.config["ANALYTICS_DIR"]
+    return os.path.join(root, table) if table else root
+
+
+def _manifest_path():
+    return os.path.join(snapshot_dir(), "manifest.json")
+
+
+def load_manifest():
+    path = _manifest_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    tmp_path = _manifest_path() + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, _manifest_path())
+
+
+def _write(table, file_name, columns, rows):
+    pa = _pyarrow()
+    folder = snapshot_dir(table)
+    os.makedirs(folder, exist_ok=True)
+    data = lifecycle.arrow_table(columns, rows)
+    tmp_path = os.path.join(folder, file_name + ".tmp")
+    pa.parquet.write_table(data, tmp_path, compression="zstd")
+    os.replace(tmp_path, os.path.join(folder, file_name))
+
+
+def _refresh_fact(table, model, watermark, chunk_size):
+    columns = [column.name for column in model.__table__.columns]
+    copied = 0
+    while True:
+        rows = db.session.execute(with_trashed(
+            db.select(*model.__table__.columns)
+            .where(model.id > watermark)
+            .order_by(model.id)
+            .limit(chunk_size)
+        )).all()
+        if not rows:
+            break
+        first, last = rows[0][columns.index("id")], rows[-1][columns.index("id")]
+        _write(table, f"{first:012d}-{last:012d}.parquet", columns, rows)
+        watermark = last
+        copied += len(rows)
+    return watermark, copied
+
+
+def _refresh_changed(table, model, watermark, since, chunk_size):
+    """Rewrite the snapshot files holding rows changed at or after `since`.
+
+    Without a `since` every snapshotted row is treated as changed. Rows no
+    longer in the database, such as archived ones, are kept as they are.
+    """
+    changed = db.select(model.id).where(model.id <= watermark).order_by(model.id)
+    if since is not None:
+        changed = changed.where(model.updated_at >= since)
+    changed_ids = db.session.execute(with_trashed(changed)).scalars().all()
+    folder = snapshot_dir(table)
+    if not changed_ids or not os.path.isdir(folder):
+        return 0
+
+    pa = _pyarrow()
+    columns = [column.name for column in model.__table__.columns]
+    rewritten = 0
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.endswith(".parquet"):
+            continue
+        first, last = (int(part) for part in file_name[:-len(".parquet")].split("-"))
+        ids = changed_ids[bisect_left(changed_ids, first):bisect_right(changed_ids, last)]
+        if not ids:
+            continue
+        fresh = {}
+        for start in range(0, len(ids), chunk_size):
+            rows = db.session.execute(with_trashed(
+                db.select(*model.__table__.columns).where(model.id.in_(ids[start:start + chunk_size]))
+            )).all()
+            fresh.update((row[columns.index("id")], tuple(row)) for row in rows)
+        existing = lifecycle.normalize_money(pa.parquet.read_table(os.path.join(folder, file_name))).to_pylist()
+        kept = [tuple(row.get(name) for name in columns) for row in existing if row["id"] not in fresh]
+        rows = sorted(kept + list(fresh.values()), key=lambda row: row[columns.index("id")])
+        _write(table, file_name, columns, rows)
+        rewritten += len(fresh)
+    return rewritten
+
+
+def refresh():
+    """Bring the local snapshots up to date with the database"""
+    chunk_size = current_app.config["ANALYTICS_CHUNK_ROWS"]
+    manifest = load_manifest()
+    copied = {}
+    started = datetime.utcnow()
+
+    for table, model in FACT_TABLES.items():
+        entry = manifest.get(table, {"watermark": 0, "version": 0})
+        since = datetime.fromisoformat(entry["since"]) if entry.get("since") else None
+        count = _refresh_changed(table, model, entry["watermark"], since, chunk_size)
+        watermark, added = _refresh_fact(table, model, entry["watermark"], chunk_size)
+        count += added
+        entry = {
+            "watermark": watermark,
+            "version": entry["version"] + 1 if count else entry["version"],
+            "since": (started - OVERLAP).isoformat(),
+        }
+        manifest[table] = entry
+        copied[table] = count
+
+    for table, model in DIMENSION_TABLES.items():
+        columns = [column.name for column in model.__table__.columns]
+        # Trashed products still own their historical sales
+        rows = db.session.execute(with_trashed(db.select(*model.__table__.columns))).all()
+        _write(table, "full.parquet", columns, rows)
+        entry = manifest.get(table, {"version": 0})
+        manifest[table] = {"version": entry["version"] + 1}
+        copied[table] = len(rows)
+
+    db.session.rollback()
+    _save_manifest(manifest)
+    logging.info(f"Analytics snapshot refreshed: {copied}")
+    return copied
+
+
+def _archived(table, below_id):
+    """Archived rows older than the first snapshotted id"""
+    pa = _pyarrow()
+    parts = []
+    for month in lifecycle.archived_months(table):
+        archived = pa.parquet.read_table(lifecycle.archive_path(table, lifecycle.parse_month(month)))
+        if below_id is not None:
+            archived = archived.filter(pa.compute.less(archived["id"], below_id))
+        if archived.num_rows:
+            parts.append(archived)
+    return parts
+
+
+def load_table(table):
+    """Load a snapshot table, cached per process until the manifest changes"""
+    pa = _pyarrow()
+    version = load_manifest().get(table, {}).get("version", 0)
+    with _lock:
+        cached = _cache.get(table)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    folder = snapshot_dir(table)
+    parts = []
+    if os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".parquet"):
+                parts.append(pa.parquet.read_table(os.path.join(folder, name)))
+
+    if table in lifecycle.ARCHIVED_TABLES:
+        below_id = min(pa.compute.min(part["id"]).as_py() for part in parts) if parts else None
+        parts = _archived(table, below_id) + parts
+
+    parts = [lifecycle.normalize_money(part) for part in parts]
+
+    loaded = pa.concat_tables(parts, promote_options="default") if parts else None
+    with _lock:
+        _cache[table] = (version, loaded)
+    return loaded
+
+
+def sales_summary(group_by, start=None, end=None, status=None):
+    """Revenue, units and order count grouped by the given keys.
+
+    `group_by` is a list drawn from GROUP_KEYS; time keys bucket on the
+    transaction timestamp.
+    """
+    pa = _pyarrow()
+    pc = pa.compute
+
+    items = load_table("transaction_items")
+    transactions = load_table("transactions")
+    if items is None or transactions is None:
+        return []
+
+    item_columns = ["transaction_id", "product_id", "quantity", "price_per_unit"]
+    if "discount" in items.column_names:
+        item_columns.append("discount")
+    items = items.select(item_columns)
+    transactions = transactions.select(["id", "timestamp", "status", "is_trash"])
+
+    mask = pc.invert(pc.fill_null(transactions["is_trash"], False))
+    if start is not None:
+        mask = pc.and_(mask, pc.greater_equal(transactions["timestamp"], pa.scalar(start, transactions["timestamp"].type)))
+    if end is not None:
+        mask = pc.and_(mask, pc.less_equal(transactions["timestamp"], pa.scalar(end, transactions["timestamp"].type)))
+    if status:
+        mask = pc.and_(mask, pc.equal(transactions["status"], status))
+    transactions = transactions.filter(mask).rename_columns(["transaction_id", "timestamp", "status", "is_trash"])
+
+    rows = items.join(transactions.select(["transaction_id", "timestamp"]), "transaction_id", join_type="inner")
+    # Decimal arithmetic so rollups reconcile to the cent
+    revenue = pc.multiply(pc.cast(rows["quantity"], pa.int64()), rows["price_per_unit"])
+    if "discount" in rows.column_names:
+        revenue = pc.subtract(revenue, pc.fill_null(rows["discount"], 0))
+    rows = rows.append_column("revenue", revenue)
+
+    keys = []
+    for key in group_by:
+        if key == "product":
+            keys.append("product_id")
+        elif key == "category":
+            products = load_table("products").select(["id", "category_id"]).rename_columns(["product_id", "category_id"])
+            rows = rows.join(products, "product_id", join_type="left outer")
+            keys.append("category_id")
+        else:
+            bucket = pc.floor_temporal(rows["timestamp"], unit=TIME_BUCKETS[key], week_starts_monday=True)
+            rows = rows.append_column(key, bucket)
+            keys.append(key)
+
+    grouped = rows.group_by(keys).aggregate([
+        ("revenue", "sum"),
+        ("quantity", "sum"),
+        ("transaction_id", "count_distinct"),
+    ]).rename_columns(keys + ["revenue", "units", "orders"])
+
+    if "category_id" in keys:
+        categories = load_table("categories").select(["id", "name"]).rename_columns(["category_id", "category_name"])
+        grouped = grouped.join(categories, "category_id", join_type="left outer")
+
+    if keys:
+        grouped = grouped.sort_by([(key, "ascending") for key in keys])
+    return grouped.to_pylist()
+
+
+@analytics_cli.command("refresh")
+def refresh_command():
+    """Copy new sales rows into the columnar snapshots."""
+    for table, count in refresh().items():
+        click.echo(f"{table}: {count}")
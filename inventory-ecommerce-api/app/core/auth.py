@@ -0,0 +1,291 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, g, request
+from flask.cli import AppGroup
+from flask_jwt_extended import create_access_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from sqlalchemy.exc import IntegrityError
+
+from app.core.models import Permission, RevokedToken, RolePermission, User
+from app.utils import metrics
+from app.utils.db_utils import db
+from app.utils.unit_of_work import transaction
+
+auth_cli = AppGroup("auth", help="Roles, permissions and token revocation.")
+
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class AuthError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class VerifiedToken:
+    __slots__ = ("key", "claims", "expires", "checked_against")
+
+    def __init__(self, key, claims, expires):
+        self.key = key
+        self.claims = claims
+        self.expires = expires
+        # Revocation filter this token was last found clean in
+        self.checked_against = None
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens keyed by token hash.
+
+    Entries are dropped once the token's own exp passes, so a cached token
+    is never accepted longer than a freshly verified one would be.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, now):
+        with self._lock:
+            verified = self._entries.get(key)
+            if verified is None:
+                return None
+            if verified.expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return verified
+
+    def put(self, verified, limit):
+        with self._lock:
+            self._entries[verified.key] = verified
+            self._entries.move_to_end(verified.key)
+            while len(self._entries) > limit:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class BloomFilter:
+    """Bloom filter sized for `capacity` items at the given false positive rate"""
+
+    # Small lists get the filter of a thousand entries to keep the hash count sane
+    MIN_CAPACITY = 1000
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, self.MIN_CAPACITY)
+        self.size = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing over one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class AuthState:
+    """Revocation filter and role permission bitmasks, reloaded every AUTH_RELOAD_SECONDS"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded_at = None
+        self.revoked = BloomFilter(1, 0.01)
+        self.bits = {}
+        self.masks = {}
+
+    def refresh(self, force=False):
+        interval = current_app.config["AUTH_RELOAD_SECONDS"]
+        if not force and self.loaded_at is not None and time.monotonic() - self.loaded_at < interval:
+            return
+        # One thread reloads, the others keep using the current snapshot
+        if not self._lock.acquire(blocking=force or self.loaded_at is None):
+            return
+        try:
+            if force or self.loaded_at is None or time.monotonic() - self.loaded_at >= interval:
+                self.load()
+        finally:
+            self._lock.release()
+
+    def load(self):
+        now = datetime.utcnow()
+        jtis = db.session.execute(
+            db.select(RevokedToken.jti).where(RevokedToken.expires_at > now)
+        ).scalars().all()
+        inactive = db.session.execute(
+            db.select(User.id).where(User.is_active == False)
+        ).scalars().all()
+        revoked = BloomFilter(len(jtis) + len(inactive), current_app.config["REVOCATION_ERROR_RATE"])
+        for jti in jtis:
+            revoked.add(jti)
+        for user_id in inactive:
+            revoked.add(f"user:{user_id}")
+
+        names = db.session.execute(db.select(Permission.name).order_by(Permission.id)).scalars()
+        bits = {name: 1 << index for index, name in enumerate(names)}
+        masks = defaultdict(int)
+        for role, name in db.session.execute(
+            db.select(RolePermission.role, Permission.name).join(Permission)
+        ):
+            masks[role] |= bits[name]
+
+        self.revoked, self.bits, self.masks = revoked, bits, dict(masks)
+        self.loaded_at = time.monotonic()
+        metrics.incr("auth.reloads")
+
+    def allowed(self, role, permission):
+        if role == current_app.config["ADMIN_ROLE"]:
+            return True
+        bit = self.bits.get(permission)
+        return bit is not None and self.masks.get(role, 0) & bit == bit
+
+    def is_revoked(self, claims):
+        """Bloom filter first; only a hit is confirmed against the database"""
+        jti = claims.get("jti")
+        if jti in self.revoked:
+            metrics.incr("auth.revocation.filter_hits")
+            if RevokedToken.query.filter_by(jti=jti).first():
+                return True
+        user_key = f"user:{claims['sub']}"
+        if user_key in self.revoked:
+            metrics.incr("auth.revocation.filter_hits")
+            user = db.session.get(User, int(claims["sub"]))
+            if user is None or not user.is_active:
+                return True
+        return False
+
+
+token_cache = TokenCache()
+state = AuthState()
+
+
+def issue_token(user):
+    """Access token carrying the user's role, so requests need no user lookup"""
+    return create_access_token(identity=str(user.id), additional_claims={"role": user.role})
+
+
+def verify(token):
+    """VerifiedToken for a valid access token, from the cache when it was verified before"""
+    now = time.time()
+    key = hashlib.sha256(token.encode()).digest()
+    verified = token_cache.get(key, now)
+    if verified is not None:
+        metrics.incr("auth.cache.hits")
+        return verified
+
+    metrics.incr("auth.cache.misses")
+    try:
+        claims = decode_token(token)
+    except (PyJWTError, JWTExtendedException) as e:
+        raise AuthError(f"Invalid token: {e}")
+    if claims.get("type") != "access":
+        raise AuthError("Invalid token: not an access token")
+    verified = VerifiedToken(key, claims, claims.get("exp", now))
+    token_cache.put(verified, current_app.config["TOKEN_CACHE_SIZE"])
+    return verified
+
+
+def authenticate(permission=None):
+    """Check the bearer token (and permission); the claims end up in g.jwt_claims.
+
+    Returns the VerifiedToken.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise AuthError("Missing bearer token")
+
+    verified = verify(token)
+    claims = verified.claims
+    state.refresh()
+    # Revocations only change on reload, which swaps the filter, or on logout,
+    # which evicts the token, so a token is checked once per filter
+    revoked = state.revoked
+    if verified.checked_against is not revoked:
+        if state.is_revoked(claims):
+            raise AuthError("Token has been revoked")
+        verified.checked_against = revoked
+    if permission and not state.allowed(claims.get("role"), permission):
+        raise AuthError(f"Missing permission {permission}", 403)
+
+    g.jwt_claims = claims
+    return verified
+
+
+def authorize_request():
+    """before_request hook: '<blueprint>:read' for safe methods, '<blueprint>:write' otherwise"""
+    action = "read" if request.method in SAFE_METHODS else "write"
+    try:
+        authenticate(f"{request.blueprint}:{action}")
+    except AuthError as e:
+        return {"error": e.message}, e.status
+    return None
+
+
+def revoke(verified):
+    """Revoke a token until it expires; revoking it again changes nothing"""
+    claims = verified.claims
+    with transaction():
+        if not RevokedToken.query.filter_by(jti=claims["jti"]).first():
+            try:
+                with db.session.begin_nested():
+                    db.session.add(RevokedToken(
+                        jti=claims["jti"],
+                        user_id=int(claims["sub"]),
+                        expires_at=datetime.utcfromtimestamp(claims["exp"]),
+                    ))
+            except IntegrityError:
+                # A concurrent logout revoked it first
+                pass
+    # Other processes pick it up on their next reload
+    state.revoked.add(claims["jti"])
+    token_cache.discard(verified.key)
+
+
+@auth_cli.command("grant")
+@click.argument("role")
+@click.argument("permissions", nargs=-1, required=True)
+def grant_command(role, permissions):
+    """Grant permissions such as products:read to a role."""
+    for name in permissions:
+        permission = Permission.query.filter_by(name=name).first()
+        if permission is None:
+            permission = Permission(name=name)
+            db.session.add(permission)
+            db.session.flush()
+        if not db.session.get(RolePermission, (role, permission.id)):
+            db.session.add(RolePermission(role=role, permission_id=permission.id))
+    db.session.commit()
+    click.echo(f"Granted {', '.join(permissions)} to {role}")
+
+
+@auth_cli.command("prune")
+def prune_command():
+    """Delete revocations of tokens that have expired anyway."""
+    deleted = RevokedToken.query.filter(
+        RevokedToken.expires_at <= datetime.utcnow() - timedelta(minutes=1)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} expired revocations")
@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from heapq import merge
+from itertools import chain
+from math import ceil
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.models import Product, Stock
+from app.schemas.product_schema import ProductSchema
+from app.utils import metrics
+from app.utils.db_utils import db
+from app.utils.soft_delete import with_trashed
+from app.utils.sparse import dump_fields
+
+# What the storefront shows of a product: the schema's fields, then its stock
+FIELDS = dump_fields(ProductSchema) + ("quantity", "available")
+_positions = {field: index for index, field in enumerate(FIELDS)}
+_schema = ProductSchema()
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+# Session.info key of the product ids a session's flushes touched
+TOUCHED = "catalog_touched"
+# Changed products loaded per query
+CHUNK = 1000
+
+
+class Entry:
+    """One product as the storefront shows it, serialized once"""
+    __slots__ = ("id", "category_id", "name", "values", "json")
+
+    def __init__(self, row):
+        body = _schema.dump(row._mapping)
+        body["quantity"] = row.on_hand or 0
+        body["available"] = (row.on_hand or 0) - (row.reserved or 0)
+        self.id = row.id
+        self.category_id = row.category_id
+        # Lowercased once for the name search
+        self.name = row.name.lower()
+        self.values = tuple(body[field] for field in FIELDS)
+        self.json = _encode(body).encode()
+
+    def pick(self, fields):
+        return {field: self.values[_positions[field]] for field in fields}
+
+
+class Snapshot:
+    """Immutable catalog: entries in id order, with their ids and per-category positions in arrays"""
+    __slots__ = ("entries", "ids", "by_category")
+
+    def __init__(self, entries, ids=None, by_category=None):
+        self.entries = entries
+        self.ids = ids if ids is not None else array("q", (entry.id for entry in entries))
+        if by_category is None:
+            by_category = defaultdict(lambda: array("l"))
+            for position, entry in enumerate(entries):
+                by_category[entry.category_id].append(position)
+            by_category = dict(by_category)
+        self.by_category = by_category
+
+    @classmethod
+    def build(cls, entries):
+        return cls(sorted(entries, key=lambda entry: entry.id))
+
+    def get(self, product_id):
+        position = bisect_left(self.ids, product_id)
+        if position < len(self.ids) and self.ids[position] == product_id:
+            return self.entries[position]
+        return None
+
+    def patched(self, changes):
+        """A copy with {product_id: Entry, or None for gone} applied.
+
+        Entries replaced in place keep the arrays; new, removed or
+        recategorized products rebuild them.
+        """
+        entries = list(self.entries)
+        for product_id, entry in changes.items():
+            position = bisect_left(self.ids, product_id)
+            found = position < len(self.ids) and self.ids[position] == product_id
+            if not (found and entry is not None and entry.category_id == entries[position].category_id):
+                break
+            entries[position] = entry
+        else:
+            return Snapshot(entries, self.ids, self.by_category)
+        kept = [entry for entry in self.entries if entry.id not in changes]
+        return Snapshot.build(kept + [entry for entry in changes.values() if entry is not None])
+
+    def page(self, page, count, name=None, category_ids=None):
+        """(entries, total) of a listing page, newest first.
+
+        `name` matches case-insensitively anywhere in the name; `category_ids`
+        limits the page to products in those categories.
+        """
+        if category_ids is None:
+            positions = range(len(self.entries) - 1, -1, -1)
+        else:
+            positions = merge(*(reversed(self.by_category[category_id])
+                                for category_id in category_ids if category_id in self.by_category),
+                              reverse=True)
+        if name:
+            name = name.lower()
+            positions = (position for position in positions if name in self.entries[position].name)
+        if not isinstance(positions, range):
+            positions = list(positions)
+        start = (page - 1) * count
+        return [self.entries[position] for position in positions[start:start + count]], len(positions)
+
+
+def page_count(total, count):
+    return ceil(total / count) if total else 0
+
+
+def _load(product_ids=None):
+    """Entries of live products, all of them or the given ids"""
+    query = (
+        db.select(*Product.__table__.columns, Stock.quantity.label("on_hand"), Stock.reserved)
+        .outerjoin(Stock, Stock.product_id == Product.id)
+        .where(Product.is_trash == False)
+    )
+    if product_ids is None:
+        return [Entry(row) for row in db.session.execute(query)]
+    product_ids = sorted(product_ids)
+    entries = []
+    for start in range(0, len(product_ids), CHUNK):
+        chunk = product_ids[start:start + CHUNK]
+        entries += [Entry(row) for row in db.session.execute(query.where(Product.id.in_(chunk)))]
+    return entries
+
+
+def _changed_since(since):
+    """Ids of products whose row or stock changed at or after `since`, trashed ones included"""
+    products = db.session.execute(
+        with_trashed(db.select(Product.id).where(Product.updated_at >= since))
+    ).scalars()
+    stocks = db.session.execute(
+        with_trashed(db.select(Stock.product_id).where(Stock.last_updated >= since))
+    ).scalars()
+    return set(products).union(stocks)
+
+
+class Catalog:
+    """The storefront's product snapshot.
+
+    Reads are served from memory for up to CATALOG_MAX_STALENESS seconds;
+    then only the products changed since the last refresh are reloaded.
+    Commits in this process mark it stale at once and hand over the
+    products they touched; other processes' changes are found by their
+    timestamps, reread CATALOG_COMMIT_WINDOW back as they are stamped at
+    flush, not commit. A full rebuild every CATALOG_REBUILD_SECONDS picks
+    up anything the deltas can't see.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._touched_lock = threading.Lock()
+        self.snapshot = None
+        self.loaded_at = None
+        self.built_at = None
+        self.since = None
+        self.changed = False
+        self.touched = set()
+
+    def add_touched(self, product_ids):
+        with self._touched_lock:
+            self.touched |= product_ids
+
+    def _take_touched(self):
+        with self._touched_lock:
+            touched, self.touched = self.touched, set()
+        return touched
+
+    def current(self):
+        max_age = current_app.config["CATALOG_MAX_STALENESS"]
+        if self.snapshot is not None and not self.changed and time.monotonic() - self.loaded_at < max_age:
+            return self.snapshot
+        # One thread refreshes; the others keep using the current snapshot,
+        # unless there is none yet or this process changed the catalog
+        if self._lock.acquire(blocking=self.snapshot is None or self.changed):
+            try:
+                if self.snapshot is None or self.changed or time.monotonic() - self.loaded_at >= max_age:
+                    self.refresh()
+            finally:
+                self._lock.release()
+        return self.snapshot
+
+    def refresh(self):
+        started = datetime.utcnow()
+        # Commits landing while this runs mark the catalog changed again
+        self.changed = False
+        touched = self._take_touched()
+        if self.snapshot is None or time.monotonic() - self.built_at >= current_app.config["CATALOG_REBUILD_SECONDS"]:
+            self.snapshot = Snapshot.build(_load())
+            self.built_at = time.monotonic()
+            metrics.incr("catalog.rebuilds")
+        else:
+            changed = _changed_since(self.since) | touched
+            if changed:
+                loaded = {entry.id: entry for entry in _load(changed)}
+                self.snapshot = self.snapshot.patched({product_id: loaded.get(product_id) for product_id in changed})
+                metrics.incr("catalog.products_reloaded", len(changed))
+            metrics.incr("catalog.refreshes")
+        self.since = started - timedelta(seconds=current_app.config["CATALOG_COMMIT_WINDOW"])
+        self.loaded_at = time.monotonic()
+
+
+catalog = Catalog()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_products(session, flush_context):
+    """Note the products this flush touched, for this process to reload once committed.
+
+    A deleted stock row leaves no last_updated behind, so its product is
+    stamped for the other processes' refreshes.
+    """
+    touched = session.info.setdefault(TOUCHED, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Product):
+            touched.add(obj.id)
+        elif isinstance(obj, Stock):
+            touched.add(obj.product_id)
+    product_ids = {obj.product_id for obj in session.deleted if isinstance(obj, Stock)}
+    if product_ids:
+        session.connection().execute(
+            db.update(Product.__table__)
+            .where(Product.__table__.c.id.in_(product_ids))
+            .values(updated_at=datetime.utcnow())
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_changed(session):
+    """Anything committed here may touch the catalog; the next read checks"""
+    touched = session.info.pop(TOUCHED, None)
+    if touched:
+        catalog.add_touched(touched)
+    catalog.changed = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_touched(session):
+    session.info.pop(TOUCHED, None)
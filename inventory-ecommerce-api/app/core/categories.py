@@ -0,0 +1,252 @@
+from collections import defaultdict
+from itertools import chain
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.models import Category, Product, Stock
+from app.utils.db_utils import db
+from app.utils.soft_delete import with_trashed
+
+categories_cli = AppGroup("categories", help="Category tree and subtree counts.")
+
+SEPARATOR = "/"
+
+
+class CategoryError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def subtree_range(path):
+    """(lower, upper) bounds of every path in the subtree rooted at `path`.
+
+    Paths end in the separator, so the subtree is the half-open range from
+    the path up to the path with its last character bumped: an index range
+    scan instead of a LIKE.
+    """
+    return path, path[:-1] + chr(ord(SEPARATOR) + 1)
+
+
+def in_subtree(column, path):
+    lower, upper = subtree_range(path)
+    return db.and_(column >= lower, column < upper)
+
+
+def ancestor_ids(path):
+    """Ids on a path from the root down to the category itself"""
+    return [int(part) for part in path.split(SEPARATOR) if part]
+
+
+@event.listens_for(Category, "after_insert")
+def _set_path(mapper, connection, category):
+    """Paths embed the category's own id, so they're written right after its INSERT"""
+    categories = Category.__table__
+    parent_path = ""
+    if category.parent_id is not None:
+        parent_path = connection.scalar(db.select(categories.c.path).where(categories.c.id == category.parent_id))
+    path = f"{parent_path}{category.id}{SEPARATOR}"
+    connection.execute(categories.update().where(categories.c.id == category.id).values(path=path))
+    set_committed_value(category, "path", path)
+
+
+def move(category, parent):
+    """Re-parent a category with its subtree, carrying its counts along"""
+    parent_id = parent.id if parent else None
+    if parent_id == category.parent_id:
+        return
+    if parent is not None and parent.path.startswith(category.path):
+        raise CategoryError("A category can't be moved under its own subtree")
+
+    old_path = category.path
+    new_path = f"{parent.path if parent else ''}{category.id}{SEPARATOR}"
+    deltas = defaultdict(lambda: [0, 0])
+    for ancestor_id in ancestor_ids(old_path)[:-1]:
+        deltas[ancestor_id][0] -= category.subtree_products
+        deltas[ancestor_id][1] -= category.subtree_stock
+    for ancestor_id in ancestor_ids(new_path)[:-1]:
+        deltas[ancestor_id][0] += category.subtree_products
+        deltas[ancestor_id][1] += category.subtree_stock
+    apply_deltas(db.session.connection(), deltas)
+
+    # Rewrite the prefix of every path in the subtree at once
+    db.session.execute(
+        db.update(Category)
+        .where(in_subtree(Category.path, old_path))
+        .values(path=new_path + db.func.substr(Category.path, len(old_path) + 1))
+        .execution_options(synchronize_session=False)
+    )
+    category.parent_id = parent_id
+    category.path = new_path
+
+
+def apply_deltas(connection, deltas):
+    """Add {category_id: [products, stock]} to the subtree counts of the categories given"""
+    rows = [
+        {"b_id": category_id, "b_products": products, "b_stock": stock}
+        for category_id, (products, stock) in sorted(deltas.items())
+        if products or stock
+    ]
+    if not rows:
+        return
+    categories = Category.__table__
+    # Ordered by id so concurrent writers lock shared ancestors in the same order
+    connection.execute(
+        categories.update()
+        .where(categories.c.id == bindparam("b_id"))
+        .values(
+            subtree_products=categories.c.subtree_products + bindparam("b_products"),
+            subtree_stock=categories.c.subtree_stock + bindparam("b_stock"),
+        ),
+        rows,
+    )
+
+
+def propagate(connection, deltas):
+    """Apply per-category deltas to each category and all of its ancestors"""
+    deltas = {category_id: delta for category_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    categories = Category.__table__
+    paths = connection.execute(
+        db.select(categories.c.id, categories.c.path).where(categories.c.id.in_(deltas))
+    ).all()
+    expanded = defaultdict(lambda: [0, 0])
+    for category_id, path in paths:
+        products, stock = deltas[category_id]
+        for ancestor_id in ancestor_ids(path):
+            expanded[ancestor_id][0] += products
+            expanded[ancestor_id][1] += stock
+    apply_deltas(connection, expanded)
+
+
+def add_stock(connection, stock_deltas):
+    """Subtree counts for {stock_id: delta} changed outside the ORM, e.g. by bulk statements"""
+    stocks = Stock.__table__
+    deltas = defaultdict(lambda: [0, 0])
+    for stock_id, category_id in connection.execute(
+        db.select(stocks.c.id, stocks.c.category_id)
+        .where(stocks.c.id.in_(stock_deltas), stocks.c.is_trash == False)
+    ):
+        deltas[category_id][1] += stock_deltas[stock_id]
+    propagate(connection, deltas)
+
+
+# What each tracked model adds to its category: products count once, stock by quantity
+TRACKED = {
+    Product: (("category_id", "is_trash"), lambda values: (1, 0)),
+    Stock: (("category_id", "is_trash", "quantity"), lambda values: (0, values["quantity"] or 0)),
+}
+
+
+def _values(state, names, before):
+    values = {}
+    for name in names:
+        history = state.attrs[name].history
+        if before and history.deleted:
+            values[name] = history.deleted[0]
+        elif not before and history.added:
+            values[name] = history.added[0]
+        else:
+            values[name] = state.attrs[name].value
+    return values
+
+
+def _contribution(values, count):
+    if values["is_trash"] or values["category_id"] is None:
+        return None
+    return values["category_id"], count(values)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_counts(session, flush_context):
+    """Fold product and stock changes of the flush into the subtree counts"""
+    deltas = defaultdict(lambda: [0, 0])
+    for obj in chain(session.new, session.dirty, session.deleted):
+        tracked = TRACKED.get(type(obj))
+        if tracked is None:
+            continue
+        names, count = tracked
+        state = inspect(obj)
+        before = None if obj in session.new else _contribution(_values(state, names, True), count)
+        after = None if obj in session.deleted else _contribution(_values(state, names, False), count)
+        if before == after:
+            continue
+        for contribution, sign in ((before, -1), (after, 1)):
+            if contribution:
+                category_id, (products, stock) = contribution
+                deltas[category_id][0] += sign * products
+                deltas[category_id][1] += sign * stock
+    if deltas:
+        propagate(session.connection(), deltas)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the old value when these are set, so the flush sees what to subtract
+for attribute in (Product.category_id, Product.is_trash, Stock.category_id, Stock.is_trash, Stock.quantity):
+    event.listen(attribute, "set", _load_old_value, active_history=True)
+
+
+@event.listens_for(Product.is_trash, "set")
+def _trash_stock(product, value, oldvalue, initiator):
+    """A product's stock is trashed and restored with it, so it leaves the subtree stock too"""
+    if value == oldvalue:
+        return
+    with db.session.no_autoflush:
+        stock = product.stock
+    if stock is not None:
+        stock.is_trash = value
+
+
+def _depth(category, categories):
+    depth = 0
+    while category.parent_id in categories and depth < len(categories):
+        category = categories[category.parent_id]
+        depth += 1
+    return depth
+
+
+def rebuild():
+    """Recompute every path and subtree count from parent ids and live rows"""
+    categories = {category.id: category for category in with_trashed(Category.query)}
+    for category in sorted(categories.values(), key=lambda category: _depth(category, categories)):
+        parent = categories.get(category.parent_id)
+        category.path = f"{parent.path if parent else ''}{category.id}{SEPARATOR}"
+        category.subtree_products = 0
+        category.subtree_stock = 0
+
+    counts = defaultdict(lambda: [0, 0])
+    for category_id, products in db.session.execute(
+        db.select(Product.category_id, db.func.count(Product.id)).group_by(Product.category_id)
+    ):
+        counts[category_id][0] += products
+    for category_id, stock in db.session.execute(
+        # Stock of trashed products doesn't count, whether or not the stock row was trashed with it
+        db.select(Stock.category_id, db.func.sum(Stock.quantity))
+        .join(Product, Product.id == Stock.product_id)
+        .group_by(Stock.category_id)
+    ):
+        counts[category_id][1] += stock or 0
+
+    for category_id, (products, stock) in counts.items():
+        if category_id not in categories:
+            continue
+        for ancestor_id in ancestor_ids(categories[category_id].path):
+            categories[ancestor_id].subtree_products += products
+            categories[ancestor_id].subtree_stock += stock
+    db.session.commit()
+    return len(categories)
+
+
+@categories_cli.command("rebuild")
+def rebuild_command():
+    """Recompute category paths and subtree counts from scratch."""
+    click.echo(f"Rebuilt {rebuild()} categories")
@@ -0,0 +1,16 @@
+from app.core.models import TransactionItem
+from app.utils.db_utils import db
+from app.utils.money import to_money
+
+
+def transaction_total(transaction_id):
+    """Total of a transaction's line items, summed by the database.
+
+    Call after the items have been flushed.
+    """
+    total = db.session.query(
+        db.func.coalesce(db.func.sum(
+            TransactionItem.quantity * TransactionItem.price_per_unit - TransactionItem.discount
+        ), 0)
+    ).filter(TransactionItem.transaction_id == transaction_id).scalar()
+    return to_money(total)
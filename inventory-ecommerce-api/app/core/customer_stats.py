@@ -0,0 +1,263 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, case
+from sqlalchemy.exc import IntegrityError
+
+from app.core import lifecycle
+from app.core.models import Customer, CustomerCategoryStats, CustomerStats, Product, Transaction, TransactionItem
+from app.utils.db_utils import db
+from app.utils.money import to_money
+from app.utils.soft_delete import INCLUDE_TRASHED
+from app.utils.unit_of_work import transaction
+
+customer_stats_cli = AppGroup("customer-stats", help="Customer purchase history summaries.")
+
+LINE_TOTAL = TransactionItem.quantity * TransactionItem.price_per_unit - TransactionItem.discount
+
+
+def _upsert(model, key, values, initial):
+    """Apply `values` to the row at `key`, creating it from `initial` when missing"""
+    update = (
+        db.update(model)
+        .where(*[getattr(model, name) == value for name, value in key.items()])
+        .values(values)
+    )
+    options = {"synchronize_session": False}
+    if db.session.execute(update, execution_options=options).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(model).values(**key, **initial))
+    except IntegrityError:
+        # A concurrent checkout created the row first
+        db.session.execute(update, execution_options=options)
+
+
+def record_purchase(transaction):
+    """Fold a checked-out transaction into its customer's stats.
+
+    Call after the items are flushed and the total is set, before the
+    checkout commits, so the stats change with the sale or not at all.
+    """
+    when = transaction.timestamp
+    total = to_money(transaction.total_amount)
+    _upsert(
+        CustomerStats,
+        {"customer_id": transaction.customer_id},
+        {
+            "order_count": CustomerStats.order_count + 1,
+            "total_spend": CustomerStats.total_spend + total,
+            "first_purchase_at": db.func.coalesce(CustomerStats.first_purchase_at, when),
+            "last_purchase_at": case(
+                (CustomerStats.last_purchase_at > when, CustomerStats.last_purchase_at), else_=when
+            ),
+        },
+        {"order_count": 1, "total_spend": total, "first_purchase_at": when, "last_purchase_at": when},
+    )
+
+    per_category = db.session.execute(
+        db.select(Product.category_id, db.func.sum(TransactionItem.quantity), db.func.sum(LINE_TOTAL))
+        .join(Product, Product.id == TransactionItem.product_id)
+        .where(TransactionItem.transaction_id == transaction.id, Product.category_id.isnot(None))
+        .group_by(Product.category_id)
+    ).all()
+    for category_id, units, spend in per_category:
+        spend = to_money(spend)
+        _upsert(
+            CustomerCategoryStats,
+            {"customer_id": transaction.customer_id, "category_id": category_id},
+            {
+                "units": CustomerCategoryStats.units + units,
+                "spend": CustomerCategoryStats.spend + spend,
+            },
+            {"units": units, "spend": spend},
+        )
+
+
+def top_categories(customer_ids, limit=None):
+    """{customer_id: [{"category_id", "spend"}, ...]} highest spend first, in one query"""
+    if not customer_ids:
+        return {}
+    limit = limit or current_app.config["CUSTOMER_TOP_CATEGORIES"]
+    rank = db.func.row_number().over(
+        partition_by=CustomerCategoryStats.customer_id,
+        order_by=(CustomerCategoryStats.spend.desc(), CustomerCategoryStats.category_id),
+    ).label("rank")
+    ranked = (
+        db.select(CustomerCategoryStats.customer_id, CustomerCategoryStats.category_id,
+                  CustomerCategoryStats.spend, rank)
+        .where(CustomerCategoryStats.customer_id.in_(customer_ids))
+        .subquery()
+    )
+    rows = db.session.execute(
+        db.select(ranked.c.customer_id, ranked.c.category_id, ranked.c.spend)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.customer_id, ranked.c.rank)
+    ).all()
+    result = {customer_id: [] for customer_id in customer_ids}
+    for customer_id, category_id, spend in rows:
+        result[customer_id].append({"category_id": category_id, "spend": float(spend)})
+    return result
+
+
+def _archived_history(customer_ids):
+    """(sales, lines) of the customers in archived months.
+
+    `lines` are (customer_id, item) pairs; trashed rows are left out like
+    they are from the hot tables.
+    """
+    sales, lines = [], []
+    for month in lifecycle.archived_months("transactions"):
+        month = lifecycle.parse_month(month)
+        found = [
+            row for row in lifecycle.read_archive_where("transactions", month, "customer_id", customer_ids)
+            if not row.get("is_trash")
+        ]
+        if not found:
+            continue
+        sales += found
+        customer_of = {row["id"]: row["customer_id"] for row in found}
+        lines += [
+            (customer_of[item["transaction_id"]], item)
+            for item in lifecycle.read_archive_where("transaction_items", month, "transaction_id", customer_of)
+            if not item.get("is_trash")
+        ]
+    return sales, lines
+
+
+def recompute(customer_ids):
+    """Rebuild the stats of some customers from their transactions, archived months included.
+
+    For edits that don't fit an increment, such as a transaction changed or
+    deleted after the fact. Doesn't commit.
+    """
+    # Creating missing rows first lets the chunk be locked against checkouts
+    existing = set(db.session.execute(
+        db.select(CustomerStats.customer_id).where(CustomerStats.customer_id.in_(customer_ids))
+    ).scalars())
+    missing = [{"customer_id": customer_id} for customer_id in customer_ids if customer_id not in existing]
+    if missing:
+        db.session.execute(db.insert(CustomerStats), missing)
+    db.session.execute(
+        db.select(CustomerStats.customer_id)
+        .where(CustomerStats.customer_id.in_(customer_ids))
+        .with_for_update()
+    ).all()
+
+    totals = {
+        row.customer_id: row._asdict() for row in db.session.execute(
+            db.select(
+                Transaction.customer_id,
+                db.func.count(Transaction.id).label("order_count"),
+                db.func.sum(Transaction.total_amount).label("total_spend"),
+                db.func.min(Transaction.timestamp).label("first_purchase_at"),
+                db.func.max(Transaction.timestamp).label("last_purchase_at"),
+            )
+            .where(Transaction.customer_id.in_(customer_ids))
+            .group_by(Transaction.customer_id)
+        )
+    }
+    archived_sales, archived_lines = _archived_history(customer_ids)
+    for sale in archived_sales:
+        row = totals.setdefault(sale["customer_id"], {
+            "order_count": 0, "total_spend": 0,
+            "first_purchase_at": sale["timestamp"], "last_purchase_at": sale["timestamp"],
+        })
+        row["order_count"] += 1
+        row["total_spend"] = to_money(row["total_spend"]) + to_money(sale["total_amount"])
+        row["first_purchase_at"] = min(row["first_purchase_at"], sale["timestamp"])
+        row["last_purchase_at"] = max(row["last_purchase_at"], sale["timestamp"])
+
+    stats = CustomerStats.__table__
+    db.session.execute(
+        stats.update()
+        .where(stats.c.customer_id == bindparam("b_customer_id"))
+        .values(
+            order_count=bindparam("b_order_count"),
+            total_spend=bindparam("b_total_spend"),
+            first_purchase_at=bindparam("b_first_purchase_at"),
+            last_purchase_at=bindparam("b_last_purchase_at"),
+        ),
+        [
+            {
+                "b_customer_id": customer_id,
+                "b_order_count": row["order_count"] if row else 0,
+                "b_total_spend": to_money(row["total_spend"]) if row else 0,
+                "b_first_purchase_at": row["first_purchase_at"] if row else None,
+                "b_last_purchase_at": row["last_purchase_at"] if row else None,
+            }
+            for customer_id, row in ((customer_id, totals.get(customer_id)) for customer_id in customer_ids)
+        ],
+    )
+
+    db.session.execute(
+        db.delete(CustomerCategoryStats).where(CustomerCategoryStats.customer_id.in_(customer_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    per_category = {
+        (customer_id, category_id): [units, to_money(spend)]
+        for customer_id, category_id, units, spend in db.session.execute(
+            db.select(Transaction.customer_id, Product.category_id,
+                      db.func.sum(TransactionItem.quantity), db.func.sum(LINE_TOTAL))
+            .join(TransactionItem, TransactionItem.transaction_id == Transaction.id)
+            .join(Product, Product.id == TransactionItem.product_id)
+            .where(Transaction.customer_id.in_(customer_ids), Product.category_id.isnot(None),
+                   Transaction.is_trash == False, TransactionItem.is_trash == False)
+            .group_by(Transaction.customer_id, Product.category_id)
+            # Sales of products trashed since still count towards their category
+            .execution_options(**{INCLUDE_TRASHED: True})
+        )
+    }
+    if archived_lines:
+        category_of = dict(db.session.execute(
+            db.select(Product.id, Product.category_id)
+            .where(Product.id.in_({item["product_id"] for _, item in archived_lines}))
+            .execution_options(**{INCLUDE_TRASHED: True})
+        ).all())
+        for customer_id, item in archived_lines:
+            category_id = category_of.get(item["product_id"])
+            if category_id is None:
+                continue
+            spend = to_money(item["quantity"] * to_money(item["price_per_unit"]) - to_money(item.get("discount") or 0))
+            summed = per_category.setdefault((customer_id, category_id), [0, to_money(0)])
+            summed[0] += item["quantity"]
+            summed[1] += spend
+    if per_category:
+        db.session.execute(db.insert(CustomerCategoryStats), [
+            {"customer_id": customer_id, "category_id": category_id, "units": units, "spend": spend}
+            for (customer_id, category_id), (units, spend) in per_category.items()
+        ])
+
+
+def backfill(batch_size=None, start_after=0):
+    """Recompute every customer's stats in id order, a chunk per transaction.
+
+    Each chunk locks its stats rows, so checkouts running meanwhile are
+    neither lost nor counted twice. Yields the last customer id of each
+    chunk, which `start_after` accepts to resume an interrupted run.
+    """
+    batch_size = batch_size or current_app.config["CUSTOMER_STATS_BATCH"]
+    last_id = start_after
+    while True:
+        customer_ids = db.session.execute(
+            db.select(Customer.id).where(Customer.id > last_id).order_by(Customer.id).limit(batch_size)
+        ).scalars().all()
+        if not customer_ids:
+            return
+        with transaction():
+            recompute(customer_ids)
+        last_id = customer_ids[-1]
+        yield last_id
+
+
+@customer_stats_cli.command("backfill")
+@click.option("--batch-size", default=None, type=int, help="Customers per chunk (CUSTOMER_STATS_BATCH).")
+@click.option("--start-after", default=0, type=int, help="Resume after this customer id.")
+def backfill_command(batch_size, start_after):
+    """Recompute customer stats from the existing transaction history."""
+    chunks = 0
+    for last_id in backfill(batch_size, start_after):
+        chunks += 1
+        click.echo(f"Recomputed customers up to id {last_id}")
+    click.echo(f"Backfilled {chunks} chunks")
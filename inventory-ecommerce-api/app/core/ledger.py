@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, tuple_
+
+from app.core.models import StockMovement, StockMovementDaily
+from app.utils.db_utils import db
+
+ledger_cli = AppGroup("ledger", help="Stock movement ledger rollups.")
+
+UNITS_IN = db.func.sum(case((StockMovement.quantity_change > 0, StockMovement.quantity_change), else_=0))
+UNITS_OUT = db.func.sum(case((StockMovement.quantity_change < 0, -StockMovement.quantity_change), else_=0))
+DAY = db.func.date(StockMovement.timestamp, type_=db.Date)
+
+
+def _window(query, start, end):
+    """Half-open [start, end) range on the movement timestamp"""
+    if start is not None:
+        query = query.where(StockMovement.timestamp >= start)
+    if end is not None:
+        query = query.where(StockMovement.timestamp < end)
+    return query
+
+
+def movements(product_id=None, movement_type=None, start=None, end=None, after=None, limit=50):
+    """A page of movements newest first and the (timestamp, id) to continue after.
+
+    Pages are keyset ranges on the (product_id | type, timestamp, id)
+    indexes, so a deep page costs the same as the first.
+    """
+    query = _window(db.select(StockMovement), start, end)
+    if product_id is not None:
+        query = query.where(StockMovement.product_id == product_id)
+    if movement_type is not None:
+        query = query.where(StockMovement.type == movement_type)
+    if after is not None:
+        query = query.where(tuple_(StockMovement.timestamp, StockMovement.id) < tuple_(*after))
+    rows = db.session.execute(
+        query.order_by(StockMovement.timestamp.desc(), StockMovement.id.desc()).limit(limit + 1)
+    ).scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].timestamp, rows[-1].id)
+
+
+def net_changes(product_ids, start=None, end=None, movement_type=None):
+    """{product_id: {"net", "in", "out", "movements"}} over a window, one grouped query"""
+    query = _window(
+        db.select(StockMovement.product_id, db.func.sum(StockMovement.quantity_change),
+                  UNITS_IN, UNITS_OUT, db.func.count(StockMovement.id))
+        .where(StockMovement.product_id.in_(product_ids)),
+        start, end,
+    )
+    if movement_type is not None:
+        query = query.where(StockMovement.type == movement_type)
+    result = {product_id: {"net": 0, "in": 0, "out": 0, "movements": 0} for product_id in product_ids}
+    for product_id, net, units_in, units_out, count in db.session.execute(query.group_by(StockMovement.product_id)):
+        result[product_id] = {"net": net or 0, "in": units_in or 0, "out": units_out or 0, "movements": count}
+    return result
+
+
+def rollup(days=None, now=None):
+    """Recompute the daily rollup for the last `days` days, today included, and commit.
+
+    Rerunning over days already rolled up picks up movements written late.
+    """
+    days = days or current_app.config["LEDGER_ROLLUP_DAYS"]
+    since = (now or datetime.utcnow()).date() - timedelta(days=days - 1)
+    db.session.execute(
+        db.delete(StockMovementDaily).where(StockMovementDaily.day >= since),
+        execution_options={"synchronize_session": False},
+    )
+    grouped = (
+        db.select(DAY, StockMovement.type, db.func.count(StockMovement.id), UNITS_IN, UNITS_OUT)
+        .where(StockMovement.timestamp >= datetime.combine(since, datetime.min.time()),
+               StockMovement.is_trash == False)
+        .group_by(DAY, StockMovement.type)
+    )
+    result = db.session.execute(
+        db.insert(StockMovementDaily).from_select(
+            ["day", "type", "movements", "units_in", "units_out"], grouped
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _row(day, movement_type, movements, units_in, units_out):
+    return {"day": str(day)[:10], "type": movement_type, "movements": movements,
+            "units_in": units_in or 0, "units_out": units_out or 0}
+
+
+def daily(start=None, end=None, movement_type=None):
+    """Movements per day and type between the `start` and `end` dates, inclusive.
+
+    Days before the latest rolled up one come from the rollup; that day and
+    later ones, which may still be changing, are grouped from the ledger.
+    """
+    rolled_through = db.session.execute(db.select(db.func.max(StockMovementDaily.day))).scalar()
+    rows = []
+    if rolled_through is not None and (start is None or start < rolled_through):
+        query = db.select(StockMovementDaily).where(StockMovementDaily.day < rolled_through)
+        if start is not None:
+            query = query.where(StockMovementDaily.day >= start)
+        if end is not None:
+            query = query.where(StockMovementDaily.day <= end)
+        if movement_type is not None:
+            query = query.where(StockMovementDaily.type == movement_type)
+        rows += [
+            _row(row.day, row.type, row.movements, row.units_in, row.units_out)
+            for row in db.session.execute(query).scalars()
+        ]
+
+    live_start = max(filter(None, (start, rolled_through)), default=None)
+    if end is None or live_start is None or live_start <= end:
+        query = _window(
+            db.select(DAY, StockMovement.type, db.func.count(StockMovement.id), UNITS_IN, UNITS_OUT),
+            datetime.combine(live_start, datetime.min.time()) if live_start else None,
+            datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None,
+        )
+        if movement_type is not None:
+            query = query.where(StockMovement.type == movement_type)
+        rows += [_row(*row) for row in db.session.execute(query.group_by(DAY, StockMovement.type))]
+    return sorted(rows, key=lambda row: (row["day"], row["type"]))
+
+
+@ledger_cli.command("rollup")
+@click.option("--days", default=None, type=int, help="Days back to recompute, today included (LEDGER_ROLLUP_DAYS).")
+def rollup_command(days):
+    """Roll stock movements up into per day and type totals."""
+    click.echo(f"Rolled up {rollup(days)} day and type rows")
@@ -0,0 +1,301 @@
+import logging
+import os
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from app.core.models import ReturnProduct, StockMovement, Transaction, TransactionItem
+from app.utils.db_utils import db
+from app.utils.soft_delete import with_trashed
+from app.utils.unit_of_work import transaction
+
+lifecycle_cli = AppGroup("lifecycle", help="Partition and archive history tables.")
+
+# Tables that are range partitioned by month on Postgres
+PARTITIONED_TABLES = ("stock_movements",)
+ARCHIVED_TABLES = ("transactions", "transaction_items", "return_products", "stock_movements")
+# Rows per Parquet row group; pages and filters read only the groups they need
+ARCHIVE_ROW_GROUP = 10000
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(value):
+    """Parse a YYYY-MM string into the first day of that month"""
+    return datetime.strptime(value, "%Y-%m")
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def is_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+
+def _create_partition(table, month):
+    """Create one month's partition of `table` unless it exists.
+
+    Postgres refuses a new partition while the default partition holds rows
+    in its range, as it does after a missed run. Then the default partition
+    is detached, the new one created, the parked rows moved into it and the
+    default attached again.
+    """
+    name = partition_name(table, month)
+    if db.session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+
+    start, end = f"{month:%Y-%m-%d}", f"{add_months(month, 1):%Y-%m-%d}"
+    create = f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+    default = f"{table}_default"
+    in_range = f"timestamp >= '{start}' AND timestamp < '{end}'"
+    parked = db.session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})")).scalar()
+    if not parked:
+        db.session.execute(text(create))
+        return True
+
+    db.session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    db.session.execute(text(create))
+    moved = db.session.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    )).rowcount
+    db.session.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    logging.warning(f"Moved {moved} rows of {name} out of {default}")
+    return True
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """Create monthly partitions from the current month up to `months_ahead`.
+
+    Only Postgres has native partitions; on other backends the tables stay
+    plain and month buckets are plain timestamp ranges over the index.
+    """
+    if not is_postgres():
+        return []
+
+    start = month_start(now or datetime.utcnow())
+    created = []
+    for table in PARTITIONED_TABLES:
+        for offset in range(months_ahead + 1):
+            month = add_months(start, offset)
+            with transaction():
+                _create_partition(table, month)
+            created.append(partition_name(table, month))
+    return created
+
+
+def archive_path(table, month):
+    return os.path.join(current_app.config["ARCHIVE_DIR"], table, f"{month:%Y-%m}.parquet")
+
+
+def archived_months(table):
+    """List archived months (YYYY-MM) for a table"""
+    folder = os.path.join(current_app.config["ARCHIVE_DIR"], table)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-len(".parquet")] for name in os.listdir(folder) if name.endswith(".parquet"))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for archiving history tables")
+    return pyarrow
+
+
+# Money columns of the history tables, kept as exact decimals of one type so
+# files written at different times concatenate
+MONEY_COLUMNS = ("price", "price_per_unit", "discount", "total_amount")
+MONEY_TYPE = (12, 2)
+
+
+def arrow_table(columns, rows):
+    """An Arrow table of `rows`, with money columns typed as MONEY_TYPE whatever their values"""
+    pa = _pyarrow()
+    money_type = pa.decimal128(*MONEY_TYPE)
+    return pa.table({
+        name: pa.array([row[i] for row in rows], type=money_type if name in MONEY_COLUMNS else None)
+        for i, name in enumerate(columns)
+    })
+
+
+def normalize_money(data):
+    """Cast money columns to MONEY_TYPE.
+
+    Older files stored them as floats, or as decimals sized to their values.
+    """
+    pa = _pyarrow()
+    money_type = pa.decimal128(*MONEY_TYPE)
+    for name in MONEY_COLUMNS:
+        if name not in data.column_names or data.schema.field(name).type == money_type:
+            continue
+        column = data[name]
+        if pa.types.is_floating(column.type):
+            column = pa.compute.round(column, 2)
+        column = pa.compute.cast(column, money_type, safe=False)
+        data = data.set_column(data.column_names.index(name), name, column)
+    return data
+
+
+def _write_parquet(table, month, columns, rows):
+    pa = _pyarrow()
+    path = archive_path(table, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    new_table = arrow_table(columns, rows)
+    if os.path.exists(path):
+        # Late rows for an already archived month are appended to its file
+        existing = normalize_money(pa.parquet.read_table(path))
+        known = set(existing.column("id").to_pylist())
+        keep = [row["id"] not in known for row in new_table.select(["id"]).to_pylist()]
+        new_table = pa.concat_tables([existing, new_table.filter(pa.array(keep))], promote_options="default")
+
+    tmp_path = path + ".tmp"
+    pa.parquet.write_table(new_table, tmp_path, compression="zstd", row_group_size=ARCHIVE_ROW_GROUP)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_archive(table, month, offset=0, limit=None):
+    """Read rows from an archived month as a list of dicts.
+
+    With a `limit`, only the row groups overlapping the requested rows are
+    read and decompressed.
+    """
+    pa = _pyarrow()
+    path = archive_path(table, month)
+    if not os.path.exists(path):
+        return None
+    if limit is None:
+        return pa.parquet.read_table(path).to_pylist()
+
+    archive = pa.parquet.ParquetFile(path)
+    groups, groups_start, row = [], 0, 0
+    for index in range(archive.num_row_groups):
+        rows = archive.metadata.row_group(index).num_rows
+        if row + rows > offset and row < offset + limit:
+            if not groups:
+                groups_start = row
+            groups.append(index)
+        row += rows
+    if not groups:
+        return []
+    return archive.read_row_groups(groups).slice(offset - groups_start, limit).to_pylist()
+
+
+def read_archive_where(table, month, column, values):
+    """Rows of an archived month whose `column` is one of `values`, as a list of dicts"""
+    pa = _pyarrow()
+    path = archive_path(table, month)
+    if not os.path.exists(path) or not values:
+        return []
+    # Row groups whose statistics rule the values out are skipped
+    return pa.parquet.read_table(path, filters=[(column, "in", list(values))]).to_pylist()
+
+
+def _select(model, condition):
+    columns = [column.name for column in model.__table__.columns]
+    # Trashed rows are history too
+    rows = db.session.execute(
+        with_trashed(db.select(*model.__table__.columns).where(condition).order_by(model.id))
+    ).all()
+    return columns, rows
+
+
+def archive_month(month):
+    """Move one month of transactions, their items and returns, and stock movements to Parquet.
+
+    Files are written before anything is deleted, so a failed run can simply
+    be repeated.
+    """
+    start, end = month, add_months(month, 1)
+    in_month = Transaction.timestamp >= start
+    in_month = in_month & (Transaction.timestamp < end)
+    transaction_ids = db.select(Transaction.id).where(in_month)
+    item_ids = db.select(TransactionItem.id).where(TransactionItem.transaction_id.in_(transaction_ids))
+
+    batches = {
+        "transactions": (Transaction, in_month),
+        "transaction_items": (TransactionItem, TransactionItem.id.in_(item_ids)),
+        # Returns go with the month of the sale they reference
+        "return_products": (ReturnProduct, ReturnProduct.transaction_item_id.in_(item_ids)),
+        "stock_movements": (StockMovement, (StockMovement.timestamp >= start) & (StockMovement.timestamp < end)),
+    }
+
+    archived = {}
+    for table, (model, condition) in batches.items():
+        columns, rows = _select(model, condition)
+        if rows:
+            _write_parquet(table, month, columns, rows)
+        archived[table] = len(rows)
+
+    try:
+        # Children first: returns reference their item, items their transaction
+        for table in ("return_products", "transaction_items", "transactions", "stock_movements"):
+            model, condition = batches[table]
+            if table in PARTITIONED_TABLES and is_postgres():
+                name = partition_name(table, month)
+                db.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                # Rows that landed in the default partition
+                db.session.execute(db.delete(model).where(condition))
+            else:
+                db.session.execute(db.delete(model).where(condition))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logging.info(f"Archived {month:%Y-%m}: {archived}")
+    return archived
+
+
+def archive_before(cutoff):
+    """Archive every month older than `cutoff` that still has hot rows"""
+    oldest = with_trashed(db.session.query(db.func.min(Transaction.timestamp))).scalar()
+    oldest_movement = with_trashed(db.session.query(db.func.min(StockMovement.timestamp))).scalar()
+    candidates = [value for value in (oldest, oldest_movement) if value is not None]
+    if not candidates:
+        return {}
+
+    results = {}
+    month = month_start(min(candidates))
+    while month < cutoff:
+        results[f"{month:%Y-%m}"] = archive_month(month)
+        month = add_months(month, 1)
+    return results
+
+
+@lifecycle_cli.command("create-partitions")
+@click.option("--months-ahead", default=3, show_default=True)
+def create_partitions_command(months_ahead):
+    """Create upcoming monthly partitions."""
+    created = ensure_partitions(months_ahead)
+    click.echo(f"Ensured {len(created)} partitions")
+
+
+@lifecycle_cli.command("archive")
+@click.option("--keep-months", default=None, type=int,
+              help="Months kept in the database (defaults to ARCHIVE_KEEP_MONTHS).")
+def archive_command(keep_months):
+    """Archive cold months to Parquet and pre-create upcoming partitions."""
+    if keep_months is None:
+        keep_months = current_app.config["ARCHIVE_KEEP_MONTHS"]
+    cutoff = add_months(month_start(datetime.utcnow()), -keep_months)
+    results = archive_before(cutoff)
+    ensure_partitions()
+    for month, counts in results.items():
+        click.echo(f"{month}: {counts}")
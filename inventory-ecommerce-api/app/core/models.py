@@ -1,30 +1,40 @@
 from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.utils.db_utils import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.money import Money
+from app.utils.soft_delete import SoftDeleteMixin, live_index
+from app.core.passwords import check_password, hash_password
 
 
-class CartItem(db.Model):
+class CartItem(SoftDeleteMixin, db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        live_index('ix_cart_items_live_cart_product', 'cart_id', 'product_id'),
+    )
 
     id = db.Column(Integer, primary_key=True)
     cart_id = db.Column(Integer, ForeignKey('carts.id'), nullable=False)
     product_id = db.Column(Integer, ForeignKey('products.id'), nullable=False)
+    # The SKU, for products sold in variants
+    variant_id = db.Column(Integer, ForeignKey('product_variants.id'), nullable=True)
     quantity = db.Column(Integer, nullable=False)
-    is_trash = db.Column(db.Boolean(), default=False) 
 
 
     product = db.relationship('Product', back_populates='cart_items')
+    variant = db.relationship('ProductVariant')
     cart = db.relationship('Cart', back_populates='items')  
 
 
-class Cart(db.Model):
+class Cart(SoftDeleteMixin, db.Model):
     __tablename__ = 'carts'
+    __table_args__ = (
+        live_index('ix_carts_live_customer', 'customer_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, ForeignKey('customers.id'), nullable=False)  
-    is_trash = db.Column(db.Boolean(), default=False)  
     
     items = db.relationship('CartItem', back_populates='cart', lazy=True)
     customer = db.relationship('Customer', back_populates='carts')  
@@ -37,13 +47,24 @@ class Cart(db.Model):
     
 
 
-class Category(db.Model):
+class Category(SoftDeleteMixin, db.Model):
     __tablename__ = 'categories'
+    __table_args__ = (
+        live_index('ix_categories_live', 'id'),
+        db.Index('ix_categories_path', 'path'),
+        db.Index('ix_categories_parent', 'parent_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False, unique=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    # Ids from the root down, e.g. '1/4/7/'; a subtree is one range on this
+    # index (byte order on Postgres), see app.core.categories
+    path = db.Column(db.String(255).with_variant(postgresql.VARCHAR(255, collation='C'), 'postgresql'), nullable=True)
+    # Live products and units of stock in this category and all below it
+    subtree_products = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    subtree_stock = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     products = db.relationship('Product', backref='category', lazy=True)
-    is_trash = db.Column(db.Boolean(), default=False)  
     
     
     stocks = db.relationship("Stock", back_populates="category")
@@ -52,16 +73,28 @@ class Category(db.Model):
         return f"<Category {self.name}>"    
 
 
-class Product(db.Model):
+class Product(SoftDeleteMixin, db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        live_index('ix_products_live', 'id'),
+        live_index('ix_products_live_category', 'category_id', 'id'),
+        # Rows changed since the catalog snapshot's last refresh, see app.core.catalog
+        db.Index('ix_products_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(Money, nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
-    is_trash = db.Column(db.Boolean(), default=False) 
+    # Listing aggregates over the product's variants, see app.core.variants
+    variant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    variants_in_stock = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    price_min = db.Column(Money, nullable=True)
+    price_max = db.Column(Money, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     stock = db.relationship('Stock', back_populates='product', uselist=False)
+    variants = db.relationship('ProductVariant', back_populates='product')
     cart_items = db.relationship('CartItem', back_populates='product')
     transaction_items = db.relationship('TransactionItem', back_populates='product') 
     stock_movements = db.relationship('StockMovement', back_populates='product')
@@ -70,34 +103,116 @@ class Product(db.Model):
         return f'<Product {self.name}>'
     
 
-class Stock(db.Model):
+class ProductVariant(SoftDeleteMixin, db.Model):
+    """A SKU of a product, such as one size and color.
+
+    Its quantity is the part of the product's stock that is this SKU, so
+    the product Stock row and its locations stay the per-product aggregate.
+    """
+    __tablename__ = 'product_variants'
+    __table_args__ = (
+        live_index('ix_product_variants_live_product', 'product_id'),
+        db.CheckConstraint('quantity >= 0', name='ck_product_variants_quantity_nonnegative'),
+        db.CheckConstraint('reserved >= 0', name='ck_product_variants_reserved_nonnegative'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    sku = db.Column(db.String(64), nullable=False, unique=True)
+    # e.g. {"size": "M", "color": "red"}
+    attributes = db.Column(db.JSON, nullable=False, default=dict)
+    # Overrides the product price when set
+    price = db.Column(Money, nullable=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    product = db.relationship('Product', back_populates='variants')
+
+    @property
+    def available(self):
+        return self.quantity - (self.reserved or 0)
+
+    @property
+    def unit_price(self):
+        return self.price if self.price is not None else self.product.price
+
+    def __repr__(self):
+        return f'<ProductVariant {self.sku}>'
+
+
+
+class ProductPrice(db.Model):
+    """Append-only price history: the price a product had from `effective_from` on.
+
+    The price at a time T is the latest row at or before T, one descent of
+    the (product_id, effective_from) index; see app.core.prices.
+    """
+    __tablename__ = 'product_prices'
+    __table_args__ = (
+        db.Index('ix_product_prices_product_effective', 'product_id', 'effective_from', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    price = db.Column(Money, nullable=False)
+    effective_from = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProductPrice {self.product_id} {self.price} from {self.effective_from}>'
+
+
+
+class Stock(SoftDeleteMixin, db.Model):
     __tablename__ = 'stocks'
+    __table_args__ = (
+        live_index('ix_stocks_live_product', 'product_id'),
+        live_index('ix_stocks_live_quantity', 'quantity'),
+        # Backs up the guarded decrements in app.core.warehouses
+        db.CheckConstraint('quantity >= 0', name='ck_stocks_quantity_nonnegative'),
+        db.CheckConstraint('reserved >= 0', name='ck_stocks_reserved_nonnegative'),
+        db.Index('ix_stocks_last_updated', 'last_updated'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
+    # Units held by active cart reservations, see app.core.reservations
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
-    is_trash = db.Column(db.Boolean(), default=False) 
 
 
     product = db.relationship('Product', back_populates='stock')
     category = db.relationship('Category', back_populates='stocks')
+    # Per-warehouse quantities; `quantity` above is kept equal to their sum
+    locations = db.relationship('StockLocation', back_populates='stock')
     
 
+    @property
+    def available(self):
+        """Available-to-promise: on hand minus reserved"""
+        return self.quantity - (self.reserved or 0)
+
     def __repr__(self):
         return f'<Stock {self.id} - Product ID: {self.product_id}, Quantity: {self.quantity}>'
     
-class Transaction(db.Model):
+class Transaction(SoftDeleteMixin, db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        live_index('ix_transactions_live_timestamp', 'timestamp'),
+        # Customer stats are recomputed per customer from here, see app.core.customer_stats
+        live_index('ix_transactions_live_customer', 'customer_id'),
+        # Rows changed since the analytics snapshot's last refresh, see app.core.analytics
+        db.Index('ix_transactions_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cart_id = db.Column(db.Integer, db.ForeignKey('carts.id'), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    is_trash = db.Column(db.Boolean(), default=False)
+    total_amount = db.Column(Money, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     status = db.Column(db.String(50), nullable=False, default='pending')  
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
 
     cart = db.relationship('Cart', back_populates='transactions') 
@@ -106,32 +221,50 @@ class Transaction(db.Model):
     def __repr__(self):
         return f'<Transaction {self.id} - Total: {self.total_amount}>'
     
-class TransactionItem(db.Model):
+class TransactionItem(SoftDeleteMixin, db.Model):
     __tablename__ = 'transaction_items'
+    __table_args__ = (
+        live_index('ix_transaction_items_live_transaction', 'transaction_id'),
+        db.Index('ix_transaction_items_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'))
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
+    variant_id = db.Column(db.Integer, db.ForeignKey('product_variants.id'), nullable=True)
     quantity = db.Column(db.Integer, nullable=False)
-    price_per_unit = db.Column(db.Float, nullable=False)
-    is_trash = db.Column(db.Boolean(), default=False)  
+    price_per_unit = db.Column(Money, nullable=False)
+    # Line discount from the best matching promotion, see app.core.pricing
+    discount = db.Column(Money, nullable=False, default=0, server_default='0')
+    promotion_id = db.Column(db.Integer, db.ForeignKey('promotions.id'), nullable=True)
+    # Running total of units returned against this line, see app.core.returns
+    returned_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     transaction = db.relationship('Transaction', backref='items')
     product = db.relationship('Product')
 
 
-class ReturnProduct(db.Model):
+class ReturnProduct(SoftDeleteMixin, db.Model):
     __tablename__ = 'return_products'
+    __table_args__ = (
+        live_index('ix_return_products_live_product', 'product_id', 'timestamp'),
+        live_index('ix_return_products_live_item', 'transaction_item_id'),
+        live_index('ix_return_products_live_timestamp', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    # Nullable only for returns recorded before they were tied to a sale
+    transaction_item_id = db.Column(db.Integer, db.ForeignKey('transaction_items.id'), nullable=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=True)
     quantity = db.Column(db.Integer, nullable=False)
     reason = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    is_trash = db.Column(db.Boolean(), default=False) 
 
     product = db.relationship('Product', backref='returns')
+    transaction_item = db.relationship('TransactionItem', backref='returns')
 
     def __repr__(self):
         return f'<ReturnProduct {self.id} - Product ID: {self.product_id}, Quantity: {self.quantity}>'
@@ -149,46 +282,107 @@ class User(db.Model):
     customer = db.relationship('Customer', back_populates='user', uselist=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return check_password(self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.email}>'
 
-class Customer(db.Model):
+class Customer(SoftDeleteMixin, db.Model):
     __tablename__ = 'customers'
+    __table_args__ = (
+        live_index('ix_customers_live', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), nullable=False, unique=True)
     phone = db.Column(db.String(20), nullable=True)
-    is_trash = db.Column(db.Boolean(), default=False)
     
     user = db.relationship('User', back_populates='customer')
     carts = db.relationship('Cart', back_populates='customer')
     transactions = db.relationship('Transaction', back_populates='customer')
+    stats = db.relationship('CustomerStats', uselist=False, back_populates='customer')
 
     def __repr__(self):
         return f'<Customer {self.name}>'
 
-class StockMovement(db.Model):
+
+class CustomerStats(db.Model):
+    """Purchase history summary, kept current by checkout, see app.core.customer_stats"""
+    __tablename__ = 'customer_stats'
+    # Customer listings sort and range-filter on these, id breaking ties
+    __table_args__ = (
+        db.Index('ix_customer_stats_order_count', 'order_count', 'customer_id'),
+        db.Index('ix_customer_stats_total_spend', 'total_spend', 'customer_id'),
+        db.Index('ix_customer_stats_last_purchase', 'last_purchase_at', 'customer_id'),
+    )
+
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_spend = db.Column(Money, nullable=False, default=0, server_default='0')
+    first_purchase_at = db.Column(db.DateTime, nullable=True)
+    last_purchase_at = db.Column(db.DateTime, nullable=True)
+
+    customer = db.relationship('Customer', back_populates='stats')
+
+    def __repr__(self):
+        return f'<CustomerStats {self.customer_id} - Orders: {self.order_count}, Spend: {self.total_spend}>'
+
+
+class CustomerCategoryStats(db.Model):
+    """Per customer spend by category, the source of a customer's top categories"""
+    __tablename__ = 'customer_category_stats'
+    __table_args__ = (
+        db.Index('ix_customer_category_stats_spend', 'customer_id', 'spend'),
+    )
+
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    spend = db.Column(Money, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<CustomerCategoryStats {self.customer_id}/{self.category_id} - Spend: {self.spend}>'
+
+class StockMovement(SoftDeleteMixin, db.Model):
     __tablename__ = 'stock_movements'
+    __table_args__ = (
+        # Ledger range scans and keyset pages, see app.core.ledger
+        live_index('ix_stock_movements_live_product_timestamp', 'product_id', 'timestamp', 'id'),
+        live_index('ix_stock_movements_live_type_timestamp', 'type', 'timestamp', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    variant_id = db.Column(db.Integer, db.ForeignKey('product_variants.id'), nullable=True)
     quantity_change = db.Column(db.Integer, nullable=False)
     type = db.Column(db.String(50), nullable=False)  # e.g., 'restock', 'sale', 'return'
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    is_trash = db.Column(db.Boolean(), default=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=True)
+    # Partition key on Postgres, see migrations/versions/a3f1c9d27b40
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     product = db.relationship('Product', back_populates='stock_movements')
 
     def __repr__(self):
         return f'<StockMovement {self.id} - Product ID: {self.product_id}, Change: {self.quantity_change}>'
 
+class StockMovementDaily(db.Model):
+    """Movements per day and type, rolled up from stock_movements by app.core.ledger"""
+    __tablename__ = 'stock_movement_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    type = db.Column(db.String(50), primary_key=True)
+    movements = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    units_in = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    units_out = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<StockMovementDaily {self.day} {self.type} - Movements: {self.movements}>'
+
 class Permission(db.Model):
     __tablename__ = 'permissions'
 
@@ -197,4 +391,117 @@ class Permission(db.Model):
     description = db.Column(db.String(255), nullable=True)
 
     def __repr__(self):
-        return f'<Permission {self.name}>'
\ No newline at end of file
+        return f'<Permission {self.name}>'
+
+
+class RolePermission(db.Model):
+    __tablename__ = 'role_permissions'
+
+    role = db.Column(db.String(50), primary_key=True)
+    permission_id = db.Column(db.Integer, db.ForeignKey('permissions.id'), primary_key=True)
+
+    permission = db.relationship('Permission')
+
+    def __repr__(self):
+        return f'<RolePermission {self.role} - Permission ID: {self.permission_id}>'
+
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Past this the token is rejected anyway, so it drops out of the revocation list
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+
+class Promotion(SoftDeleteMixin, db.Model):
+    __tablename__ = 'promotions'
+    __table_args__ = (
+        live_index('ix_promotions_live_product', 'product_id'),
+        live_index('ix_promotions_live_category', 'category_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)  # a key of app.core.pricing.RULE_KINDS
+    # Target a product, a category, or neither for the whole catalog
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    percent = db.Column(db.Numeric(5, 2), nullable=True)
+    buy_quantity = db.Column(db.Integer, nullable=True)
+    get_quantity = db.Column(db.Integer, nullable=True)
+    min_quantity = db.Column(db.Integer, nullable=True)
+    unit_price = db.Column(Money, nullable=True)
+    starts_at = db.Column(db.DateTime, nullable=True)
+    ends_at = db.Column(db.DateTime, nullable=True)
+    is_active = db.Column(db.Boolean(), nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Promotion {self.name}>'
+
+
+class Warehouse(SoftDeleteMixin, db.Model):
+    __tablename__ = 'warehouses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(20), nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    shipping_cost = db.Column(Money, nullable=False, default=0)  # per unit shipped
+    priority = db.Column(db.Integer, nullable=False, default=0)  # lower ships first on ties
+
+    locations = db.relationship('StockLocation', back_populates='warehouse')
+
+    def __repr__(self):
+        return f'<Warehouse {self.code}>'
+
+
+class StockLocation(db.Model):
+    __tablename__ = 'stock_locations'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'warehouse_id', name='uq_stock_locations_product_warehouse'),
+        db.CheckConstraint('quantity >= 0', name='ck_stock_locations_quantity_nonnegative'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    stock = db.relationship('Stock', back_populates='locations')
+    warehouse = db.relationship('Warehouse', back_populates='locations')
+
+    def __repr__(self):
+        return f'<StockLocation Product ID: {self.product_id}, Warehouse ID: {self.warehouse_id}, Quantity: {self.quantity}>'
+
+
+class StockReservation(db.Model):
+    __tablename__ = 'stock_reservations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cart_item_id = db.Column(db.Integer, db.ForeignKey('cart_items.id'), nullable=False, unique=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    variant_id = db.Column(db.Integer, db.ForeignKey('product_variants.id'), nullable=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    # The sweeper walks this index to expire holds in batches
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    cart_item = db.relationship('CartItem', backref=db.backref('reservation', uselist=False))
+
+    def __repr__(self):
+        return f'<StockReservation {self.id} - Product ID: {self.product_id}, Quantity: {self.quantity}>'
+
+
+# Subtree counts and price history follow product and stock changes through session events
+from app.core import categories, prices  # noqa: E402,F401
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.utils import metrics
+
+
+class PasswordPoolBusy(Exception):
+    """More hashing requests are queued than PASSWORD_QUEUE_DEPTH allows"""
+
+
+class HashingPool:
+    """Bounded process pool for password hashing, created lazily per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+
+    def _start(self, config):
+        with self._lock:
+            # A pool inherited across fork has no worker processes of ours
+            if self._executor is None or self._pid != os.getpid():
+                # Spawned workers only unpickle werkzeug's functions, never the app;
+                # niceness lets request handling win the CPU over hashing
+                self._executor = ProcessPoolExecutor(
+                    max_workers=config["PASSWORD_WORKERS"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=os.nice,
+                    initargs=(config["PASSWORD_WORKER_NICE"],),
+                )
+                self._slots = threading.BoundedSemaphore(config["PASSWORD_QUEUE_DEPTH"])
+                self._pid = os.getpid()
+
+    def run(self, fn, *args):
+        config = current_app.config
+        if not config["PASSWORD_WORKERS"]:
+            return fn(*args)
+
+        if self._pid != os.getpid():
+            self._start(config)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            metrics.incr("passwords.rejected")
+            raise PasswordPoolBusy("Too many password checks in progress")
+        try:
+            return self._executor.submit(fn, *args).result(timeout=config["PASSWORD_TIMEOUT"])
+        finally:
+            slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+pool = HashingPool()
+
+
+def hash_password(password):
+    """Hash with PASSWORD_HASH_METHOD in the hashing pool"""
+    metrics.incr("passwords.hashed")
+    return pool.run(generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def check_password(password_hash, password):
+    metrics.incr("passwords.checked")
+    return pool.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Whether the hash was made with another algorithm or cost than PASSWORD_HASH_METHOD"""
+    return password_hash.split("$", 1)[0] != current_app.config["PASSWORD_HASH_METHOD"]
+
+
+def verify_password(user, password):
+    """Check a user's password, upgrading an outdated hash in place on success"""
+    if not check_password(user.password_hash, password):
+        return False
+    if needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        metrics.incr("passwords.upgraded")
+    return True
@@ -0,0 +1,142 @@
+from datetime import datetime
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import bindparam, event, inspect
+from sqlalchemy.orm import Session
+
+from app.core.models import Product, ProductPrice
+from app.utils.db_utils import db
+from app.utils.money import to_money
+from app.utils.soft_delete import INCLUDE_TRASHED
+
+
+def _changed_price(session, product):
+    """The new price of a product created or repriced in the flush, else None"""
+    if product in session.new:
+        return product.price
+    history = inspect(product).attrs.price.history
+    if not history.added:
+        return None
+    if history.deleted and to_money(history.deleted[0]) == to_money(history.added[0]):
+        return None
+    return history.added[0]
+
+
+@event.listens_for(Session, "after_flush")
+def _record_prices(session, flush_context):
+    """Append a history row for every product created or repriced in the flush"""
+    when = datetime.utcnow()
+    rows = []
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, Product):
+            continue
+        price = _changed_price(session, obj)
+        if price is not None:
+            rows.append({"product_id": obj.id, "price": to_money(price), "effective_from": when})
+    if rows:
+        session.connection().execute(db.insert(ProductPrice.__table__), rows)
+
+
+def _load_old_price(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the old price when it's set, so an unchanged price writes no history
+event.listen(Product.price, "set", _load_old_price, active_history=True)
+
+
+def set_prices(changes, when=None):
+    """Reprice many products at once from {product_id: price}.
+
+    Products and their history rows are written with executemany in
+    PRICE_HISTORY_BATCH chunks, skipping prices that don't change. Returns
+    (repriced ids, ids of products not found). Doesn't commit.
+    """
+    batch = current_app.config["PRICE_HISTORY_BATCH"]
+    when = when or datetime.utcnow()
+    # Locked in id order, so concurrent updates of the same products queue up
+    current = dict(db.session.execute(
+        db.select(Product.id, Product.price)
+        .where(Product.id.in_(changes))
+        .order_by(Product.id)
+        .with_for_update()
+    ).all())
+    missing = [product_id for product_id in changes if product_id not in current]
+    changed = [
+        (product_id, to_money(price))
+        for product_id, price in sorted(changes.items())
+        if product_id in current and to_money(current[product_id]) != to_money(price)
+    ]
+
+    products = Product.__table__
+    connection = db.session.connection()
+    for start in range(0, len(changed), batch):
+        chunk = changed[start:start + batch]
+        connection.execute(
+            products.update().where(products.c.id == bindparam("b_id")).values(price=bindparam("b_price")),
+            [{"b_id": product_id, "b_price": price} for product_id, price in chunk],
+        )
+        connection.execute(
+            db.insert(ProductPrice.__table__),
+            [{"product_id": product_id, "price": price, "effective_from": when} for product_id, price in chunk],
+        )
+
+    repriced = {product_id for product_id, _ in changed}
+    # Products already loaded would otherwise keep the old price
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Product) and obj.id in repriced:
+            db.session.expire(obj, ["price"])
+    return sorted(repriced), missing
+
+
+def _in_effect(when):
+    """Id of the history row in effect at `when` for the enclosing Product row"""
+    return (
+        db.select(ProductPrice.id)
+        .where(ProductPrice.product_id == Product.id, ProductPrice.effective_from <= when)
+        .order_by(ProductPrice.effective_from.desc(), ProductPrice.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def prices_at(product_ids, when):
+    """{product_id: ProductPrice in effect at `when`}, one index descent per product.
+
+    Products priced only after `when`, or unknown, are left out.
+    """
+    if not product_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(ProductPrice)
+        .where(ProductPrice.id.in_(db.select(_in_effect(when)).where(Product.id.in_(product_ids))))
+        # Prices of products trashed since still answer for the past
+        .execution_options(**{INCLUDE_TRASHED: True})
+    ).scalars()
+    return {row.product_id: row for row in rows}
+
+
+def timelines(product_ids, start=None, end=None):
+    """{product_id: [ProductPrice, ...]} oldest first, for many products at once.
+
+    With a `start`, each timeline opens with the price in effect at that
+    time, so it covers the whole window.
+    """
+    result = {product_id: [] for product_id in product_ids}
+    if not product_ids:
+        return result
+    if start is not None:
+        for product_id, row in prices_at(product_ids, start).items():
+            result[product_id].append(row)
+
+    query = db.select(ProductPrice).where(ProductPrice.product_id.in_(product_ids))
+    if start is not None:
+        query = query.where(ProductPrice.effective_from > start)
+    if end is not None:
+        query = query.where(ProductPrice.effective_from <= end)
+    for row in db.session.execute(
+        query.order_by(ProductPrice.product_id, ProductPrice.effective_from, ProductPrice.id)
+    ).scalars():
+        result[row.product_id].append(row)
+    return result
@@ -0,0 +1,200 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from app.core.models import Promotion
+from app.utils.db_utils import db
+
+# Rule compilers by promotion kind. A compiler takes a Promotion row and
+# returns a function (quantity, unit_cents) -> line discount in cents.
+# Evaluation stays in integer cents; Decimals only appear at the edges.
+RULE_KINDS = {}
+# Promotion fields each kind needs
+REQUIRED_FIELDS = {}
+
+_lock = threading.Lock()
+_compiled = {}
+MAX_COMPILED = 10000
+
+
+def to_cents(amount):
+    return int(Decimal(amount).scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def rule_kind(name, requires=()):
+    """Register a compiler for a promotion kind needing the `requires` fields"""
+    def register(compiler):
+        RULE_KINDS[name] = compiler
+        REQUIRED_FIELDS[name] = requires
+        return compiler
+    return register
+
+
+def missing_fields(promotion):
+    """Fields the promotion's kind needs that it lacks"""
+    return [name for name in REQUIRED_FIELDS.get(promotion.kind, ()) if getattr(promotion, name) is None]
+
+
+@rule_kind("percent_off", requires=("percent",))
+def _percent_off(promotion):
+    basis_points = to_cents(promotion.percent)
+
+    def apply(quantity, unit_cents):
+        return (unit_cents * quantity * basis_points + 5000) // 10000
+    return apply
+
+
+@rule_kind("buy_x_get_y", requires=("buy_quantity", "get_quantity"))
+def _buy_x_get_y(promotion):
+    group = promotion.buy_quantity + promotion.get_quantity
+    free_per_group = promotion.get_quantity
+
+    def apply(quantity, unit_cents):
+        return unit_cents * (quantity // group * free_per_group)
+    return apply
+
+
+@rule_kind("tiered", requires=("min_quantity", "unit_price"))
+def _tiered(promotion):
+    # One row per tier; the best applicable tier wins like any other rule
+    min_quantity = promotion.min_quantity
+    tier_cents = to_cents(promotion.unit_price)
+
+    def apply(quantity, unit_cents):
+        if quantity < min_quantity or tier_cents >= unit_cents:
+            return 0
+        return (unit_cents - tier_cents) * quantity
+    return apply
+
+
+class CompiledRule:
+    __slots__ = ("id", "product_id", "category_id", "apply")
+
+    def __init__(self, promotion):
+        self.id = promotion.id
+        self.product_id = promotion.product_id
+        self.category_id = promotion.category_id
+        self.apply = RULE_KINDS[promotion.kind](promotion)
+        self.apply.rule_id = promotion.id
+
+
+class PricedLine:
+    __slots__ = ("product_id", "quantity", "unit_price", "discount_cents", "promotion_id")
+
+    def __init__(self, product_id, quantity, unit_price, discount_cents, promotion_id):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.discount_cents = discount_cents
+        self.promotion_id = promotion_id
+
+    @property
+    def discount(self):
+        return from_cents(self.discount_cents)
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity - self.discount
+
+
+def _compile(promotion):
+    """The promotion's CompiledRule, or None when it lacks fields its kind needs"""
+    key = (promotion.id, promotion.updated_at)
+    with _lock:
+        rule = _compiled.get(key)
+    if rule is None:
+        missing = missing_fields(promotion)
+        if missing:
+            # One broken promotion must not fail every checkout
+            logging.error(f"Skipping promotion {promotion.id}: {promotion.kind} without {', '.join(missing)}")
+            return None
+        rule = CompiledRule(promotion)
+        with _lock:
+            if len(_compiled) >= MAX_COMPILED:
+                _compiled.clear()
+            _compiled[key] = rule
+    return rule
+
+
+class RuleSet:
+    """Compiled rules indexed by what they target"""
+
+    __slots__ = ("by_product", "by_category", "catalog")
+
+    def __init__(self, rules):
+        by_product = defaultdict(list)
+        by_category = defaultdict(list)
+        catalog = []
+        for rule in rules:
+            if rule.product_id is not None:
+                by_product[rule.product_id].append(rule.apply)
+            elif rule.category_id is not None:
+                by_category[rule.category_id].append(rule.apply)
+            else:
+                catalog.append(rule.apply)
+        self.by_product = dict(by_product)
+        self.by_category = dict(by_category)
+        self.catalog = catalog
+
+
+def load_rules(product_ids, category_ids, now=None):
+    """Fetch the active promotions for a basket in one query, compiled"""
+    now = now or datetime.utcnow()
+    promotions = Promotion.query.filter(
+        Promotion.is_active == True,
+        Promotion.kind.in_(RULE_KINDS),
+        db.or_(Promotion.starts_at.is_(None), Promotion.starts_at <= now),
+        db.or_(Promotion.ends_at.is_(None), Promotion.ends_at > now),
+        db.or_(
+            Promotion.product_id.in_(product_ids),
+            Promotion.category_id.in_(category_ids),
+            db.and_(Promotion.product_id.is_(None), Promotion.category_id.is_(None)),
+        ),
+    ).all()
+    return RuleSet([rule for rule in map(_compile, promotions) if rule is not None])
+
+
+def evaluate(rules, lines):
+    """Price basket lines against a RuleSet in a single pass.
+
+    `lines` are (product_id, category_id, quantity, unit_price) tuples.
+    Promotions don't stack: each line gets the largest discount offered by
+    any rule targeting its product, its category or the whole catalog.
+    """
+    by_product = rules.by_product
+    by_category = rules.by_category
+    catalog = rules.catalog
+    cents_of = {}
+
+    no_rules = ()
+    priced = []
+    append = priced.append
+    for product_id, category_id, quantity, unit_price in lines:
+        unit_cents = cents_of.get(unit_price)
+        if unit_cents is None:
+            unit_cents = cents_of[unit_price] = to_cents(unit_price)
+
+        best, best_rule = 0, None
+        for group in (by_product.get(product_id, no_rules), by_category.get(category_id, no_rules), catalog):
+            for apply in group:
+                discount = apply(quantity, unit_cents)
+                if discount > best:
+                    best, best_rule = discount, apply.rule_id
+        # A discount never exceeds the line
+        if best > unit_cents * quantity:
+            best = unit_cents * quantity
+        append(PricedLine(product_id, quantity, unit_price, best, best_rule))
+    return priced
+
+
+def price_basket(lines, now=None):
+    """Load the basket's promotions and price every line"""
+    product_ids = {line[0] for line in lines}
+    category_ids = {line[1] for line in lines if line[1] is not None}
+    return evaluate(load_rules(product_ids, category_ids, now), lines)
@@ -0,0 +1,156 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.core import variants
+from app.core.models import Stock, StockReservation
+from app.utils.db_utils import db
+from app.utils.unit_of_work import transaction
+
+reservations_cli = AppGroup("reservations", help="Cart stock reservations.")
+
+
+class ReservationError(Exception):
+    def __init__(self, message, product_id=None):
+        super().__init__(message)
+        self.message = message
+        self.product_id = product_id
+
+
+def _change_reserved(product_id, delta):
+    """Move a product's reserved counter; increases only if enough is available"""
+    statement = db.update(Stock).where(Stock.product_id == product_id)
+    if delta > 0:
+        statement = statement.where(Stock.quantity - Stock.reserved >= delta)
+    result = db.session.execute(
+        statement.values(reserved=Stock.reserved + delta),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount == 1
+
+
+def hold(cart_item):
+    """Reserve stock for the cart item's full quantity and refresh its expiry.
+
+    Raises ReservationError when the product can't cover the extra units.
+    """
+    reservation = cart_item.reservation
+    held = reservation.quantity if reservation else 0
+    extra = cart_item.quantity - held
+
+    if extra and not _change_reserved(cart_item.product_id, extra):
+        raise ReservationError("Insufficient stock to reserve", cart_item.product_id)
+    # SKUs are held on their own counter as well as on the product's
+    if cart_item.variant_id and extra:
+        if not variants.change_reserved(cart_item.variant_id, extra):
+            raise ReservationError("Insufficient stock of the variant to reserve", cart_item.product_id)
+        variants.refresh([cart_item.product_id])
+
+    expires_at = datetime.utcnow() + timedelta(seconds=current_app.config["RESERVATION_TTL_SECONDS"])
+    if reservation is None:
+        reservation = StockReservation(
+            cart_item=cart_item,
+            product_id=cart_item.product_id,
+            variant_id=cart_item.variant_id,
+            quantity=cart_item.quantity,
+            expires_at=expires_at,
+        )
+        db.session.add(reservation)
+    else:
+        reservation.quantity = cart_item.quantity
+        reservation.expires_at = expires_at
+    return reservation
+
+
+def _give_back(held):
+    """Unreserve (product_id, variant_id, quantity) holds on products and SKUs"""
+    per_product = defaultdict(int)
+    per_variant = defaultdict(int)
+    for product_id, variant_id, quantity in held:
+        per_product[product_id] += quantity
+        if variant_id:
+            per_variant[variant_id] += quantity
+    for product_id, quantity in per_product.items():
+        _change_reserved(product_id, -quantity)
+    for variant_id, quantity in per_variant.items():
+        variants.change_reserved(variant_id, -quantity)
+    if per_variant:
+        variants.refresh(product_id for product_id, variant_id, _ in held if variant_id)
+
+
+def _release_rows(rows):
+    """Give back the held units of (id, product_id, variant_id, quantity) rows and delete them"""
+    if not rows:
+        return 0
+    _give_back([(product_id, variant_id, quantity) for _, product_id, variant_id, quantity in rows])
+    db.session.execute(
+        db.delete(StockReservation).where(StockReservation.id.in_([row[0] for row in rows])),
+        execution_options={"synchronize_session": False},
+    )
+    return len(rows)
+
+
+def release(cart_item_ids):
+    """Release the holds of the given cart items (removal or checkout)"""
+    if not cart_item_ids:
+        return 0
+    # Only the rows this delete removes are given back; a concurrent sweep
+    # gives back the ones it removed first
+    held = db.session.execute(
+        db.delete(StockReservation)
+        .where(StockReservation.cart_item_id.in_(cart_item_ids))
+        .returning(StockReservation.product_id, StockReservation.variant_id, StockReservation.quantity)
+    ).all()
+    _give_back(held)
+    return len(held)
+
+
+def own_hold(cart_item):
+    """Units held for this cart item.
+
+    An expired hold counts until the sweep removes it, as its units stay
+    reserved until then.
+    """
+    reservation = cart_item.reservation
+    return reservation.quantity if reservation else 0
+
+
+def sweep_expired(batch_size=None, now=None):
+    """Expire holds in batches along the expires_at index"""
+    batch_size = batch_size or current_app.config["RESERVATION_SWEEP_BATCH"]
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        with transaction():
+            rows = db.session.execute(
+                db.select(StockReservation.id, StockReservation.product_id, StockReservation.variant_id,
+                          StockReservation.quantity)
+                .where(StockReservation.expires_at <= now)
+                .order_by(StockReservation.expires_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            total += _release_rows(rows)
+        if len(rows) < batch_size:
+            break
+    return total
+
+
+@reservations_cli.command("sweep")
+@click.option("--interval", default=0, type=int,
+              help="Keep sweeping every N seconds instead of running once.")
+def sweep_command(interval):
+    """Expire cart reservations past their expiry."""
+    while True:
+        expired = sweep_expired()
+        if expired:
+            logging.info(f"Expired {expired} reservations")
+        if not interval:
+            click.echo(f"Expired {expired} reservations")
+            break
+        time.sleep(interval)
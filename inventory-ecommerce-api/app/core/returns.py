@@ -0,0 +1,102 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from app.core import variants
+from app.core.models import ReturnProduct, Stock, StockMovement, TransactionItem
+from app.core.warehouses import bulk_adjust_locations, default_warehouse
+from app.utils.db_utils import db
+
+
+class ReturnError(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid return lines")
+        self.errors = errors
+
+
+def process_returns(lines):
+    """Record returns against sold items and restock, all or nothing.
+
+    `lines` are dicts with transaction_item_id, quantity, reason and an
+    optional warehouse_id. The sold items are locked and validated against
+    their running returned_quantity, then every write is one set-based
+    statement regardless of the batch size. Raises ReturnError listing the
+    offending lines (by index) without writing anything.
+    """
+    requested = defaultdict(int)
+    for line in lines:
+        requested[line["transaction_item_id"]] += line["quantity"]
+
+    items = {
+        item.id: item
+        for item in TransactionItem.query
+        .filter(TransactionItem.id.in_(requested))
+        .with_for_update()
+    }
+    stock_ids = dict(db.session.execute(
+        db.select(Stock.product_id, Stock.id)
+        .where(Stock.product_id.in_({item.product_id for item in items.values()}))
+    ).all())
+
+    errors = []
+    for index, line in enumerate(lines):
+        item = items.get(line["transaction_item_id"])
+        if item is None:
+            errors.append({"index": index, "error": f"Transaction item {line['transaction_item_id']} not found"})
+        elif requested[item.id] > item.quantity - item.returned_quantity:
+            errors.append({"index": index, "error": (
+                f"Transaction item {item.id} has {item.quantity - item.returned_quantity} "
+                f"returnable units, {requested[item.id]} requested"
+            )})
+        elif item.product_id not in stock_ids:
+            errors.append({"index": index, "error": f"Stock not found for product {item.product_id}"})
+    if errors:
+        raise ReturnError(errors)
+
+    now = datetime.utcnow()
+    default_warehouse_id = None
+    rows, movements = [], []
+    restock = defaultdict(int)
+    restock_variants = defaultdict(int)
+    for line in lines:
+        item = items[line["transaction_item_id"]]
+        warehouse_id = line.get("warehouse_id")
+        if warehouse_id is None:
+            default_warehouse_id = default_warehouse_id or default_warehouse().id
+            warehouse_id = default_warehouse_id
+        rows.append({
+            "transaction_item_id": item.id,
+            "product_id": item.product_id,
+            "warehouse_id": warehouse_id,
+            "quantity": line["quantity"],
+            "reason": line["reason"],
+            "timestamp": now,
+        })
+        movements.append({
+            "product_id": item.product_id,
+            "variant_id": item.variant_id,
+            "quantity_change": line["quantity"],
+            "type": "return",
+            "warehouse_id": warehouse_id,
+            "timestamp": now,
+        })
+        restock[(stock_ids[item.product_id], item.product_id, warehouse_id)] += line["quantity"]
+        if item.variant_id:
+            restock_variants[item.variant_id] += line["quantity"]
+
+    ids = db.session.scalars(db.insert(ReturnProduct).returning(ReturnProduct.id), rows).all()
+    db.session.execute(db.insert(StockMovement), movements)
+
+    items_table = TransactionItem.__table__
+    db.session.execute(
+        items_table.update()
+        .where(items_table.c.id == bindparam("b_id"))
+        .values(returned_quantity=items_table.c.returned_quantity + bindparam("b_quantity")),
+        [{"b_id": item_id, "b_quantity": quantity} for item_id, quantity in requested.items()],
+    )
+    bulk_adjust_locations(restock)
+    if restock_variants:
+        variants.put_back(restock_variants)
+        variants.refresh(item.product_id for item in items.values() if item.variant_id)
+    return ids
@@ -0,0 +1,140 @@
+from sqlalchemy import bindparam, case
+
+from app.core.models import Product, ProductVariant, Stock, StockMovement
+from app.core.warehouses import adjust_location
+from app.utils.db_utils import db
+
+
+AGGREGATES = ("variant_count", "variants_in_stock", "price_min", "price_max")
+
+
+class VariantError(Exception):
+    def __init__(self, message, status=400, product_id=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.product_id = product_id
+
+
+def resolve(product, variant_id):
+    """The SKU a cart or sale line is for.
+
+    Products sold in variants need one; products without variants take none.
+    Raises VariantError otherwise.
+    """
+    if variant_id is None:
+        has_variants = db.session.execute(
+            db.select(ProductVariant.id).where(ProductVariant.product_id == product.id).limit(1)
+        ).first()
+        if has_variants:
+            raise VariantError(f"{product.name} is sold in variants, a variant_id is required", 400, product.id)
+        return None
+    variant = db.session.get(ProductVariant, variant_id)
+    if variant is None or variant.product_id != product.id:
+        raise VariantError("Variant not found for the product", 404, product.id)
+    return variant
+
+
+def change_reserved(variant_id, delta):
+    """Move a SKU's reserved counter; increases only if enough is available"""
+    statement = db.update(ProductVariant).where(ProductVariant.id == variant_id)
+    if delta > 0:
+        statement = statement.where(ProductVariant.quantity - ProductVariant.reserved >= delta)
+    result = db.session.execute(
+        statement.values(reserved=ProductVariant.reserved + delta),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount == 1
+
+
+def take(quantities):
+    """Take sold units out of SKUs, {variant_id: quantity}; False if any lacks them"""
+    for variant_id, quantity in sorted(quantities.items()):
+        result = db.session.execute(
+            db.update(ProductVariant)
+            .where(ProductVariant.id == variant_id, ProductVariant.quantity - ProductVariant.reserved >= quantity)
+            .values(quantity=ProductVariant.quantity - quantity),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount != 1:
+            return False
+    return True
+
+
+def put_back(quantities):
+    """Return units to SKUs, {variant_id: quantity}"""
+    if not quantities:
+        return
+    variants = ProductVariant.__table__
+    db.session.execute(
+        variants.update()
+        .where(variants.c.id == bindparam("b_id"))
+        .values(quantity=variants.c.quantity + bindparam("b_quantity")),
+        [{"b_id": variant_id, "b_quantity": quantity} for variant_id, quantity in sorted(quantities.items())],
+    )
+
+
+def set_quantity(variant, quantity, warehouse_id=None):
+    """Count a SKU's stock, moving the product aggregate and logging the movement"""
+    delta = quantity - (variant.quantity or 0)
+    if not delta:
+        return
+    stock = Stock.query.filter_by(product_id=variant.product_id).first()
+    if stock is None:
+        stock = Stock(product_id=variant.product_id, quantity=0, category_id=variant.product.category_id)
+        db.session.add(stock)
+    location = adjust_location(stock, delta, warehouse_id)
+    variant.quantity = quantity
+    db.session.add(StockMovement(
+        product_id=variant.product_id,
+        variant_id=variant.id,
+        quantity_change=delta,
+        type='restock' if delta > 0 else 'adjustment',
+        warehouse_id=location.warehouse_id,
+    ))
+
+
+def refresh(product_ids):
+    """Recompute the listing aggregates of products in one grouped query.
+
+    Call whenever a variant is added or removed, or its price or stock changes.
+    Products without variants get their own price as the range.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    db.session.flush()
+    price = db.func.coalesce(ProductVariant.price, Product.price)
+    rows = db.session.execute(
+        db.select(
+            Product.id,
+            db.func.count(ProductVariant.id),
+            db.func.sum(case((ProductVariant.quantity - ProductVariant.reserved > 0, 1), else_=0)),
+            db.func.min(price),
+            db.func.max(price),
+        )
+        .outerjoin(ProductVariant, ProductVariant.product_id == Product.id)
+        .where(Product.id.in_(product_ids))
+        .group_by(Product.id)
+    ).all()
+    if not rows:
+        return
+    products = Product.__table__
+    db.session.execute(
+        products.update()
+        .where(products.c.id == bindparam("b_id"))
+        .values(
+            variant_count=bindparam("b_count"),
+            variants_in_stock=bindparam("b_in_stock"),
+            price_min=bindparam("b_min"),
+            price_max=bindparam("b_max"),
+        ),
+        [
+            {"b_id": product_id, "b_count": count, "b_in_stock": in_stock or 0, "b_min": low, "b_max": high}
+            for product_id, count, in_stock, low, high in rows
+        ],
+    )
+    # Products already loaded would otherwise keep the old aggregates
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Product) and obj.id in product_ids:
+            db.session.expire(obj, AGGREGATES)
@@ -0,0 +1,242 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam
+
+from app.core import categories
+from app.core.models import Stock, StockLocation, Warehouse
+from app.utils.db_utils import db
+
+STRATEGIES = ("nearest", "cheapest")
+
+
+class AllocationError(Exception):
+    def __init__(self, message, product_id=None):
+        super().__init__(message)
+        self.message = message
+        self.product_id = product_id
+
+
+class Allocation:
+    __slots__ = ("product_id", "warehouse_id", "quantity", "location")
+
+    def __init__(self, location, quantity):
+        self.product_id = location.product_id
+        self.warehouse_id = location.warehouse_id
+        self.quantity = quantity
+        self.location = location
+
+    def to_dict(self):
+        return {"product_id": self.product_id, "warehouse_id": self.warehouse_id, "quantity": self.quantity}
+
+
+def default_warehouse():
+    """The warehouse that receives stock changes not tied to a location"""
+    code = current_app.config["DEFAULT_WAREHOUSE_CODE"]
+    warehouse = Warehouse.query.filter_by(code=code).first()
+    if warehouse is None:
+        warehouse = Warehouse(code=code, name=code)
+        db.session.add(warehouse)
+        db.session.flush()
+    return warehouse
+
+
+def adjust_location(stock, delta, warehouse_id=None):
+    """Change one location's quantity and the product aggregate together.
+
+    Callers never touch `Stock.quantity` directly, so it always equals the
+    sum of the product's locations without being recomputed on reads.
+    """
+    if warehouse_id is None:
+        warehouse_id = default_warehouse().id
+
+    location = next((loc for loc in stock.locations if loc.warehouse_id == warehouse_id), None)
+    if location is None:
+        location = StockLocation(stock=stock, product_id=stock.product_id, warehouse_id=warehouse_id, quantity=0)
+        db.session.add(location)
+
+    location.quantity += delta
+    stock.quantity = (stock.quantity or 0) + delta
+    return location
+
+
+def bulk_adjust_locations(deltas):
+    """Set-based adjust_location for {(stock_id, product_id, warehouse_id): delta}.
+
+    Missing locations are inserted, then locations and product aggregates are
+    changed with one executemany UPDATE each.
+    """
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    locations = StockLocation.__table__
+    stocks = Stock.__table__
+
+    product_ids = {product_id for _, product_id, _ in deltas}
+    existing = set(db.session.execute(
+        db.select(StockLocation.product_id, StockLocation.warehouse_id)
+        .where(StockLocation.product_id.in_(product_ids))
+    ).all())
+    missing = [
+        {"stock_id": stock_id, "product_id": product_id, "warehouse_id": warehouse_id,
+         "quantity": 0, "last_updated": now}
+        for stock_id, product_id, warehouse_id in deltas
+        if (product_id, warehouse_id) not in existing
+    ]
+    if missing:
+        db.session.execute(db.insert(StockLocation), missing)
+
+    db.session.execute(
+        locations.update()
+        .where(locations.c.product_id == bindparam("b_product_id"),
+               locations.c.warehouse_id == bindparam("b_warehouse_id"))
+        .values(quantity=locations.c.quantity + bindparam("b_delta"), last_updated=now),
+        [{"b_product_id": product_id, "b_warehouse_id": warehouse_id, "b_delta": delta}
+         for (_, product_id, warehouse_id), delta in deltas.items()],
+    )
+
+    per_stock = defaultdict(int)
+    for (stock_id, _, _), delta in deltas.items():
+        per_stock[stock_id] += delta
+    db.session.execute(
+        stocks.update()
+        .where(stocks.c.id == bindparam("b_stock_id"))
+        .values(quantity=stocks.c.quantity + bindparam("b_delta"), last_updated=now),
+        [{"b_stock_id": stock_id, "b_delta": delta} for stock_id, delta in per_stock.items()],
+    )
+    # Bypasses the ORM, so category subtree counts are told directly
+    categories.add_stock(db.session.connection(), per_stock)
+
+
+def _distance_km(warehouse, ship_to):
+    if warehouse.latitude is None or warehouse.longitude is None:
+        return float("inf")
+    lat1, lon1 = math.radians(warehouse.latitude), math.radians(warehouse.longitude)
+    lat2, lon2 = math.radians(ship_to["lat"]), math.radians(ship_to["lon"])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def _rank(strategy, ship_to):
+    if strategy == "cheapest":
+        return lambda warehouse: (warehouse.shipping_cost or 0, warehouse.priority, warehouse.id)
+    if ship_to:
+        return lambda warehouse: (_distance_km(warehouse, ship_to), warehouse.priority, warehouse.id)
+    return lambda warehouse: (warehouse.priority, warehouse.id)
+
+
+def allocate(lines, strategy=None, split=True, ship_to=None):
+    """Choose the locations that fulfil a basket.
+
+    `lines` are (product_id, quantity) pairs. All candidate locations for
+    the basket are read and locked with one query. A single warehouse that
+    can ship everything is preferred; otherwise, when `split` is allowed,
+    each product is taken from the best ranked locations in turn.
+    """
+    strategy = strategy or current_app.config["FULFILLMENT_STRATEGY"]
+    if strategy not in STRATEGIES:
+        raise AllocationError(f"Unknown fulfillment strategy {strategy}")
+    if ship_to is not None and not (
+        isinstance(ship_to, dict)
+        and isinstance(ship_to.get("lat"), (int, float))
+        and isinstance(ship_to.get("lon"), (int, float))
+    ):
+        raise AllocationError("ship_to must have numeric lat and lon")
+
+    needed = defaultdict(int)
+    for product_id, quantity in lines:
+        needed[product_id] += quantity
+
+    rows = db.session.query(StockLocation, Warehouse) \
+        .join(Warehouse, Warehouse.id == StockLocation.warehouse_id) \
+        .filter(StockLocation.product_id.in_(needed), StockLocation.quantity > 0) \
+        .with_for_update(of=StockLocation) \
+        .all()
+
+    rank = _rank(strategy, ship_to)
+    by_product = defaultdict(list)
+    by_warehouse = defaultdict(dict)
+    warehouses = {}
+    for location, warehouse in rows:
+        by_product[location.product_id].append((rank(warehouse), location))
+        by_warehouse[warehouse.id][location.product_id] = location
+        warehouses[warehouse.id] = warehouse
+
+    complete = [
+        warehouse_id for warehouse_id, locations in by_warehouse.items()
+        if all(product_id in locations and locations[product_id].quantity >= quantity
+               for product_id, quantity in needed.items())
+    ]
+    if complete:
+        best = min(complete, key=lambda warehouse_id: rank(warehouses[warehouse_id]))
+        return [Allocation(by_warehouse[best][product_id], quantity) for product_id, quantity in needed.items()]
+
+    if not split:
+        raise AllocationError("No single warehouse can fulfil the whole basket")
+
+    allocations = []
+    for product_id, quantity in needed.items():
+        remaining = quantity
+        for _, location in sorted(by_product[product_id], key=lambda candidate: candidate[0]):
+            take = min(remaining, location.quantity)
+            allocations.append(Allocation(location, take))
+            remaining -= take
+            if not remaining:
+                break
+        if remaining:
+            raise AllocationError(f"Insufficient stock for product {product_id}", product_id)
+    return allocations
+
+
+def take_allocations(allocations):
+    """Take allocated quantities out of their locations and the product aggregates.
+
+    Each decrement is one guarded UPDATE that only matches while enough is
+    left: a location keeps its quantity at or above zero, a product keeps
+    the units carts hold. Nothing is read and written back, so concurrent
+    sales can't both take the last units. Returns False when a guard fails;
+    the caller rolls back.
+    """
+    now = datetime.utcnow()
+    options = {"synchronize_session": False}
+    per_stock = defaultdict(int)
+    # Always in the same order, so concurrent checkouts lock rows without deadlocking
+    for allocation in sorted(allocations, key=lambda allocation: (allocation.product_id, allocation.warehouse_id)):
+        result = db.session.execute(
+            db.update(StockLocation)
+            .where(StockLocation.id == allocation.location.id, StockLocation.quantity >= allocation.quantity)
+            .values(quantity=StockLocation.quantity - allocation.quantity, last_updated=now),
+            execution_options=options,
+        )
+        if result.rowcount != 1:
+            return False
+        per_stock[allocation.location.stock_id] += allocation.quantity
+
+    for stock_id, quantity in sorted(per_stock.items()):
+        result = db.session.execute(
+            db.update(Stock)
+            .where(Stock.id == stock_id, Stock.quantity - Stock.reserved >= quantity)
+            .values(quantity=Stock.quantity - quantity, last_updated=now),
+            execution_options=options,
+        )
+        if result.rowcount != 1:
+            return False
+    # Bypasses the ORM, so category subtree counts are told directly
+    categories.add_stock(db.session.connection(), {stock_id: -quantity for stock_id, quantity in per_stock.items()})
+
+    # Rows already loaded would otherwise keep the old quantities
+    for allocation in allocations:
+        db.session.expire(allocation.location, ["quantity", "last_updated"])
+        if allocation.location.stock is not None:
+            db.session.expire(allocation.location.stock, ["quantity", "last_updated"])
+    return True
+
+
+def shipments(allocations):
+    """Group allocations by shipping warehouse for the API response"""
+    grouped = defaultdict(list)
+    for allocation in allocations:
+        grouped[allocation.warehouse_id].append({"product_id": allocation.product_id, "quantity": allocation.quantity})
+    return [{"warehouse_id": warehouse_id, "items": items} for warehouse_id, items in grouped.items()]
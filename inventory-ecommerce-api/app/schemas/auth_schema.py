@@ -0,0 +1,6 @@
+from marshmallow import Schema, fields, validate
+
+
+class LoginSchema(Schema):
+    email = fields.Str(required=True, validate=validate.Length(min=1))
+    password = fields.Str(required=True, validate=validate.Length(min=1))
@@ -1,11 +1,12 @@
 # app/schemas/cart_schema.py
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 
 class CartItemSchema(Schema):
     id = fields.Int(required=False)
     cart_id = fields.Int(required=False)
     product_id = fields.Int(required=True)
-    quantity = fields.Int(required=True)
+    variant_id = fields.Int(allow_none=True)
+    quantity = fields.Int(required=True, validate=validate.Range(min=1))
 
 class CartSchema(Schema):
     id = fields.Int(dump_only=True)
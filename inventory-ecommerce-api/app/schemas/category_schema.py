@@ -2,4 +2,8 @@ from marshmallow import Schema, fields
 
 class CategorySchema(Schema):
     id = fields.Int(required=False)
-    name = fields.Str(required=True)
\ No newline at end of file
+    name = fields.Str(required=True)
+    parent_id = fields.Int(allow_none=True)
+    path = fields.Str(dump_only=True)
+    subtree_products = fields.Int(dump_only=True)
+    subtree_stock = fields.Int(dump_only=True)
@@ -0,0 +1,35 @@
+from marshmallow import EXCLUDE, Schema, fields, validate
+
+
+class ShipToSchema(Schema):
+    lat = fields.Float(required=True, validate=validate.Range(min=-90, max=90))
+    lon = fields.Float(required=True, validate=validate.Range(min=-180, max=180))
+
+
+class FulfillmentSchema(Schema):
+    # One of app.core.warehouses.STRATEGIES, FULFILLMENT_STRATEGY by default
+    strategy = fields.Str(allow_none=True)
+    split = fields.Bool(load_default=True)
+    ship_to = fields.Nested(ShipToSchema, allow_none=True)
+
+
+class CheckoutItemSchema(Schema):
+    product_id = fields.Int(required=True)
+    variant_id = fields.Int(allow_none=True)
+    quantity = fields.Int(required=True, validate=validate.Range(min=1))
+
+
+class CheckoutCustomerSchema(Schema):
+    """Identifies an existing customer; other details sent along are ignored"""
+    class Meta:
+        unknown = EXCLUDE
+
+    email = fields.Email(required=True)
+
+
+class CheckoutSchema(Schema):
+    """A walk-in sale, see app.api.inventory.sales"""
+    cart_id = fields.Int(required=True, validate=validate.Range(min=1))
+    customer = fields.Nested(CheckoutCustomerSchema, required=True)
+    items = fields.List(fields.Nested(CheckoutItemSchema), required=True, validate=validate.Length(min=1))
+    fulfillment = fields.Nested(FulfillmentSchema, allow_none=True)
@@ -1,7 +1,16 @@
 from marshmallow import Schema, fields, validate
 
+from app.schemas.fields import Money
+
+class CustomerStatsSchema(Schema):
+    order_count = fields.Int(dump_only=True)
+    total_spend = Money(dump_only=True)
+    first_purchase_at = fields.DateTime(dump_only=True)
+    last_purchase_at = fields.DateTime(dump_only=True)
+
 class CustomerSchema(Schema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True, validate=validate.Length(min=1))
     email = fields.Email(required=True)
     phone = fields.Str()
+    stats = fields.Nested(CustomerStatsSchema, dump_only=True)
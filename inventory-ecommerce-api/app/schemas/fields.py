@@ -0,0 +1,14 @@
+from decimal import ROUND_HALF_UP
+
+from marshmallow import fields
+
+
+class Money(fields.Decimal):
+    """Monetary amount, loaded as a Decimal and dumped as a JSON number"""
+
+    def __init__(self, **kwargs):
+        super().__init__(places=2, rounding=ROUND_HALF_UP, **kwargs)
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        value = super()._serialize(value, attr, obj, **kwargs)
+        return float(value) if value is not None else None
@@ -0,0 +1,20 @@
+from marshmallow import Schema, fields, validate
+
+from app.schemas.fields import Money
+
+
+class PriceChangeSchema(Schema):
+    product_id = fields.Int(required=True)
+    price = Money(required=True, validate=validate.Range(min=0))
+
+
+class PriceHistorySchema(Schema):
+    price = Money(dump_only=True)
+    effective_from = fields.DateTime(dump_only=True)
+
+
+class PriceQuerySchema(Schema):
+    """Query arguments of price lookups; `at` defaults to now"""
+    at = fields.DateTime()
+    start = fields.DateTime()
+    end = fields.DateTime()
@@ -1,10 +1,25 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
+
+from app.schemas.fields import Money
 
 class ProductSchema(Schema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
-    price = fields.Float(required=True)
+    price = Money(required=True)
     category_id = fields.Int(required=True)
-    quantity = fields.Int(load_only=True) 
+    quantity = fields.Int(load_only=True, validate=validate.Range(min=0))
+    # Aggregates over the variants, see app.core.variants
+    variant_count = fields.Int(dump_only=True)
+    variants_in_stock = fields.Int(dump_only=True)
+    price_min = Money(dump_only=True)
+    price_max = Money(dump_only=True)
     
-    # For creating stock with product
\ No newline at end of file
+    # For creating stock with product
+
+
+class ProductQuerySchema(Schema):
+    """Query arguments of the product listing"""
+    name = fields.Str()
+    category_id = fields.Int()
+    # Every product in this category's subtree
+    under = fields.Int()
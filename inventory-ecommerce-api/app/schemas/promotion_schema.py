@@ -0,0 +1,28 @@
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
+
+from app.core.pricing import REQUIRED_FIELDS, RULE_KINDS
+from app.schemas.fields import Money
+
+class PromotionSchema(Schema):
+    id = fields.Int(dump_only=True)
+    name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    kind = fields.Str(required=True, validate=validate.OneOf(list(RULE_KINDS)))
+    product_id = fields.Int(allow_none=True)
+    category_id = fields.Int(allow_none=True)
+    percent = fields.Decimal(places=2, as_string=True, allow_none=True, validate=validate.Range(min=0, max=100))
+    buy_quantity = fields.Int(allow_none=True, validate=validate.Range(min=1))
+    get_quantity = fields.Int(allow_none=True, validate=validate.Range(min=1))
+    min_quantity = fields.Int(allow_none=True, validate=validate.Range(min=1))
+    unit_price = Money(allow_none=True)
+    starts_at = fields.DateTime(allow_none=True)
+    ends_at = fields.DateTime(allow_none=True)
+    is_active = fields.Bool()
+
+    @validates_schema
+    def validate_kind_fields(self, data, **kwargs):
+        # Updates are checked against the whole promotion once applied
+        if self.partial:
+            return
+        missing = [name for name in REQUIRED_FIELDS.get(data.get("kind"), ()) if data.get(name) is None]
+        if missing:
+            raise ValidationError({name: ["Required for this kind."] for name in missing})
@@ -0,0 +1,21 @@
+from marshmallow import Schema, fields, validate
+
+
+class ReturnSchema(Schema):
+    id = fields.Int(dump_only=True)
+    transaction_item_id = fields.Int(required=True)
+    product_id = fields.Int(dump_only=True)
+    # Receiving warehouse, defaults to DEFAULT_WAREHOUSE_CODE
+    warehouse_id = fields.Int(allow_none=True)
+    quantity = fields.Int(required=True, validate=validate.Range(min=1))
+    reason = fields.Str(required=True, validate=validate.Length(min=1, max=255))
+    timestamp = fields.DateTime(dump_only=True)
+
+
+class ReturnQuerySchema(Schema):
+    """Query arguments of the returns listing"""
+    transaction_id = fields.Int()
+    transaction_item_id = fields.Int()
+    product_id = fields.Int()
+    start_date = fields.DateTime()
+    end_date = fields.DateTime()
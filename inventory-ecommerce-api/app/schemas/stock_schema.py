@@ -1,8 +1,63 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
+
+from app.schemas.fields import Money
 
 class StockSchema(Schema):
     id = fields.Int(dump_only=True)
     product_id = fields.Int(required=True)
-    quantity = fields.Int(required=True)
+    quantity = fields.Int(required=True, validate=validate.Range(min=0))
+    reserved = fields.Int(dump_only=True)
+    available = fields.Int(dump_only=True)
+    last_updated = fields.DateTime(dump_only=True)
+    category_id = fields.Int(required=True)
+    # Location the quantity applies to, defaults to DEFAULT_WAREHOUSE_CODE
+    warehouse_id = fields.Int(load_only=True)
+
+
+class WarehouseSchema(Schema):
+    id = fields.Int(dump_only=True)
+    code = fields.Str(required=True, validate=validate.Length(min=1, max=20))
+    name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    latitude = fields.Float(allow_none=True, validate=validate.Range(min=-90, max=90))
+    longitude = fields.Float(allow_none=True, validate=validate.Range(min=-180, max=180))
+    shipping_cost = Money()
+    priority = fields.Int()
+
+
+class StockLocationSchema(Schema):
+    warehouse_id = fields.Int()
+    quantity = fields.Int()
     last_updated = fields.DateTime(dump_only=True)
-    category_id = fields.Int(required=True)
\ No newline at end of file
+
+
+class StockMovementSchema(Schema):
+    id = fields.Int(dump_only=True)
+    product_id = fields.Int(dump_only=True)
+    variant_id = fields.Int(dump_only=True)
+    warehouse_id = fields.Int(dump_only=True)
+    quantity_change = fields.Int(dump_only=True)
+    type = fields.Str(dump_only=True)
+    timestamp = fields.DateTime(dump_only=True)
+
+
+class StockBatchSchema(Schema):
+    # A JSON list or a comma separated string, parsed by app.utils.batch.parse_ids
+    product_ids = fields.Raw(required=True)
+
+
+class MovementQuerySchema(Schema):
+    """Query arguments of the stock movement ledger"""
+    product_id = fields.Int()
+    type = fields.Str()
+    start = fields.DateTime()
+    end = fields.DateTime()
+    # Cursor from the previous page's `next`
+    after = fields.Str()
+    count = fields.Int(load_default=50)
+
+
+class MovementDailyQuerySchema(Schema):
+    """Query arguments of the daily movement rollup"""
+    type = fields.Str()
+    start = fields.Date()
+    end = fields.Date()
@@ -1,10 +1,18 @@
 from marshmallow import Schema, fields
 
+from app.schemas.fields import Money
+
 class TransactionSchema(Schema):
     id = fields.Int(dump_only=True)
     cart_id = fields.Int()
     customer_id = fields.Int()
-    total_amount = fields.Float()
+    total_amount = Money()
     timestamp = fields.DateTime()
     status = fields.Str()
 
+
+class SalesQuerySchema(Schema):
+    """Query arguments of the sales listing and analytics"""
+    status = fields.Str()
+    start_date = fields.DateTime()
+    end_date = fields.DateTime()
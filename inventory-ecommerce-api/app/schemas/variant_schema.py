@@ -0,0 +1,16 @@
+from marshmallow import Schema, fields, validate
+
+from app.schemas.fields import Money
+
+class VariantSchema(Schema):
+    id = fields.Int(dump_only=True)
+    product_id = fields.Int(dump_only=True)
+    sku = fields.Str(required=True, validate=validate.Length(min=1, max=64))
+    attributes = fields.Dict(keys=fields.Str(), values=fields.Str(), load_default=dict)
+    # Falls back to the product price when unset
+    price = Money(allow_none=True)
+    quantity = fields.Int(validate=validate.Range(min=0))
+    reserved = fields.Int(dump_only=True)
+    available = fields.Int(dump_only=True)
+    # Warehouse receiving a quantity change, defaults to DEFAULT_WAREHOUSE_CODE
+    warehouse_id = fields.Int(load_only=True, allow_none=True)
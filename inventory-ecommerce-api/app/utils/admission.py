@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+
+from flask import current_app, g, request
+from sqlalchemy.pool import QueuePool
+
+from app.utils import metrics
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+
+    waiting = 0
+    recent_wait = 0.0  # moving average of checkout waits, in seconds
+    _lock = threading.Lock()
+
+    def _do_get(self):
+        cls = TimedQueuePool
+        with cls._lock:
+            cls.waiting += 1
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.monotonic() - started
+            with cls._lock:
+                cls.waiting -= 1
+                cls.recent_wait = cls.recent_wait * 0.8 + waited * 0.2
+
+
+def shed_load():
+    """before_request hook: 503 at once while checkouts queue past LOAD_SHED_WAIT_MS"""
+    threshold = current_app.config["LOAD_SHED_WAIT_MS"] / 1000
+    if TimedQueuePool.waiting and TimedQueuePool.recent_wait > threshold:
+        metrics.incr("admission.shed")
+        return {"error": "Server busy, retry shortly"}, 503, {"Retry-After": "1"}
+    return None
+
+
+def parse_limit(limit):
+    """'20/second' -> (refill rate per second, bucket size)"""
+    amount, _, period = limit.partition("/")
+    seconds = PERIODS.get(period.strip())
+    if seconds is None:
+        raise ValueError(f"Unknown rate limit period in {limit!r}")
+    amount = int(amount)
+    return amount / seconds, amount
+
+
+class MemoryStore:
+    """Token buckets in this process"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst, now):
+        """(allowed, seconds until a token is available)"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now, rate, burst]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True, 0
+            bucket[0] = tokens
+            return False, (1 - tokens) / rate
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+
+class RedisStore:
+    """Token buckets in Redis or a Redis-compatible server, shared by all workers"""
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 't', 's')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens, stamp = tonumber(bucket[1]), tonumber(bucket[2])
+    if tokens == nil then tokens, stamp = burst, now end
+    tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+    local allowed = 0
+    if tokens >= 1 then tokens, allowed = tokens - 1, 1 end
+    redis.call('HSET', KEYS[1], 't', tokens, 's', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("the redis package is required for a redis:// RATELIMIT_STORAGE_URL")
+        self._take = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, now):
+        allowed, tokens = self._take(keys=[f"ratelimit:{key}"], args=[rate, burst, now])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+
+def create_store(url):
+    if url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported RATELIMIT_STORAGE_URL {url}")
+
+
+class RateLimiter:
+    """Default, per-blueprint and per-endpoint token buckets per client"""
+
+    def __init__(self, app):
+        config = app.config
+        self.store = create_store(config["RATELIMIT_STORAGE_URL"])
+        self.default = parse_limit(config["RATELIMIT_DEFAULT"]) if config["RATELIMIT_DEFAULT"] else None
+        self.blueprints = {name: parse_limit(limit) for name, limit in config["RATELIMIT_BLUEPRINTS"].items()}
+        self.endpoints = {name: parse_limit(limit) for name, limit in config["RATELIMIT_ENDPOINTS"].items()}
+
+    def limits(self):
+        """(bucket scope, limit) pairs applying to the current request"""
+        if self.default:
+            yield "default", self.default
+        limit = self.blueprints.get(request.blueprint)
+        if limit:
+            yield request.blueprint, limit
+        limit = self.endpoints.get(request.endpoint)
+        if limit:
+            yield request.endpoint, limit
+
+    def check(self):
+        """before_request hook: 429 once any bucket of the client runs dry"""
+        claims = g.get("jwt_claims")
+        client = f"user:{claims['sub']}" if claims else f"ip:{request.remote_addr}"
+        now = time.time()
+        for scope, (rate, burst) in self.limits():
+            allowed, retry_after = self.store.take(f"{scope}:{client}", rate, burst, now)
+            if not allowed:
+                metrics.incr("ratelimit.limited")
+                return {"error": f"Rate limit exceeded for {scope}"}, 429, \
+                    {"Retry-After": str(max(1, math.ceil(retry_after)))}
+        return None
@@ -0,0 +1,29 @@
+def parse_ids(raw, limit):
+    """Parse a list of ids from a comma separated string or a JSON list.
+
+    Duplicates are dropped while keeping request order. Raises ValueError
+    on malformed input or when more than `limit` ids are requested.
+    """
+    if isinstance(raw, str):
+        raw = [part for part in raw.split(",") if part.strip()]
+    if not isinstance(raw, (list, tuple)):
+        raise ValueError("ids must be a list")
+
+    ids = []
+    seen = set()
+    for value in raw:
+        if isinstance(value, bool):
+            raise ValueError(f"Invalid id: {value}")
+        try:
+            id_ = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid id: {value}")
+        if id_ not in seen:
+            seen.add(id_)
+            ids.append(id_)
+
+    if not ids:
+        raise ValueError("At least one id is required")
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids can be requested at once")
+    return ids
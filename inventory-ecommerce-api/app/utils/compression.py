@@ -0,0 +1,40 @@
+import gzip
+
+from flask import current_app, request
+
+from app.utils import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def compress_response(response):
+    """after_request hook: brotli or gzip for bodies of at least COMPRESS_MIN_SIZE bytes"""
+    if (response.status_code == 204 or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        body = brotli.compress(data, quality=current_app.config["COMPRESS_BROTLI_QUALITY"])
+        encoding = "br"
+    elif accepted["gzip"]:
+        body = gzip.compress(data, compresslevel=current_app.config["COMPRESS_GZIP_LEVEL"], mtime=0)
+        encoding = "gzip"
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    metrics.incr(f"compression.{encoding}")
+    return response
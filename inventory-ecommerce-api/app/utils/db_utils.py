@@ -1,5 +1,4 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 
 db = SQLAlchemy()
 
@@ -8,11 +7,18 @@ def init_db(app):
     with app.app_context():
         db.create_all()
 
+def dispose_engines(app):
+    """Drop pooled connections inherited across a fork without closing the parent's"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
 def drop_db(app):
     with app.app_context():
         db.drop_all()
 
 def migrate_db(app):
+    from flask_migrate import Migrate
     migrate = Migrate(app, db)
     with app.app_context():
         migrate.init_app(app, db)
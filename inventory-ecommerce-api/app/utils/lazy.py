@@ -0,0 +1,52 @@
+import threading
+from importlib import import_module
+
+import click
+
+
+def load(path):
+    """Import 'package.module:attribute' and return the attribute"""
+    module, _, attribute = path.partition(":")
+    return getattr(import_module(module), attribute)
+
+
+class LazyBlueprints:
+    """WSGI wrapper that registers the app's blueprints when the first request arrives"""
+
+    def __init__(self, app, register):
+        self.app = app
+        self.register = register
+        self.wsgi_app = app.wsgi_app
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def __call__(self, environ, start_response):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    # Flask refuses new routes once a request was handled, so
+                    # this has to run before the wrapped wsgi_app
+                    self.register(self.app)
+                    self.loaded = True
+        return self.wsgi_app(environ, start_response)
+
+
+class LazyGroup(click.Group):
+    """CLI group whose module is only imported when the group is used"""
+
+    def __init__(self, name, path, help=None):
+        super().__init__(name, help=help)
+        self.path = path
+        self._group = None
+
+    @property
+    def group(self):
+        if self._group is None:
+            self._group = load(self.path)
+        return self._group
+
+    def list_commands(self, ctx):
+        return self.group.list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        return self.group.get_command(ctx, cmd_name)
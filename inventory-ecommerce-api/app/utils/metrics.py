@@ -0,0 +1,22 @@
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+
+
+def incr(name, value=1):
+    """Increment a named counter"""
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot():
+    """Return a copy of all counters"""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,17 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from app.utils.db_utils import db
+
+# Shared column type for every monetary amount: exact to the cent
+Money = db.Numeric(12, 2)
+
+CENT = Decimal("0.01")
+
+
+def to_money(value):
+    """Round a number to whole cents as a Decimal"""
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
@@ -0,0 +1,40 @@
+import base64
+from datetime import datetime
+
+from flask import current_app, request
+
+from app.utils.unit_of_work import abort_json
+
+
+def _int_arg(name, default):
+    value = request.args.get(name, "")
+    if value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort_json(400, {name: ["Not a valid integer."]})
+
+
+def page_args(default_count=10):
+    """(page, count) from the query string, count capped at MAX_PAGE_SIZE.
+
+    A page or count that isn't an integer aborts with a 400.
+    """
+    page = _int_arg("page", 1)
+    count = _int_arg("count", default_count)
+    return max(page, 1), max(1, min(count, current_app.config["MAX_PAGE_SIZE"]))
+
+
+def encode_cursor(timestamp, id_):
+    """Opaque keyset cursor for the row at (timestamp, id)"""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{id_}".encode()).decode()
+
+
+def decode_cursor(raw):
+    """(timestamp, id) from a cursor; ValueError when malformed"""
+    try:
+        timestamp, _, id_ = base64.urlsafe_b64decode(raw.encode()).decode().partition("|")
+        return datetime.fromisoformat(timestamp), int(id_)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
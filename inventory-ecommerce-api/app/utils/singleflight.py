@@ -0,0 +1,64 @@
+import threading
+
+from flask import request
+
+from app.utils import metrics
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result (or exception). Results
+    must be plain data since they are handed to other request threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.coalesced")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"singleflight.{self.name}.executed")
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+
+def request_key():
+    """Normalized key for the current request: path plus sorted query args"""
+    args = sorted(request.args.items(multi=True))
+    return (request.path.rstrip("/"),) + tuple(args)
@@ -0,0 +1,44 @@
+from sqlalchemy import Boolean, Column, Index, event, false, text
+from sqlalchemy.orm import Session, with_loader_criteria
+
+# Execution option that turns the soft-delete filter off for one statement
+INCLUDE_TRASHED = "include_trashed"
+
+
+class SoftDeleteMixin:
+    """Marks a model whose rows are soft deleted through `is_trash`.
+
+    SELECTs through the session only see rows with is_trash = false, which
+    matches the partial indexes on these tables. Use `with_trashed` (or the
+    include_trashed execution option) for admin paths that need them.
+    """
+
+    is_trash = Column(Boolean(), nullable=False, default=False, server_default=false())
+
+
+def live_index(name, *columns):
+    """Partial index covering only rows that are not trashed"""
+    return Index(
+        name,
+        *columns,
+        postgresql_where=text("is_trash = false"),
+        sqlite_where=text("is_trash = 0"),
+    )
+
+
+def with_trashed(query):
+    """Let a query or select see trashed rows"""
+    return query.execution_options(**{INCLUDE_TRASHED: True})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _exclude_trashed(state):
+    if (
+        state.is_select
+        and not state.is_column_load
+        and not state.is_relationship_load
+        and not state.execution_options.get(INCLUDE_TRASHED, False)
+    ):
+        state.statement = state.statement.options(
+            with_loader_criteria(SoftDeleteMixin, lambda cls: cls.is_trash == False, include_aliases=True)
+        )
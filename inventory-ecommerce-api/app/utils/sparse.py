@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+from flask import request
+from sqlalchemy.orm import load_only
+
+
+def dump_fields(schema_cls):
+    """Names a schema serializes, in declaration order"""
+    return tuple(name for name, field in schema_cls().fields.items() if not field.load_only)
+
+
+def requested_fields(allowed):
+    """Fields picked with ?fields=a,b, validated against `allowed` (all of them by default).
+
+    Raises ValueError naming unknown fields.
+    """
+    raw = request.args.get("fields")
+    if not raw:
+        return allowed
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(",") if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return fields
+
+
+def columns_only(model, fields):
+    """load_only() restricting the SELECT to the model columns among `fields`"""
+    columns = model.__table__.columns
+    return load_only(*[getattr(model, name) for name in fields if name in columns] or [model.id])
+
+
+@lru_cache(maxsize=256)
+def schema_for(schema_cls, fields):
+    """Cached `many` schema dumping only `fields`"""
+    return schema_cls(many=True, only=fields)
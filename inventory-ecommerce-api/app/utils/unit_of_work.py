@@ -0,0 +1,131 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import abort, current_app, jsonify
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, SQLAlchemyError
+from werkzeug.exceptions import HTTPException
+
+from app.utils import metrics
+from app.utils.db_utils import db
+
+# SQLSTATEs of transactions the database aborted for a concurrent one: safe to rerun
+RETRYABLE_SQLSTATES = frozenset(("40001", "40P01"))
+
+_ACTIVE = "unit_of_work"
+
+
+def error_response(status_code, message):
+    return {"error": message}, status_code
+
+
+def abort_json(status_code, message):
+    response = jsonify(error=message)
+    response.status_code = status_code
+    abort(response)
+
+
+def is_retryable(error):
+    """Serialization failures and deadlocks, or SQLite's busy database"""
+    if not isinstance(error, DBAPIError):
+        return False
+    orig = error.orig
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return True
+    return type(orig).__module__ == "sqlite3" and "database is locked" in str(orig)
+
+
+@contextmanager
+def transaction():
+    """Everything inside commits once at the end, or rolls back if it raises.
+
+    Inside another unit of work it joins the outer one, which commits.
+    """
+    session = db.session
+    if session.info.get(_ACTIVE):
+        yield session
+        return
+    session.info[_ACTIVE] = True
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(_ACTIVE, None)
+
+
+def _status(response):
+    if isinstance(response, tuple):
+        return response[1] if len(response) > 1 and isinstance(response[1], int) else 200
+    return getattr(response, "status_code", 200)
+
+
+def _translate(error, conflict, invalid, name):
+    if isinstance(error, IntegrityError):
+        logging.error(f"Integrity error in {name}: {error}")
+        return error_response(409, conflict)
+    if isinstance(error, DataError):
+        logging.error(f"Data error in {name}: {error}")
+        return error_response(400, invalid)
+    logging.error(f"Database operation failed in {name}: {error}")
+    return error_response(500, "Internal server error")
+
+
+def unit_of_work(method=None, *, conflict="Conflicts with existing data", invalid="Invalid data"):
+    """Run a write handler as one transaction with a single commit.
+
+    Responses below 400 commit, error responses and aborts roll back.
+    Errors become uniform responses: integrity errors a 409 with
+    `conflict`, data errors a 400 with `invalid`, anything else a 500.
+    Serialization failures and deadlocks rerun the handler up to
+    UOW_RETRIES times; put it above json_body so each run loads afresh.
+    """
+    if method is None:
+        return lambda method: unit_of_work(method, conflict=conflict, invalid=invalid)
+    name = method.__qualname__
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        session = db.session
+        if session.info.get(_ACTIVE):
+            return method(*args, **kwargs)
+        retries = current_app.config["UOW_RETRIES"]
+        backoff = current_app.config["UOW_RETRY_BACKOFF_MS"] / 1000
+        attempt = 0
+        while True:
+            session.info[_ACTIVE] = True
+            try:
+                response = method(*args, **kwargs)
+                if _status(response) < 400:
+                    session.commit()
+                else:
+                    session.rollback()
+                return response
+            except HTTPException:
+                session.rollback()
+                raise
+            except SQLAlchemyError as e:
+                session.rollback()
+                if attempt < retries and is_retryable(e):
+                    attempt += 1
+                    metrics.incr("unit_of_work.retried")
+                    # Jittered exponential backoff, so the conflicting requests don't meet again
+                    time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                    continue
+                if is_retryable(e):
+                    metrics.incr("unit_of_work.retries_exhausted")
+                    logging.error(f"Gave up on {name} after {attempt} retries: {e}")
+                    return error_response(503, "Conflicting concurrent update, retry shortly")
+                return _translate(e, conflict, invalid, name)
+            except Exception as e:
+                session.rollback()
+                logging.exception(f"Unexpected error in {name}: {e}")
+                return error_response(500, "Internal server error")
+            finally:
+                session.info.pop(_ACTIVE, None)
+    return wrapper
@@ -0,0 +1,311 @@
+import math
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+from types import SimpleNamespace
+
+from flask import current_app, request
+from marshmallow import EXCLUDE, RAISE, ValidationError, fields, missing
+
+_compiled = {}
+
+
+def _integer(field, partial):
+    strict = field.strict
+
+    def convert(value):
+        if value is True or value is False or (strict and not isinstance(value, int)):
+            raise field.make_error("invalid")
+        if type(value) is int:
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise field.make_error("invalid")
+        except OverflowError:
+            raise field.make_error("too_large")
+    return convert
+
+
+def _float(field, partial):
+    allow_nan = field.allow_nan
+
+    def convert(value):
+        if value is True or value is False:
+            raise field.make_error("invalid")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise field.make_error("invalid")
+        except OverflowError:
+            raise field.make_error("too_large")
+        if not allow_nan and (math.isnan(value) or math.isinf(value)):
+            raise field.make_error("special")
+        return value
+    return convert
+
+
+def _decimal(field, partial):
+    places, rounding, allow_nan = field.places, field.rounding, field.allow_nan
+
+    def convert(value):
+        if value is True or value is False:
+            raise field.make_error("invalid")
+        try:
+            value = Decimal(str(value))
+            if not value.is_finite():
+                if not allow_nan:
+                    raise field.make_error("special")
+                return value
+            return value.quantize(places, rounding=rounding) if places is not None else value
+        except (TypeError, ValueError, InvalidOperation):
+            raise field.make_error("invalid")
+    return convert
+
+
+def _string(field, partial):
+    def convert(value):
+        if not isinstance(value, str):
+            raise field.make_error("invalid")
+        return value
+    return convert
+
+
+def _boolean(field, partial):
+    truthy, falsy = field.truthy, field.falsy
+
+    def convert(value):
+        try:
+            if value in truthy:
+                return True
+            if value in falsy:
+                return False
+        except TypeError:
+            pass
+        raise field.make_error("invalid")
+    return convert
+
+
+def _list(field, partial):
+    item = _converter(field.inner, partial)
+
+    def convert(value):
+        if not isinstance(value, (list, tuple)):
+            raise field.make_error("invalid")
+        result, errors = [], {}
+        for index, element in enumerate(value):
+            try:
+                result.append(item(element))
+            except ValidationError as e:
+                errors[index] = e.messages
+        if errors:
+            raise ValidationError(errors)
+        return result
+    return convert
+
+
+def _nested(field, partial):
+    nested = field.schema
+    if field.only is not None or field.exclude:
+        return field.deserialize
+    # Partial loads are partial all the way down, as with Schema.load
+    load = compile_schema(type(nested), partial=partial or bool(nested.partial), unknown=nested.unknown)
+
+    if field.many:
+        def convert(value):
+            if not isinstance(value, (list, tuple)):
+                raise field.make_error("type")
+            result, errors = [], {}
+            for index, element in enumerate(value):
+                try:
+                    result.append(load(element))
+                except ValidationError as e:
+                    errors[index] = e.messages
+            if errors:
+                raise ValidationError(errors)
+            return result
+        return convert
+    return load
+
+
+# Field types checked inline, subclasses such as Money included; any other
+# field falls back to its own deserialize
+CONVERTERS = (
+    (fields.Integer, _integer),
+    (fields.Decimal, _decimal),
+    (fields.Float, _float),
+    (fields.String, _string),
+    (fields.Boolean, _boolean),
+    (fields.List, _list),
+    (fields.Nested, _nested),
+)
+
+
+def _converter(field, partial=False):
+    """A function converting one value of the field, validators included"""
+    for field_class, build in CONVERTERS:
+        if isinstance(field, field_class):
+            convert = build(field, partial)
+            break
+    else:
+        # field.deserialize runs the field's own validators
+        return lambda value: field.deserialize(value)
+
+    validators = tuple(field.validators)
+    if not validators:
+        return convert
+
+    def validated(value):
+        value = convert(value)
+        for validator in validators:
+            if validator(value) is False:
+                raise field.make_error("validator_failed")
+        return value
+    return validated
+
+
+def compile_schema(schema_class, partial=False, unknown=None):
+    """A plain-function `load` for a schema class, built once per variant.
+
+    Common field types are checked inline, skipping marshmallow's per-call
+    machinery; errors are shaped like `Schema.load`'s. Schemas with hooks
+    (pre/post_load, validates, validates_schema) keep marshmallow's `load`.
+    """
+    key = (schema_class, partial, unknown)
+    load = _compiled.get(key)
+    if load is not None:
+        return load
+
+    schema = schema_class(partial=partial, unknown=unknown)
+    if any(schema._hooks.values()):
+        load = schema.load
+    else:
+        load = _build(schema, partial, schema.unknown)
+    _compiled[key] = load
+    return load
+
+
+def _build(schema, partial, unknown):
+    steps = tuple(
+        (
+            field.data_key or name,
+            field.attribute or name,
+            _converter(field, partial),
+            field.required and not partial,
+            field.load_default,
+            field.allow_none,
+            field,
+        )
+        for name, field in schema.load_fields.items()
+    )
+    known = frozenset(step[0] for step in steps)
+
+    def load(data):
+        if not isinstance(data, dict):
+            raise ValidationError({"_schema": ["Invalid input type."]})
+        result, errors = {}, {}
+        for key, attribute, convert, required, default, allow_none, field in steps:
+            value = data.get(key, missing)
+            if value is missing:
+                if required:
+                    errors[key] = [field.error_messages["required"]]
+                elif default is not missing and not partial:
+                    result[attribute] = default() if callable(default) else default
+                continue
+            if value is None:
+                if allow_none:
+                    result[attribute] = None
+                else:
+                    errors[key] = [field.error_messages["null"]]
+                continue
+            try:
+                result[attribute] = convert(value)
+            except ValidationError as e:
+                errors[key] = e.messages
+        if unknown == RAISE and not known.issuperset(data):
+            for key in data:
+                if key not in known:
+                    errors[key] = ["Unknown field."]
+        if errors:
+            raise ValidationError(errors)
+        return result
+    return load
+
+
+def _too_large():
+    limit = current_app.config["MAX_JSON_BYTES"]
+    if request.content_length is not None and request.content_length > limit:
+        return {"error": f"Request body larger than {limit} bytes"}, 413
+    return None
+
+
+def json_body(schema_class, many=False, partial=False, max_items=None, required=True):
+    """Validate the JSON body against a schema, passing the result as `body`.
+
+    With `many` the body is a non-empty list of at most the config value
+    named by `max_items`. Without `required` an empty body loads as {}.
+    Oversized bodies get a 413 before being read, invalid ones the
+    schema's error messages in a 400.
+    """
+    load = compile_schema(schema_class, partial)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            error = _too_large()
+            if error:
+                return error
+            data = request.get_json(silent=True)
+            if data is None:
+                if required or request.get_data():
+                    return {"error": "Invalid input data"}, 400
+                data = {}
+            try:
+                if many:
+                    if not isinstance(data, list) or not data:
+                        return {"error": "Expected a non-empty list"}, 400
+                    limit = current_app.config[max_items] if max_items else None
+                    if limit is not None and len(data) > limit:
+                        return {"error": f"At most {limit} entries per request"}, 413
+                    kwargs["body"] = _load_many(load, data)
+                else:
+                    kwargs["body"] = load(data)
+            except ValidationError as e:
+                return {"error": e.messages}, 400
+            return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _load_many(load, data):
+    result, errors = [], {}
+    for index, element in enumerate(data):
+        try:
+            result.append(load(element))
+        except ValidationError as e:
+            errors[index] = e.messages
+    if errors:
+        raise ValidationError(errors)
+    return result
+
+
+def query_params(schema_class):
+    """Parse query arguments with a schema into a typed `params` namespace.
+
+    Empty and unknown arguments are ignored; absent ones are None unless
+    the field has a load_default.
+    """
+    load = compile_schema(schema_class, unknown=EXCLUDE)
+    names = tuple(field.attribute or name for name, field in schema_class().load_fields.items())
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                parsed = load({key: value for key, value in request.args.items() if value != ""})
+            except ValidationError as e:
+                return {"error": e.messages}, 400
+            kwargs["params"] = SimpleNamespace(**{name: parsed.get(name) for name in names})
+            return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
@@ -0,0 +1,113 @@
+"""Storefront product reads served from the catalog snapshot.
+
+Run from the project root:
+
+    python benchmarks/bench_catalog.py
+
+Seeds a throwaway SQLite database with BENCH_PRODUCTS products, then times
+a full snapshot build, an incremental refresh after a few products change,
+a listing page from the snapshot against the same page read through the
+ORM and marshmallow, and product reads through the test client. Fails
+when a snapshot page takes over CATALOG_BUDGET_US.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PRODUCTS = int(os.getenv("BENCH_PRODUCTS", 20000))
+CATEGORIES = 20
+CHANGED = 20
+PAGE = 50
+RUNS = 300
+BUDGET_US = float(os.getenv("CATALOG_BUDGET_US", 100))
+
+
+def seed():
+    from app import create_app
+    from app.core.models import Category, Product, Stock
+    from app.utils.db_utils import db
+
+    app = create_app(lazy=False)
+    # Changed long before the snapshot, so refreshes only reload what the benchmark changes
+    before = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Category.__table__), [{"name": f"Category {i}"} for i in range(CATEGORIES)])
+        db.session.execute(db.insert(Product.__table__), [
+            {"name": f"Product {i}", "price": 10 + i % 90, "category_id": i % CATEGORIES + 1, "updated_at": before}
+            for i in range(PRODUCTS)
+        ])
+        db.session.execute(db.insert(Stock.__table__), [
+            {"product_id": i + 1, "quantity": 100, "category_id": i % CATEGORIES + 1, "last_updated": before}
+            for i in range(PRODUCTS)
+        ])
+        db.session.commit()
+    return app
+
+
+def per_call_us(fn, runs):
+    return min(timeit.repeat(fn, number=runs, repeat=3)) / runs * 1e6
+
+
+def orm_page():
+    """A listing page the way it was read before the snapshot"""
+    from sqlalchemy.orm import joinedload
+
+    from app.core.models import Product
+    from app.schemas.product_schema import ProductSchema
+
+    products = Product.query.options(joinedload(Product.stock)).order_by(Product.id.desc()).limit(PAGE).all()
+    results = ProductSchema(many=True).dump(products)
+    for product, data in zip(products, results):
+        data["quantity"] = product.stock.quantity if product.stock else 0
+        data["available"] = product.stock.available if product.stock else 0
+    return json.dumps(results)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        os.environ["CATALOG_MAX_STALENESS"] = "3600"
+        app = seed()
+        from app.core.catalog import catalog
+        from app.core.models import Product
+        from app.utils.db_utils import db
+
+        with app.app_context():
+            started = time.perf_counter()
+            catalog.refresh()
+            build_ms = (time.perf_counter() - started) * 1000
+
+            for product in Product.query.limit(CHANGED):
+                product.price += 1
+            db.session.commit()
+            started = time.perf_counter()
+            snapshot = catalog.current()
+            refresh_ms = (time.perf_counter() - started) * 1000
+
+            snapshot_us = per_call_us(lambda: b",".join(entry.json for entry in snapshot.page(1, PAGE)[0]), RUNS * 10)
+            orm_us = per_call_us(orm_page, RUNS // 10)
+
+        client = app.test_client()
+        print(f"{PRODUCTS} products: full build {build_ms:.0f} ms, "
+              f"refresh after {CHANGED} changes {refresh_ms:.1f} ms")
+        print(f"page of {PAGE}: snapshot {snapshot_us:.0f} us, ORM and marshmallow {orm_us:.0f} us")
+        for label, path in (
+            ("GET /api/products/<id>/", "/api/products/1234/"),
+            (f"GET /api/products/?count={PAGE}", f"/api/products/?count={PAGE}"),
+            (f"GET /api/products/?category_id=3&count={PAGE}", f"/api/products/?category_id=3&count={PAGE}"),
+            (f"GET /api/products/?name=product 19&count={PAGE}", f"/api/products/?name=product%2019&count={PAGE}"),
+        ):
+            print(f"  {label:<44} {per_call_us(lambda: client.get(path), RUNS):>8.0f} us")
+        print(f"snapshot page {snapshot_us:.0f} us (budget {BUDGET_US:.0f} us)")
+        return 0 if snapshot_us <= BUDGET_US else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
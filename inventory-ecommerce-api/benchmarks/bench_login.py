@@ -0,0 +1,124 @@
+"""Login throughput and latency of other endpoints during a login storm.
+
+Run from the project root:
+
+    python benchmarks/bench_login.py
+
+One gthread gunicorn worker serves a throwaway SQLite database. While
+login clients hammer /api/auth/login/, a probe client measures
+/api/products/1/, first with hashing on the request threads
+(PASSWORD_WORKERS=0), then with the hashing pool.
+"""
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_server import PORT, ROOT, seed, wait_ready
+
+LOGIN_CLIENTS = int(os.getenv("BENCH_LOGIN_CLIENTS", 8))
+DURATION = float(os.getenv("BENCH_SECONDS", 10))
+MODES = [
+    ("inline", {"PASSWORD_WORKERS": "0"}),
+    ("pool x2", {"PASSWORD_WORKERS": "2"}),
+]
+CREDENTIALS = json.dumps({"email": "bench@example.com", "password": "benchmark"})
+
+
+def seed_user():
+    from app import create_app
+    from app.core.models import User
+    from app.utils.db_utils import db
+
+    app = create_app(lazy=False)
+    with app.app_context():
+        user = User(email="bench@example.com", role="customer")
+        user.set_password("benchmark")
+        db.session.add(user)
+        db.session.commit()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def probe(stop, latencies):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.request("GET", "/api/products/1/")
+        conn.getresponse().read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.02)
+
+
+def login(stop, outcomes):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    while not stop.is_set():
+        conn.request("POST", "/api/auth/login/", body=CREDENTIALS,
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        outcomes.append(response.status)
+        if response.status == 503:
+            time.sleep(0.05)
+
+
+def measure(login_clients):
+    stop = threading.Event()
+    latencies, outcomes = [], []
+    threads = [threading.Thread(target=probe, args=(stop, latencies))]
+    threads += [threading.Thread(target=login, args=(stop, outcomes)) for _ in range(login_clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, outcomes
+
+
+def run(name, settings, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY="1",
+               GUNICORN_WORKER_CLASS="gthread", GUNICORN_THREADS=str(LOGIN_CLIENTS + 2),
+               GUNICORN_BIND=f"127.0.0.1:{PORT}", **settings)
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready()
+        measure(1)  # warm up the pool
+        for label, clients in (("idle", 0), ("storm", LOGIN_CLIENTS)):
+            latencies, outcomes = measure(clients)
+            logins = outcomes.count(200) / DURATION
+            shed = outcomes.count(503)
+            print(f"{name:<8} {label:<6} {logins:>9.1f} {shed:>6} "
+                  f"{percentile(latencies, 0.5):>9.1f} {percentile(latencies, 0.95):>9.1f}")
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+
+def main():
+    os.environ["PASSWORD_WORKERS"] = "0"
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{tmp}/bench.db"
+        seed(database_url)
+        seed_user()
+        print(f"{LOGIN_CLIENTS} login clients, {DURATION:.0f}s per run, probe GET /api/products/1/")
+        print(f"{'mode':<8} {'load':<6} {'logins/s':>9} {'503s':>6} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, settings in MODES:
+            run(name, settings, database_url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Checkout throughput under contention, and a check that stock never oversells.
+
+Run from the project root:
+
+    python benchmarks/bench_oversell.py
+
+Many threads buy one unit at a time of a single product, in more orders
+than there are units, through the walk-in sale checkout of a throwaway
+SQLite database. Exactly the stocked units must sell: fails when more or
+fewer did, or when stock, its locations or the ledger disagree or go
+negative afterwards.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+UNITS = int(os.getenv("BENCH_UNITS", 200))
+CLIENTS = int(os.getenv("BENCH_CLIENTS", 8))
+ORDERS = int(os.getenv("BENCH_ORDERS", 300))
+
+
+def seed():
+    from app import create_app
+    from app.core.models import Category, Customer, Product, Stock
+    from app.core.warehouses import adjust_location
+    from app.utils.db_utils import db
+
+    app = create_app(lazy=False)
+    with app.app_context():
+        db.create_all()
+        category = Category(name="Bench")
+        db.session.add(category)
+        db.session.flush()
+        product = Product(name="Contended", price=10, category_id=category.id)
+        db.session.add(product)
+        db.session.flush()
+        stock = Stock(product_id=product.id, quantity=0, category_id=category.id)
+        db.session.add(stock)
+        adjust_location(stock, UNITS)
+        db.session.add(Customer(name="Bench", email="bench@example.com"))
+        db.session.commit()
+        return app, product.id
+
+
+def buy(app, product_id, orders, lock, outcomes):
+    client = app.test_client()
+    payload = {"cart_id": 1, "customer": {"email": "bench@example.com"},
+               "items": [{"product_id": product_id, "quantity": 1}]}
+    while True:
+        with lock:
+            if next(orders, None) is None:
+                return
+        outcomes.append(client.post("/api/sales/checkout/", json=payload).status_code)
+
+
+def check(app, product_id):
+    """Violations of the stock invariants after the run"""
+    from app.core.models import Stock, StockLocation, StockMovement
+    from app.utils.db_utils import db
+
+    with app.app_context():
+        stock = Stock.query.filter_by(product_id=product_id).one()
+        located = db.session.execute(
+            db.select(db.func.sum(StockLocation.quantity)).where(StockLocation.stock_id == stock.id)
+        ).scalar()
+        lowest = db.session.execute(
+            db.select(db.func.min(StockLocation.quantity)).where(StockLocation.stock_id == stock.id)
+        ).scalar()
+        sold = -db.session.execute(
+            db.select(db.func.sum(StockMovement.quantity_change))
+            .where(StockMovement.product_id == product_id, StockMovement.type == "sale")
+        ).scalar()
+        problems = []
+        if stock.quantity != 0:
+            problems.append(f"stock left at {stock.quantity}, expected 0")
+        if located != stock.quantity:
+            problems.append(f"locations hold {located}, stock says {stock.quantity}")
+        if lowest < 0 or stock.reserved < 0:
+            problems.append("negative stock")
+        if sold != UNITS:
+            problems.append(f"ledger records {sold} units sold, expected {UNITS}")
+        return problems
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        app, product_id = seed()
+        # More orders than units, so the last ones find the product sold out
+        orders, lock = iter(range(max(ORDERS, UNITS + CLIENTS))), threading.Lock()
+        outcomes = []
+        threads = [threading.Thread(target=buy, args=(app, product_id, orders, lock, outcomes))
+                   for _ in range(CLIENTS)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        counts = Counter(outcomes)
+        print(f"{CLIENTS} clients, {len(outcomes)} orders for {UNITS} units: "
+              f"{len(outcomes) / seconds:.1f} checkouts/s")
+        print("  " + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+        problems = check(app, product_id)
+        if counts[200] != UNITS:
+            problems.append(f"{counts[200]} orders succeeded for {UNITS} units")
+        for problem in problems:
+            print(f"FAIL {problem}")
+        return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Bytes on the wire and CPU per response for listings, by fieldset and encoding.
+
+Run from the project root:
+
+    python benchmarks/bench_payload.py
+
+Requests go through the Flask test client against a throwaway SQLite
+database, so CPU covers the query, serialization and compression.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROWS = 100
+RUNS = int(os.getenv("BENCH_RUNS", 50))
+LISTINGS = [
+    ("products", f"/api/products/?count={ROWS}"),
+    ("products id,name", f"/api/products/?count={ROWS}&fields=id,name"),
+    ("sales", f"/api/sales/?count={ROWS}"),
+    ("sales id,total_amount", f"/api/sales/?count={ROWS}&fields=id,total_amount"),
+]
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+def seed():
+    from app import create_app
+    from app.core.models import Cart, Category, Customer, Product, Stock, Transaction
+    from app.utils.db_utils import db
+
+    app = create_app(lazy=False)
+    with app.app_context():
+        db.create_all()
+        category = Category(name="Bench")
+        customer = Customer(name="Bench", email="bench@example.com")
+        db.session.add_all([category, customer])
+        db.session.flush()
+        cart = Cart(customer_id=customer.id)
+        db.session.add(cart)
+        db.session.flush()
+        for i in range(ROWS):
+            product = Product(name=f"Benchmark product with a longish name {i}", price=10 + i,
+                              category_id=category.id)
+            db.session.add(product)
+            db.session.flush()
+            db.session.add(Stock(product_id=product.id, quantity=100, category_id=category.id))
+            db.session.add(Transaction(cart_id=cart.id, customer_id=customer.id, total_amount=25 + i, status="completed",
+                                       timestamp=datetime(2024, 1, 1 + i % 28)))
+        db.session.commit()
+    return app
+
+
+def measure(client, path, encoding):
+    headers = {"Accept-Encoding": encoding}
+    response = client.get(path, headers=headers)
+    started = time.process_time()
+    for _ in range(RUNS):
+        client.get(path, headers=headers).get_data()
+    cpu_ms = (time.process_time() - started) / RUNS * 1000
+    return len(response.get_data()), response.headers.get("Content-Encoding", "identity"), cpu_ms
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        os.environ.setdefault("MAX_PAGE_SIZE", str(ROWS))
+        client = seed().test_client()
+        print(f"{ROWS} rows per listing, {RUNS} requests per cell")
+        print(f"{'listing':<24} {'encoding':<9} {'bytes':>8} {'cpu ms':>8}")
+        for name, path in LISTINGS:
+            for encoding in ENCODINGS:
+                size, used, cpu_ms = measure(client, path, encoding)
+                print(f"{name:<24} {used:<9} {size:>8} {cpu_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Pricing engine evaluation cost per basket line.
+
+Run from the project root:
+
+    python benchmarks/bench_pricing.py
+
+Rules are compiled from in-memory Promotion objects, so no database is
+needed. Timings are the best of REPEATS rounds, the least disturbed by
+other load. The budget is one microsecond per line once rules are loaded.
+"""
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.models import Promotion
+from app.core.pricing import CompiledRule, RuleSet, evaluate
+
+LINES = 100
+RUNS = 2000
+REPEATS = 15
+BUDGET_US = float(os.getenv("PRICING_BUDGET_US", 1.0))
+
+
+def build_rules():
+    rules = []
+    for category_id in range(1, 21):
+        rules.append(CompiledRule(Promotion(id=category_id, kind="percent_off",
+                                            category_id=category_id, percent=Decimal("10"))))
+    for product_id in range(1, 201, 4):
+        rules.append(CompiledRule(Promotion(id=1000 + product_id, kind="buy_x_get_y",
+                                            product_id=product_id, buy_quantity=2, get_quantity=1)))
+        rules.append(CompiledRule(Promotion(id=2000 + product_id, kind="tiered", product_id=product_id,
+                                            min_quantity=5, unit_price=Decimal("7.50"))))
+    return RuleSet(rules)
+
+
+def build_lines():
+    random.seed(1)
+    return [
+        (product_id, product_id % 20 + 1, random.randint(1, 12), Decimal("9.99"))
+        for product_id in random.sample(range(1, 401), LINES)
+    ]
+
+
+def main():
+    rules = build_rules()
+    lines = build_lines()
+    seconds = min(timeit.repeat(lambda: evaluate(rules, lines), number=RUNS, repeat=REPEATS))
+    per_line_us = seconds / RUNS / LINES * 1e6
+    print(f"{LINES} lines: {per_line_us:.3f} us/line (budget {BUDGET_US} us)")
+    return 0 if per_line_us <= BUDGET_US else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Requests/sec and memory per worker across gunicorn configurations.
+
+Run from the project root:
+
+    python benchmarks/bench_server.py
+
+Each configuration serves a throwaway SQLite database seeded with a few
+products. Memory is reported as PSS (shared pages split between the
+processes sharing them), which is what preloading reduces; RSS counts
+every shared page in full.
+"""
+import http.client
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PORT = int(os.getenv("BENCH_PORT", 8765))
+WORKERS = int(os.getenv("BENCH_WORKERS", 2))
+CLIENTS = int(os.getenv("BENCH_CLIENTS", 8))
+DURATION = float(os.getenv("BENCH_SECONDS", 5))
+PATHS = ["/api/products/1/", "/api/products/?ids=1,2,3,4,5", "/metrics"]
+
+CONFIGS = [
+    ("sync", {"GUNICORN_WORKER_CLASS": "sync"}),
+    ("sync, no preload", {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_PRELOAD": "False"}),
+    ("gthread x4", {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "4"}),
+]
+if importlib.util.find_spec("gevent"):
+    CONFIGS.append(("gevent", {"GUNICORN_WORKER_CLASS": "gevent"}))
+
+
+def seed(database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from app import create_app
+    from app.core.models import Category, Product, Stock
+    from app.utils.db_utils import db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        category = Category(name="Bench")
+        db.session.add(category)
+        db.session.flush()
+        for i in range(50):
+            product = Product(name=f"Product {i}", price=10 + i, category_id=category.id)
+            db.session.add(product)
+            db.session.flush()
+            db.session.add(Stock(product_id=product.id, quantity=100, category_id=category.id))
+        db.session.commit()
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def memory_kb(pid):
+    """(pss, rss) of a process in kB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Pss", "Rss"):
+                values[key] = int(rest.split()[0])
+    return values["Pss"], values["Rss"]
+
+
+def wait_ready(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            conn.request("GET", "/metrics")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def load():
+    """Keep-alive clients cycling through PATHS; returns requests/sec"""
+    done = []
+    stop = time.time() + DURATION
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=10)
+        count = 0
+        while time.time() < stop:
+            conn.request("GET", PATHS[count % len(PATHS)])
+            conn.getresponse().read()
+            count += 1
+        done.append(count)
+
+    threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done) / DURATION
+
+
+def run(name, settings, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(WORKERS),
+               GUNICORN_BIND=f"127.0.0.1:{PORT}", **settings)
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready()
+        rps = load()
+        workers = [memory_kb(pid) for pid in children(master.pid)]
+        pss = sum(m[0] for m in workers) / len(workers) / 1024
+        rss = sum(m[1] for m in workers) / len(workers) / 1024
+        print(f"{name:<20} {rps:>10.0f} {pss:>10.1f} {rss:>10.1f}")
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{tmp}/bench.db"
+        seed(database_url)
+        print(f"{WORKERS} workers, {CLIENTS} clients, {DURATION:.0f}s per configuration")
+        print(f"{'config':<20} {'req/s':>10} {'PSS MB':>10} {'RSS MB':>10}")
+        for name, settings in CONFIGS:
+            run(name, settings, database_url)
+
+
+if __name__ == "__main__":
+    main()
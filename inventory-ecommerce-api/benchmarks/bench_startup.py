@@ -0,0 +1,117 @@
+"""Cold-start budget: import time and first-request latency.
+
+Run from the project root:
+
+    python benchmarks/bench_startup.py
+
+Each measurement runs in a fresh interpreter with -X importtime, for the
+eager app and the lazy one (LAZY_APP). The lazy app must stay within its
+budgets and must not import the modules in DEFERRED before the first
+request; the script exits non-zero otherwise, so it can gate CI.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RUNS = int(os.getenv("STARTUP_RUNS", 5))
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 1000))
+FIRST_REQUEST_BUDGET_MS = float(os.getenv("FIRST_REQUEST_BUDGET_MS", 1000))
+DEFERRED = ("alembic", "marshmallow", "flask_restful", "pyarrow", "app.core.models")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app(lazy=%r)
+created = time.perf_counter()
+loaded = [name for name in %r if name in sys.modules]
+client = app.test_client()
+status = client.get("/api/products/1/").status_code
+finished = time.perf_counter()
+print(json.dumps({"startup": (created - started) * 1000, "first_request": (finished - created) * 1000,
+                  "loaded": loaded, "status": status}))
+"""
+
+
+def seed(database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from app import create_app
+    from app.core.models import Category, Product, Stock
+    from app.utils.db_utils import db
+
+    app = create_app(lazy=False)
+    with app.app_context():
+        db.create_all()
+        category = Category(name="Bench")
+        db.session.add(category)
+        db.session.flush()
+        product = Product(name="Product", price=10, category_id=category.id)
+        db.session.add(product)
+        db.session.flush()
+        db.session.add(Stock(product_id=product.id, quantity=1, category_id=category.id))
+        db.session.commit()
+
+
+def probe(lazy, database_url):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE % (lazy, DEFERRED)],
+        cwd=ROOT, env=dict(os.environ, DATABASE_URL=database_url),
+        capture_output=True, text=True, check=True,
+    )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample["imports"] = top_imports(result.stderr)
+    return sample
+
+
+def top_imports(stderr, limit=5):
+    """Slowest top-level imports as (module, cumulative ms)"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  ") or not name.strip():
+            continue
+        imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: -item[1])[:limit]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{tmp}/bench.db"
+        seed(database_url)
+        for lazy in (False, True):
+            samples = [probe(lazy, database_url) for _ in range(RUNS)]
+            startup = median([s["startup"] for s in samples])
+            first_request = median([s["first_request"] for s in samples])
+            print(f"{'lazy' if lazy else 'eager':<6} startup {startup:7.1f} ms   "
+                  f"first request {first_request:7.1f} ms   status {samples[-1]['status']}")
+            for name, ms in samples[-1]["imports"]:
+                print(f"         {ms:7.1f} ms  {name}")
+
+            if lazy:
+                if startup > STARTUP_BUDGET_MS:
+                    failures.append(f"startup {startup:.1f} ms > {STARTUP_BUDGET_MS} ms")
+                if first_request > FIRST_REQUEST_BUDGET_MS:
+                    failures.append(f"first request {first_request:.1f} ms > {FIRST_REQUEST_BUDGET_MS} ms")
+                if samples[-1]["loaded"]:
+                    failures.append(f"imported at startup: {', '.join(samples[-1]['loaded'])}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
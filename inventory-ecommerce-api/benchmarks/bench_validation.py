@@ -0,0 +1,67 @@
+"""Validation cost of a 100-item checkout payload.
+
+Run from the project root:
+
+    python benchmarks/bench_validation.py
+
+Compares marshmallow's Schema.load with the loader compiled from the same
+schema by app.utils.validation. No database or app is needed. Each loader
+is timed as the fastest of many short runs. Fails when the compiled loader
+is over VALIDATION_BUDGET_US per payload, or less than VALIDATION_MIN_SPEEDUP
+times faster than marshmallow.
+
+The compiled loader measures 140-260 us from one run to the next on a
+shared single-CPU host, so the budget leaves about twice that; the speedup
+(8-14x there) holds however fast the machine is.
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas.checkout_schema import CheckoutSchema
+from app.utils.validation import compile_schema
+
+ITEMS = 100
+RUNS = 50
+REPEATS = 40
+BUDGET_US = float(os.getenv("VALIDATION_BUDGET_US", 500))
+MIN_SPEEDUP = float(os.getenv("VALIDATION_MIN_SPEEDUP", 5))
+
+
+def build_payload():
+    random.seed(1)
+    return {
+        "cart_id": 42,
+        "customer": {"email": "buyer@example.com", "name": "Buyer"},
+        "items": [
+            {"product_id": product_id, "variant_id": random.choice((None, product_id * 10)),
+             "quantity": random.randint(1, 12)}
+            for product_id in random.sample(range(1, 10001), ITEMS)
+        ],
+        "fulfillment": {"strategy": "nearest", "split": True, "ship_to": {"lat": 52.52, "lon": 13.40}},
+    }
+
+
+def per_payload_us(load, payload):
+    seconds = min(timeit.repeat(lambda: load(payload), number=RUNS, repeat=REPEATS))
+    return seconds / RUNS * 1e6
+
+
+def main():
+    payload = build_payload()
+    schema_load = CheckoutSchema().load
+    compiled_load = compile_schema(CheckoutSchema)
+    assert compiled_load(payload) == schema_load(payload)
+
+    marshmallow_us = per_payload_us(schema_load, payload)
+    compiled_us = per_payload_us(compiled_load, payload)
+    print(f"{ITEMS} items: marshmallow {marshmallow_us:.1f} us, compiled {compiled_us:.1f} us "
+          f"({marshmallow_us / compiled_us:.1f}x, budget {BUDGET_US} us and {MIN_SPEEDUP}x)")
+    return 0 if compiled_us <= BUDGET_US and marshmallow_us / compiled_us >= MIN_SPEEDUP else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
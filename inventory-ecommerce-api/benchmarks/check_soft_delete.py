@@ -0,0 +1,165 @@
+"""Check that no read endpoint serves soft-deleted rows.
+
+Run from the project root:
+
+    python benchmarks/check_soft_delete.py
+
+Seeds a throwaway SQLite database with live rows and, for every soft
+deleted model, a trashed twin marked with MARKER in its name or quantity.
+Every list, detail and batch read is then requested: a trashed row must
+never show up, and details of trashed rows must be 404s. The admin trash
+listing must still show them, proving the twins exist. Fails on any leak.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MARKER = 9876
+TRASHED = f"Trashed {MARKER}"
+
+
+def seed():
+    from app import create_app
+    from app.core import models as m
+    from app.core.warehouses import adjust_location
+    from app.utils.db_utils import db
+
+    app = create_app(lazy=False)
+    ids = {}
+    with app.app_context():
+        db.create_all()
+        category = m.Category(name="Live category")
+        trashed_category = m.Category(name=TRASHED, is_trash=True)
+        db.session.add_all([category, trashed_category])
+        db.session.flush()
+
+        product = m.Product(name="Live product", price=10, category_id=category.id)
+        trashed_product = m.Product(name=TRASHED, price=MARKER, category_id=category.id, is_trash=True)
+        db.session.add_all([product, trashed_product])
+        db.session.flush()
+        stock = m.Stock(product_id=product.id, quantity=0, category_id=category.id)
+        db.session.add(stock)
+        adjust_location(stock, 5)
+        db.session.add(m.Stock(product_id=trashed_product.id, quantity=MARKER, category_id=category.id,
+                               is_trash=True))
+        variant = m.ProductVariant(product_id=product.id, sku="LIVE-1", quantity=0)
+        trashed_variant = m.ProductVariant(product_id=product.id, sku=f"TRASH-{MARKER}", quantity=MARKER,
+                                           is_trash=True)
+        db.session.add_all([variant, trashed_variant])
+        db.session.add(m.Warehouse(code=f"T{MARKER}", name=TRASHED, is_trash=True))
+
+        customer = m.Customer(name="Live customer", email="live@example.com")
+        trashed_customer = m.Customer(name=TRASHED, email=f"trashed{MARKER}@example.com", is_trash=True)
+        db.session.add_all([customer, trashed_customer])
+        db.session.flush()
+        cart = m.Cart(customer_id=customer.id)
+        db.session.add(cart)
+        db.session.flush()
+        db.session.add_all([
+            m.CartItem(cart_id=cart.id, product_id=product.id, quantity=1),
+            m.CartItem(cart_id=cart.id, product_id=product.id, quantity=MARKER, is_trash=True),
+        ])
+
+        sale = m.Transaction(cart_id=cart.id, customer_id=customer.id, total_amount=10, status="Completed")
+        trashed_sale = m.Transaction(cart_id=cart.id, customer_id=customer.id, total_amount=MARKER,
+                                     status=TRASHED, is_trash=True)
+        db.session.add_all([sale, trashed_sale])
+        db.session.flush()
+        item = m.TransactionItem(transaction_id=sale.id, product_id=product.id, quantity=1, price_per_unit=10)
+        db.session.add_all([
+            item,
+            m.TransactionItem(transaction_id=sale.id, product_id=product.id, quantity=MARKER,
+                              price_per_unit=MARKER, is_trash=True),
+        ])
+        db.session.flush()
+        db.session.add(m.ReturnProduct(transaction_item_id=item.id, product_id=product.id, quantity=MARKER,
+                                       reason=TRASHED, is_trash=True))
+        db.session.add_all([
+            m.StockMovement(product_id=product.id, quantity_change=5, type="restock"),
+            m.StockMovement(product_id=product.id, quantity_change=MARKER, type="restock", is_trash=True),
+        ])
+        db.session.add(m.Promotion(name=TRASHED, kind="percent_off", percent=10, is_trash=True))
+        db.session.flush()
+
+        ids.update(
+            category=category.id, trashed_category=trashed_category.id,
+            product=product.id, trashed_product=trashed_product.id, trashed_variant=trashed_variant.id,
+            customer=customer.id, trashed_customer=trashed_customer.id,
+            sale=sale.id, trashed_sale=trashed_sale.id,
+            trashed_return=db.session.execute(db.select(db.func.max(m.ReturnProduct.id))).scalar(),
+        )
+        db.session.commit()
+    return app, ids
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/check.db"
+        app, ids = seed()
+        client = app.test_client()
+        today = datetime.utcnow().date()
+        window = f"start={today - timedelta(days=1)}&end={today + timedelta(days=1)}"
+        both = lambda live, trashed: f"{ids[live]},{ids[trashed]}"
+
+        reads = [
+            ("GET", "/api/products/", None),
+            ("GET", f"/api/products/?ids={both('product', 'trashed_product')}", None),
+            ("GET", f"/api/products/?category_id={ids['category']}", None),
+            ("GET", f"/api/products/{ids['product']}/", None),
+            ("GET", f"/api/products/{ids['product']}/variants/", None),
+            ("GET", "/api/category/categories/", None),
+            ("GET", f"/api/category/categories/{ids['category']}/", None),
+            ("GET", "/api/customer/", None),
+            ("GET", f"/api/customers/{ids['customer']}/", None),
+            ("GET", f"/api/cart/{ids['customer']}/", None),
+            ("GET", "/api/promotions/", None),
+            ("GET", "/api/sales/", None),
+            ("GET", f"/api/sales/{ids['sale']}/", None),
+            ("GET", "/api/return_products/returns/", None),
+            ("GET", "/api/stock/stocks/", None),
+            ("GET", f"/api/stock/stocks/{ids['product']}/", None),
+            ("GET", f"/api/stock/stocks/{ids['product']}/locations/", None),
+            ("POST", "/api/stock/stocks/batch/", {"product_ids": both("product", "trashed_product")}),
+            ("GET", f"/api/stock/stocks/low/?threshold={MARKER * 10}", None),
+            ("GET", "/api/stock/warehouses/", None),
+            ("GET", "/api/stock/movements/", None),
+            ("GET", f"/api/stock/movements/net/?ids={ids['product']}&{window}", None),
+            ("GET", f"/api/stock/movements/daily/?{window}", None),
+        ]
+        trashed_details = [
+            f"/api/products/{ids['trashed_product']}/",
+            f"/api/variants/{ids['trashed_variant']}/",
+            f"/api/category/categories/{ids['trashed_category']}/",
+            f"/api/customers/{ids['trashed_customer']}/",
+            f"/api/sales/{ids['trashed_sale']}/",
+            f"/api/return_products/returns/{ids['trashed_return']}/",
+            f"/api/stock/stocks/{ids['trashed_product']}/",
+        ]
+
+        failures = []
+        for method, path, body in reads:
+            response = client.open(path, method=method, json=body)
+            text = response.get_data(as_text=True)
+            if response.status_code != 200:
+                failures.append(f"{method} {path}: {response.status_code} {text[:200]}")
+            elif str(MARKER) in text:
+                failures.append(f"{method} {path}: serves a trashed row")
+        for path in trashed_details:
+            response = client.get(path)
+            if response.status_code != 404:
+                failures.append(f"GET {path}: {response.status_code} for a trashed row, expected 404")
+        for table in ("products", "customers", "transactions", "stock_movements"):
+            if str(MARKER) not in client.get(f"/api/admin/trash/{table}/").get_data(as_text=True):
+                failures.append(f"GET /api/admin/trash/{table}/ doesn't list the trashed row")
+
+        print(f"{len(reads)} reads and {len(trashed_details)} trashed details checked")
+        for failure in failures:
+            print(f"FAIL {failure}")
+        return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
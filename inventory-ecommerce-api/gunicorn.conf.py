@@ -0,0 +1,34 @@
+"""Gunicorn settings, tuned through environment variables.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+# sync, gthread or gevent
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+# Build the app once in the master; workers inherit it copy-on-write
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+accesslog = os.getenv('GUNICORN_ACCESSLOG')
+errorlog = '-'
+
+if worker_class == 'gevent':
+    # Patch before the preloaded app creates its sockets and locks
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def post_fork(server, worker):
+    """Give each worker its own connection pool"""
+    if preload_app:
+        from app.utils.db_utils import dispose_engines
+        from wsgi import app
+        dispose_engines(app)
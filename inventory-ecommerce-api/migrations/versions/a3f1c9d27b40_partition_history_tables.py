@@ -0,0 +1,104 @@
+"""partition history tables by month
+
+Revision ID: a3f1c9d27b40
+Revises: 84b1f1166285
+Create Date: 2026-10-19 10:02:11.412803
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d27b40'
+down_revision = '84b1f1166285'
+branch_labels = None
+depends_on = None
+
+
+def _add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.create_index('ix_transaction_items_transaction_id', ['transaction_id'], unique=False)
+
+    op.execute("UPDATE stock_movements SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+
+    if op.get_bind().dialect.name != 'postgresql':
+        # Plain table, month buckets are timestamp ranges over the index
+        with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+            batch_op.create_index('ix_stock_movements_timestamp', ['timestamp'], unique=False)
+        return
+
+    # Rebuild stock_movements as a table range partitioned on timestamp. The
+    # primary key has to include the partition key.
+    op.execute("ALTER TABLE stock_movements RENAME TO stock_movements_legacy")
+    op.execute("""
+        CREATE TABLE stock_movements (
+            id INTEGER NOT NULL DEFAULT nextval('stock_movements_id_seq'),
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            quantity_change INTEGER NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            is_trash BOOLEAN,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("CREATE TABLE stock_movements_default PARTITION OF stock_movements DEFAULT")
+    op.execute("CREATE INDEX ix_stock_movements_timestamp ON stock_movements (timestamp)")
+
+    month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(-1, 4):
+        start = _add_months(month, offset)
+        end = _add_months(start, 1)
+        op.execute(
+            f"CREATE TABLE stock_movements_y{start.year}m{start.month:02d} PARTITION OF stock_movements "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+
+    op.execute("""
+        INSERT INTO stock_movements (id, product_id, quantity_change, type, timestamp, is_trash)
+        SELECT id, product_id, quantity_change, type, timestamp, is_trash FROM stock_movements_legacy
+    """)
+    op.execute("ALTER SEQUENCE stock_movements_id_seq OWNED BY stock_movements.id")
+    op.execute("DROP TABLE stock_movements_legacy")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE stock_movements RENAME TO stock_movements_partitioned")
+        op.execute("""
+            CREATE TABLE stock_movements (
+                id INTEGER NOT NULL DEFAULT nextval('stock_movements_id_seq') PRIMARY KEY,
+                product_id INTEGER NOT NULL REFERENCES products (id),
+                quantity_change INTEGER NOT NULL,
+                type VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP WITHOUT TIME ZONE,
+                is_trash BOOLEAN
+            )
+        """)
+        op.execute("""
+            INSERT INTO stock_movements (id, product_id, quantity_change, type, timestamp, is_trash)
+            SELECT id, product_id, quantity_change, type, timestamp, is_trash FROM stock_movements_partitioned
+        """)
+        op.execute("ALTER SEQUENCE stock_movements_id_seq OWNED BY stock_movements.id")
+        op.execute("DROP TABLE stock_movements_partitioned CASCADE")
+    else:
+        with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+            batch_op.drop_index('ix_stock_movements_timestamp')
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_transaction_items_transaction_id')
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_timestamp')
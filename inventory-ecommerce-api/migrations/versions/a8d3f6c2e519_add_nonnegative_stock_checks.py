@@ -0,0 +1,44 @@
+"""add nonnegative stock checks
+
+Revision ID: a8d3f6c2e519
+Revises: c5e9a3d7f284
+Create Date: 2026-10-19 21:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3f6c2e519'
+down_revision = 'c5e9a3d7f284'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs that may never go below zero
+CHECKS = (
+    ('stocks', 'quantity'),
+    ('stocks', 'reserved'),
+    ('stock_locations', 'quantity'),
+    ('product_variants', 'quantity'),
+    ('product_variants', 'reserved'),
+)
+
+
+def upgrade():
+    # Rows already negative would fail the checks; name them instead of guessing a fix
+    connection = op.get_bind()
+    for table, column in CHECKS:
+        count = connection.execute(sa.text(f'SELECT count(*) FROM {table} WHERE {column} < 0')).scalar()
+        if count:
+            raise RuntimeError(f'{count} {table} rows have a negative {column}; correct them before upgrading')
+
+    for table, column in CHECKS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_check_constraint(f'ck_{table}_{column}_nonnegative', sa.text(f'{column} >= 0'))
+
+
+def downgrade():
+    for table, column in reversed(CHECKS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'ck_{table}_{column}_nonnegative', type_='check')
@@ -0,0 +1,52 @@
+"""link returns to transaction items
+
+Revision ID: b3d7f1a9e260
+Revises: a6c9e2f7d415
+Create Date: 2026-10-19 17:48:05.361842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d7f1a9e260'
+down_revision = 'a6c9e2f7d415'
+branch_labels = None
+depends_on = None
+
+
+def live(batch_op, name, columns):
+    batch_op.create_index(name, columns, unique=False,
+                          postgresql_where=sa.text('is_trash = false'),
+                          sqlite_where=sa.text('is_trash = 0'))
+
+
+def upgrade():
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('returned_quantity', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('return_products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('transaction_item_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('warehouse_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_return_products_transaction_item_id', 'transaction_items', ['transaction_item_id'], ['id'])
+        batch_op.create_foreign_key('fk_return_products_warehouse_id', 'warehouses', ['warehouse_id'], ['id'])
+        batch_op.drop_index('ix_return_products_live_product')
+        live(batch_op, 'ix_return_products_live_product', ['product_id', 'timestamp'])
+        live(batch_op, 'ix_return_products_live_item', ['transaction_item_id'])
+        live(batch_op, 'ix_return_products_live_timestamp', ['timestamp'])
+
+
+def downgrade():
+    with op.batch_alter_table('return_products', schema=None) as batch_op:
+        batch_op.drop_index('ix_return_products_live_timestamp')
+        batch_op.drop_index('ix_return_products_live_item')
+        batch_op.drop_index('ix_return_products_live_product')
+        live(batch_op, 'ix_return_products_live_product', ['product_id'])
+        batch_op.drop_constraint('fk_return_products_warehouse_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_return_products_transaction_item_id', type_='foreignkey')
+        batch_op.drop_column('warehouse_id')
+        batch_op.drop_column('transaction_item_id')
+
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.drop_column('returned_quantity')
@@ -0,0 +1,62 @@
+"""soft delete partial indexes
+
+Revision ID: b7d20e4c1f63
+Revises: a3f1c9d27b40
+Create Date: 2026-10-19 11:20:47.193051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d20e4c1f63'
+down_revision = 'a3f1c9d27b40'
+branch_labels = None
+depends_on = None
+
+
+LIVE_INDEXES = {
+    'cart_items': [('ix_cart_items_live_cart_product', ['cart_id', 'product_id'])],
+    'carts': [('ix_carts_live_customer', ['customer_id'])],
+    'categories': [('ix_categories_live', ['id'])],
+    'products': [
+        ('ix_products_live', ['id']),
+        ('ix_products_live_category', ['category_id', 'id']),
+    ],
+    'stocks': [
+        ('ix_stocks_live_product', ['product_id']),
+        ('ix_stocks_live_quantity', ['quantity']),
+    ],
+    'transactions': [('ix_transactions_live_timestamp', ['timestamp'])],
+    'transaction_items': [('ix_transaction_items_live_transaction', ['transaction_id'])],
+    'return_products': [('ix_return_products_live_product', ['product_id'])],
+    'customers': [('ix_customers_live', ['id'])],
+    'stock_movements': [('ix_stock_movements_live_product', ['product_id'])],
+}
+
+
+def upgrade():
+    for table, indexes in LIVE_INDEXES.items():
+        # NULL would fall outside the "is_trash = false" filter
+        op.execute(f"UPDATE {table} SET is_trash = false WHERE is_trash IS NULL")
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('is_trash',
+                   existing_type=sa.Boolean(),
+                   nullable=False,
+                   server_default=sa.false())
+            for name, columns in indexes:
+                batch_op.create_index(name, columns, unique=False,
+                                      postgresql_where=sa.text('is_trash = false'),
+                                      sqlite_where=sa.text('is_trash = 0'))
+
+
+def downgrade():
+    for table, indexes in LIVE_INDEXES.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, columns in indexes:
+                batch_op.drop_index(name)
+            batch_op.alter_column('is_trash',
+                   existing_type=sa.Boolean(),
+                   nullable=True,
+                   server_default=None)
@@ -0,0 +1,37 @@
+"""add sales change timestamps
+
+Revision ID: b9e1c5d3f274
+Revises: d4b7e2a9c630
+Create Date: 2026-10-20 10:12:47.519384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e1c5d3f274'
+down_revision = 'd4b7e2a9c630'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left null on existing rows: the first analytics refresh after this rereads them all
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_transactions_updated_at', ['updated_at'], unique=False)
+
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_transaction_items_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_transaction_items_updated_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_updated_at')
+        batch_op.drop_column('updated_at')
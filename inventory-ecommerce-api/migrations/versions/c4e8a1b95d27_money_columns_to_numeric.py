@@ -0,0 +1,42 @@
+"""money columns to numeric
+
+Revision ID: c4e8a1b95d27
+Revises: b7d20e4c1f63
+Create Date: 2026-10-19 12:05:33.870214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1b95d27'
+down_revision = 'b7d20e4c1f63'
+branch_labels = None
+depends_on = None
+
+
+MONEY_COLUMNS = [
+    ('products', 'price'),
+    ('transactions', 'total_amount'),
+    ('transaction_items', 'price_per_unit'),
+]
+
+
+def upgrade():
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.Float(),
+                   type_=sa.Numeric(12, 2),
+                   existing_nullable=False,
+                   postgresql_using=f'ROUND({column}::numeric, 2)')
+
+
+def downgrade():
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.Numeric(12, 2),
+                   type_=sa.Float(),
+                   existing_nullable=False)
@@ -0,0 +1,69 @@
+"""add stock ledger indexes and daily rollup
+
+Revision ID: c5e9a3d7f284
+Revises: f2b8d4a6c913
+Create Date: 2026-10-19 22:04:37.196420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a3d7f284'
+down_revision = 'f2b8d4a6c913'
+branch_labels = None
+depends_on = None
+
+LIVE = dict(postgresql_where=sa.text('is_trash = false'), sqlite_where=sa.text('is_trash = 0'))
+
+
+def upgrade():
+    # (product_id, timestamp, id) covers the old product_id index
+    with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_movements_live_product')
+        batch_op.create_index('ix_stock_movements_live_product_timestamp', ['product_id', 'timestamp', 'id'],
+                              unique=False, **LIVE)
+        batch_op.create_index('ix_stock_movements_live_type_timestamp', ['type', 'timestamp', 'id'],
+                              unique=False, **LIVE)
+
+    op.create_table('stock_movement_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('type', sa.String(length=50), nullable=False),
+    sa.Column('movements', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('units_in', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('units_out', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('day', 'type')
+    )
+
+    # Roll up the whole existing ledger once; `flask ledger rollup` keeps the recent days current
+    movements = sa.table('stock_movements', sa.column('type'), sa.column('timestamp'),
+                         sa.column('quantity_change'), sa.column('is_trash'))
+    change = movements.c.quantity_change
+    day = sa.func.date(movements.c.timestamp)
+    op.execute(
+        sa.table('stock_movement_daily', sa.column('day'), sa.column('type'), sa.column('movements'),
+                 sa.column('units_in'), sa.column('units_out'))
+        .insert()
+        .from_select(
+            ['day', 'type', 'movements', 'units_in', 'units_out'],
+            sa.select(
+                day,
+                movements.c.type,
+                sa.func.count(),
+                sa.func.sum(sa.case((change > 0, change), else_=0)),
+                sa.func.sum(sa.case((change < 0, -change), else_=0)),
+            )
+            .where(sa.func.coalesce(movements.c.is_trash, sa.false()) == sa.false())
+            .group_by(day, movements.c.type)
+        )
+    )
+
+
+def downgrade():
+    op.drop_table('stock_movement_daily')
+
+    with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_movements_live_type_timestamp')
+        batch_op.drop_index('ix_stock_movements_live_product_timestamp')
+        batch_op.create_index('ix_stock_movements_live_product', ['product_id'], unique=False, **LIVE)
@@ -0,0 +1,65 @@
+"""add customer stats
+
+Revision ID: c8e4a2d6f150
+Revises: b3d7f1a9e260
+Create Date: 2026-10-19 18:32:14.520917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e4a2d6f150'
+down_revision = 'b3d7f1a9e260'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('customer_stats',
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('order_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('total_spend', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+    sa.Column('first_purchase_at', sa.DateTime(), nullable=True),
+    sa.Column('last_purchase_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('customer_id')
+    )
+    with op.batch_alter_table('customer_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_customer_stats_order_count', ['order_count', 'customer_id'], unique=False)
+        batch_op.create_index('ix_customer_stats_total_spend', ['total_spend', 'customer_id'], unique=False)
+        batch_op.create_index('ix_customer_stats_last_purchase', ['last_purchase_at', 'customer_id'], unique=False)
+
+    op.create_table('customer_category_stats',
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('spend', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('customer_id', 'category_id')
+    )
+    with op.batch_alter_table('customer_category_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_customer_category_stats_spend', ['customer_id', 'spend'], unique=False)
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_live_customer', ['customer_id'], unique=False,
+                              postgresql_where=sa.text('is_trash = false'),
+                              sqlite_where=sa.text('is_trash = 0'))
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_live_customer')
+
+    with op.batch_alter_table('customer_category_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_customer_category_stats_spend')
+
+    op.drop_table('customer_category_stats')
+    with op.batch_alter_table('customer_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_customer_stats_last_purchase')
+        batch_op.drop_index('ix_customer_stats_total_spend')
+        batch_op.drop_index('ix_customer_stats_order_count')
+
+    op.drop_table('customer_stats')
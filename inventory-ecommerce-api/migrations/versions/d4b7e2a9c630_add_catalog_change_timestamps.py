@@ -0,0 +1,35 @@
+"""add catalog change timestamps
+
+Revision ID: d4b7e2a9c630
+Revises: a8d3f6c2e519
+Create Date: 2026-10-19 23:41:08.302115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b7e2a9c630'
+down_revision = 'a8d3f6c2e519'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_products_updated_at', ['updated_at'], unique=False)
+    op.execute(sa.table('products', sa.column('updated_at')).update().values(updated_at=sa.func.current_timestamp()))
+
+    with op.batch_alter_table('stocks', schema=None) as batch_op:
+        batch_op.create_index('ix_stocks_last_updated', ['last_updated'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stocks', schema=None) as batch_op:
+        batch_op.drop_index('ix_stocks_last_updated')
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_updated_at')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,52 @@
+"""add category tree
+
+Revision ID: d4f9b1c7e382
+Revises: c8e4a2d6f150
+Create Date: 2026-10-19 19:05:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f9b1c7e382'
+down_revision = 'c8e4a2d6f150'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('path', sa.String(length=255).with_variant(postgresql.VARCHAR(255, collation='C'), 'postgresql'), nullable=True))
+        batch_op.add_column(sa.Column('subtree_products', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('subtree_stock', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_foreign_key('fk_categories_parent_id', 'categories', ['parent_id'], ['id'])
+        batch_op.create_index('ix_categories_path', ['path'], unique=False)
+        batch_op.create_index('ix_categories_parent', ['parent_id'], unique=False)
+
+    # Existing categories are all roots
+    op.execute("UPDATE categories SET path = CAST(id AS VARCHAR(20)) || '/'")
+    op.execute(
+        "UPDATE categories SET subtree_products = ("
+        "SELECT count(*) FROM products"
+        " WHERE products.category_id = categories.id AND products.is_trash = false)"
+    )
+    op.execute(
+        "UPDATE categories SET subtree_stock = ("
+        "SELECT coalesce(sum(stocks.quantity), 0) FROM stocks"
+        " WHERE stocks.category_id = categories.id AND stocks.is_trash = false)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index('ix_categories_parent')
+        batch_op.drop_index('ix_categories_path')
+        batch_op.drop_constraint('fk_categories_parent_id', type_='foreignkey')
+        batch_op.drop_column('subtree_stock')
+        batch_op.drop_column('subtree_products')
+        batch_op.drop_column('path')
+        batch_op.drop_column('parent_id')
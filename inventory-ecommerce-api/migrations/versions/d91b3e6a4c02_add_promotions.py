@@ -0,0 +1,64 @@
+"""add promotions
+
+Revision ID: d91b3e6a4c02
+Revises: c4e8a1b95d27
+Create Date: 2026-10-19 12:48:09.551620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91b3e6a4c02'
+down_revision = 'c4e8a1b95d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('promotions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('percent', sa.Numeric(5, 2), nullable=True),
+    sa.Column('buy_quantity', sa.Integer(), nullable=True),
+    sa.Column('get_quantity', sa.Integer(), nullable=True),
+    sa.Column('min_quantity', sa.Integer(), nullable=True),
+    sa.Column('unit_price', sa.Numeric(12, 2), nullable=True),
+    sa.Column('starts_at', sa.DateTime(), nullable=True),
+    sa.Column('ends_at', sa.DateTime(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('is_trash', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('promotions', schema=None) as batch_op:
+        batch_op.create_index('ix_promotions_live_product', ['product_id'], unique=False,
+                              postgresql_where=sa.text('is_trash = false'),
+                              sqlite_where=sa.text('is_trash = 0'))
+        batch_op.create_index('ix_promotions_live_category', ['category_id'], unique=False,
+                              postgresql_where=sa.text('is_trash = false'),
+                              sqlite_where=sa.text('is_trash = 0'))
+
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('discount', sa.Numeric(12, 2), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('promotion_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('transaction_items_promotion_id_fkey', 'promotions', ['promotion_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('transaction_items', schema=None) as batch_op:
+        batch_op.drop_constraint('transaction_items_promotion_id_fkey', type_='foreignkey')
+        batch_op.drop_column('promotion_id')
+        batch_op.drop_column('discount')
+
+    with op.batch_alter_table('promotions', schema=None) as batch_op:
+        batch_op.drop_index('ix_promotions_live_category')
+        batch_op.drop_index('ix_promotions_live_product')
+
+    op.drop_table('promotions')
@@ -0,0 +1,71 @@
+"""add product variants
+
+Revision ID: e1a5c8f3b627
+Revises: d4f9b1c7e382
+Create Date: 2026-10-19 19:47:26.073351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a5c8f3b627'
+down_revision = 'd4f9b1c7e382'
+branch_labels = None
+depends_on = None
+
+# Tables whose rows may now name the SKU they are for
+VARIANT_TABLES = ('cart_items', 'transaction_items', 'stock_reservations', 'stock_movements')
+
+
+def upgrade():
+    op.create_table('product_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('sku', sa.String(length=64), nullable=False),
+    sa.Column('attributes', sa.JSON(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('quantity', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('reserved', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('is_trash', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sku')
+    )
+    with op.batch_alter_table('product_variants', schema=None) as batch_op:
+        batch_op.create_index('ix_product_variants_live_product', ['product_id'], unique=False,
+                              postgresql_where=sa.text('is_trash = false'),
+                              sqlite_where=sa.text('is_trash = 0'))
+
+    for table in VARIANT_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('variant_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f'fk_{table}_variant_id', 'product_variants', ['variant_id'], ['id'])
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('variant_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('variants_in_stock', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('price_min', sa.Numeric(precision=12, scale=2), nullable=True))
+        batch_op.add_column(sa.Column('price_max', sa.Numeric(precision=12, scale=2), nullable=True))
+
+    # No product has variants yet, so each price range is the product price
+    op.execute("UPDATE products SET price_min = price, price_max = price")
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('price_max')
+        batch_op.drop_column('price_min')
+        batch_op.drop_column('variants_in_stock')
+        batch_op.drop_column('variant_count')
+
+    for table in reversed(VARIANT_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{table}_variant_id', type_='foreignkey')
+            batch_op.drop_column('variant_id')
+
+    with op.batch_alter_table('product_variants', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_variants_live_product')
+
+    op.drop_table('product_variants')
@@ -0,0 +1,68 @@
+"""add warehouses and stock locations
+
+Revision ID: e5a7c3f0b918
+Revises: d91b3e6a4c02
+Create Date: 2026-10-19 13:40:26.004117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c3f0b918'
+down_revision = 'd91b3e6a4c02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('warehouses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(length=20), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=True),
+    sa.Column('longitude', sa.Float(), nullable=True),
+    sa.Column('shipping_cost', sa.Numeric(12, 2), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('is_trash', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('code')
+    )
+    op.create_table('stock_locations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('stock_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('last_updated', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['stock_id'], ['stocks.id'], ),
+    sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'warehouse_id', name='uq_stock_locations_product_warehouse')
+    )
+    with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('warehouse_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('stock_movements_warehouse_id_fkey', 'warehouses', ['warehouse_id'], ['id'])
+
+    # Existing stock all sits in the default warehouse
+    op.execute("""
+        INSERT INTO warehouses (code, name, shipping_cost, priority, is_trash)
+        VALUES ('MAIN', 'Main warehouse', 0, 0, false)
+    """)
+    op.execute("""
+        INSERT INTO stock_locations (stock_id, product_id, warehouse_id, quantity, last_updated)
+        SELECT stocks.id, stocks.product_id, warehouses.id, stocks.quantity, stocks.last_updated
+        FROM stocks CROSS JOIN warehouses
+        WHERE warehouses.code = 'MAIN'
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+        batch_op.drop_constraint('stock_movements_warehouse_id_fkey', type_='foreignkey')
+        batch_op.drop_column('warehouse_id')
+
+    op.drop_table('stock_locations')
+    op.drop_table('warehouses')
@@ -0,0 +1,46 @@
+"""add stock reservations
+
+Revision ID: f2b8d4a6c1e3
+Revises: e5a7c3f0b918
+Create Date: 2026-10-19 15:02:11.482907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d4a6c1e3'
+down_revision = 'e5a7c3f0b918'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cart_item_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['cart_item_id'], ['cart_items.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('cart_item_id')
+    )
+    with op.batch_alter_table('stock_reservations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_reservations_expires_at'), ['expires_at'], unique=False)
+
+    with op.batch_alter_table('stocks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reserved', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('stocks', schema=None) as batch_op:
+        batch_op.drop_column('reserved')
+
+    with op.batch_alter_table('stock_reservations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stock_reservations_expires_at'))
+
+    op.drop_table('stock_reservations')
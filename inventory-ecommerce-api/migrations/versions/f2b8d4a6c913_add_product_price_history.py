@@ -0,0 +1,44 @@
+"""add product price history
+
+Revision ID: f2b8d4a6c913
+Revises: e1a5c8f3b627
+Create Date: 2026-10-19 21:12:48.530917
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d4a6c913'
+down_revision = 'e1a5c8f3b627'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_prices',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('effective_from', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('product_prices', schema=None) as batch_op:
+        batch_op.create_index('ix_product_prices_product_effective', ['product_id', 'effective_from', 'id'], unique=False)
+
+    # History starts with today's prices; earlier lookups find none
+    op.execute(
+        sa.text("INSERT INTO product_prices (product_id, price, effective_from) "
+                "SELECT id, price, :now FROM products").bindparams(now=datetime.utcnow())
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('product_prices', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_prices_product_effective')
+
+    op.drop_table('product_prices')
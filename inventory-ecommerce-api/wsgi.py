@@ -0,0 +1,30 @@
+"""Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    uwsgi --ini uwsgi.ini
+"""
+import gc
+
+from sqlalchemy.orm import configure_mappers
+
+from app import create_app
+from app.utils.db_utils import dispose_engines
+
+# Runs once in the master when preloading; create_app imports every model,
+# schema and blueprint so workers inherit them already loaded
+app = create_app(lazy=False)
+
+# Build mapper state and freeze everything allocated so far, so forked workers
+# share these pages instead of copying them when the GC walks the heap
+configure_mappers()
+gc.collect()
+gc.freeze()
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    pass
+else:
+    @postfork
+    def reset_pool():
+        dispose_engines(app)